@@ -5,6 +5,7 @@ Consulta políticas internas usando búsqueda vectorial (RAG)
 from app.models.schemas import Transaction, CustomerBehavior
 from app.services.llm_service import get_llm
 from app.services.rag_service import get_rag_service
+from app.services.policy_rule_engine import extract_features, load_policy_rule
 #from langchain.prompts import ChatPromptTemplate
 from langchain_core.prompts import ChatPromptTemplate
 from typing import Dict, List
@@ -29,7 +30,7 @@ class PolicyRAGAgent:
         customer_behavior: CustomerBehavior
     ) -> bool:
         """
-        Validar si una política realmente aplica según sus reglas específicas
+        Validar si una política realmente aplica según su condición declarativa
         
         Args:
             policy: Política a validar
@@ -37,56 +38,83 @@ class PolicyRAGAgent:
             customer_behavior: Comportamiento del cliente
         
         Returns:
-            True si la política aplica, False si no
+            True si la política aplica, False si no, None si la condición
+            falló al evaluarse (decide el LLM)
         """
-        if not customer_behavior:
+        features = extract_features(transaction, customer_behavior)
+        if features is None:
             return False
         
         policy_id = policy.get("policy_id")
+        rule = load_policy_rule(policy)
         
-        # FP-01: Monto > 3x promedio habitual Y horario fuera de rango → CHALLENGE
-        if policy_id == "FP-01":
-            amount_ratio = transaction.amount / customer_behavior.usual_amount_avg
-            usual_hours = customer_behavior.usual_hours.split("-")
-            start_hour = int(usual_hours[0])
-            end_hour = int(usual_hours[1])
-            current_hour = transaction.timestamp.hour
-            
-            is_high_amount = amount_ratio > 3.0
-            is_unusual_time = not (start_hour <= current_hour <= end_hour)
-            
-            # Requiere AMBAS condiciones
-            applies = is_high_amount and is_unusual_time
-            
-            if applies:
-                print(f"   ✅ FP-01 validada: Monto {amount_ratio:.1f}x + horario {current_hour}h (fuera de {start_hour}-{end_hour})")
-            else:
-                print(f"   ❌ FP-01 rechazada: Monto {amount_ratio:.1f}x, horario {current_hour}h ({'OK' if not is_unusual_time else 'atípico'})")
-            
-            return applies
+        # Por defecto, aceptar políticas sin condición declarada (o inválida: decide el LLM)
+        if rule is None:
+            return True
         
-        # FP-02: Transacción internacional Y dispositivo nuevo → ESCALATE_TO_HUMAN
-        elif policy_id == "FP-02":
-            is_international = transaction.country not in customer_behavior.usual_countries
-            is_new_device = transaction.device_id not in customer_behavior.usual_devices
-            
-            # Requiere AMBAS condiciones
-            applies = is_international and is_new_device
-            
-            if applies:
-                print(f"   ✅ FP-02 validada: País {transaction.country} (internacional) + dispositivo {transaction.device_id} (nuevo)")
-            else:
-                if not is_international:
-                    print(f"   ❌ FP-02 rechazada: País {transaction.country} NO es internacional (habitual: {customer_behavior.usual_countries})")
-                elif not is_new_device:
-                    print(f"   ❌ FP-02 rechazada: Dispositivo {transaction.device_id} es conocido")
-                else:
-                    print(f"   ❌ FP-02 rechazada: No cumple ambas condiciones")
+        try:
+            applies = rule.evaluate(features)
+        except Exception as e:
+            print(f"   ⚠️ Error evaluando {policy_id} ({rule.condition}): {e} (se evalúa con LLM)")
+            return None
+        
+        if applies:
+            print(f"   ✅ {policy_id} validada: {rule.condition}")
+        else:
+            print(f"   ❌ {policy_id} rechazada: {rule.condition} "
+                  f"(ratio {features['amount_ratio']:.1f}x, hora {features['hour']}h, "
+                  f"país {features['country']}, dispositivo {transaction.device_id})")
+        
+        return applies
+    
+    def _evaluate_rules(
+        self,
+        policies: List[Dict],
+        transaction: Transaction,
+        customer_behavior: CustomerBehavior
+    ) -> Dict:
+        """
+        Determinar aplicabilidad sin LLM (todas las políticas tienen condición compilada)
+        
+        Returns:
+            Dict con el mismo formato que _parse_response, o None si alguna
+            condición falló al evaluarse (se usa el LLM)
+        """
+        applicable_policies = []
+        recommendations = []
+        
+        for policy in policies:
+            applies = self._validate_policy_application(policy, transaction, customer_behavior)
+            if applies is None:
+                return None
+            if not applies:
+                continue
             
-            return applies
+            action = policy.get("action") or "revisión"
+            applicable_policies.append({
+                "policy_id": policy["policy_id"],
+                "rule": policy["rule"],
+                "version": policy["version"],
+                "chunk_id": policy.get("chunk_id"),
+                "explanation": f"{policy['policy_id']}: se cumple '{policy['condition']}'"
+            })
+            recommendations.append(
+                f"Aplicar {action} según política {policy['policy_id']} (v{policy['version']})"
+            )
+        
+        if applicable_policies:
+            summary = (
+                f"Aplican {len(applicable_policies)} de {len(policies)} políticas evaluadas: "
+                f"{', '.join(p['policy_id'] for p in applicable_policies)}."
+            )
+        else:
+            summary = f"Ninguna de las {len(policies)} políticas evaluadas aplica a esta transacción."
         
-        # Por defecto, aceptar políticas no conocidas
-        return True
+        return {
+            "applicable_policies": applicable_policies,
+            "recommendations": recommendations,
+            "summary": summary
+        }
 
     def analyze(
         self,
@@ -120,11 +148,14 @@ class PolicyRAGAgent:
         
         print(f"   🔍 Query RAG: '{search_query}'")
         
-        # Buscar políticas relevantes
+        # Buscar políticas relevantes (solo las vigentes para canal, país y fecha)
         print("   📡 Buscando en base vectorial...")
         relevant_policies = self.rag_service.search_policies(
             query=search_query,
-            n_results=3
+            n_results=3,
+            channel=getattr(transaction.channel, "value", transaction.channel),
+            country=transaction.country,
+            as_of=transaction.timestamp
         )
         
         print(f"   ✅ {len(relevant_policies)} políticas encontradas")
@@ -138,6 +169,26 @@ class PolicyRAGAgent:
                 "summary": "No se encontraron políticas relevantes en la base de conocimiento"
             }
         
+        # ============================================
+        # REGLAS DECLARATIVAS: sin LLM si todas las políticas tienen condición válida
+        # ============================================
+        analysis = None
+        if all(load_policy_rule(policy) for policy in relevant_policies):
+            print("   ⚙️  Evaluando condiciones compiladas (sin LLM)...")
+            analysis = self._evaluate_rules(relevant_policies, transaction, customer_behavior)
+        
+        if analysis is not None:
+            print(f"   ✅ Políticas aplicables: {len(analysis['applicable_policies'])}/{len(relevant_policies)}")
+            
+            return {
+                "agent": self.name,
+                "policies_found": relevant_policies,
+                "applicable_policies": analysis["applicable_policies"],
+                "recommendations": analysis["recommendations"],
+                "summary": analysis["summary"],
+                "raw_response": None
+            }
+        
         # Analizar aplicabilidad con LLM
         context = self._build_context(
             transaction,
@@ -168,14 +219,15 @@ class PolicyRAGAgent:
                 customer_behavior
             )
             
-            if is_valid:
+            # None: la condición no se pudo evaluar, se mantiene el criterio del LLM
+            if is_valid is not False:
                 validated_policies.append(policy)
         
+        print(f"   ✅ Políticas validadas: {len(validated_policies)}/{len(analysis['applicable_policies'])}")
+        
         # Actualizar con solo las políticas validadas
         analysis["applicable_policies"] = validated_policies
         
-        print(f"   ✅ Políticas validadas: {len(validated_policies)}/{len(analysis['applicable_policies'])}")
-        
         return {
             "agent": self.name,
             "policies_found": relevant_policies,
@@ -350,6 +402,8 @@ RESUMEN:
                                 "policy_id": policy["policy_id"],
                                 "rule": policy["rule"],
                                 "version": policy["version"],
+                                "condition": policy.get("condition"),
+                                "chunk_id": policy.get("chunk_id"),
                                 "explanation": policy_line
                             })
                             break
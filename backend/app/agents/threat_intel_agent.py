@@ -3,6 +3,7 @@ Threat Intel Agent (Simulado)
 Simula búsqueda de amenazas externas
 """
 from app.models.schemas import Transaction
+from app.services.threat_feed_service import get_threat_feed
 from typing import Dict, List
 
 
@@ -13,19 +14,8 @@ class ThreatIntelAgent:
     
     def __init__(self):
         self.name = "Threat Intel Agent"
-        # Base de datos simulada de amenazas
-        self.threat_database = {
-            "M-002": {
-                "alerts": ["Reportes recientes de fraude en este comercio", "Incremento de transacciones sospechosas"],
-                "risk_level": "HIGH",
-                "url": "https://fraud-alerts.bcp.com.pe/M-002"
-            },
-            "M-999": {
-                "alerts": ["Comercio no verificado", "Sin historial de transacciones"],
-                "risk_level": "MEDIUM",
-                "url": "https://fraud-alerts.bcp.com.pe/M-999"
-            }
-        }
+        # Feed de amenazas compartido (cargado una vez al iniciar)
+        self.threat_feed = get_threat_feed()
     
     def analyze(
         self,
@@ -49,9 +39,9 @@ class ThreatIntelAgent:
         # Simular búsqueda en base de amenazas
         merchant_id = transaction.merchant_id
         
-        if merchant_id in self.threat_database:
-            threat_info = self.threat_database[merchant_id]
-            
+        threat_info = self.threat_feed.lookup(merchant_id)
+        
+        if threat_info:
             print(f"   ⚠️  Amenazas encontradas: {len(threat_info['alerts'])}")
             
             return {
@@ -1,12 +1,17 @@
 """
 History Routes - Historial de transacciones
 """
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.database.connection import get_db
-from app.services.persistence_service import PersistenceService
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.connection import get_async_db, get_async_read_db
+from app.services.persistence_service import (
+    PersistenceService, HISTORY_DEFAULT_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
+)
+from app.services.search_service import SearchService, SEARCH_DEFAULT_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE
 from app.security import verify_api_key_and_jwt
 from fastapi import HTTPException
+from datetime import datetime
 
 router = APIRouter()
 
@@ -19,47 +24,231 @@ router = APIRouter()
 async def get_transaction_history(
     customer_id: str = None,
     decision: str = None,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = Query(HISTORY_DEFAULT_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: str = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    projection: str = "full",
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
-    Obtiene el historial de transacciones analizadas
+    Obtiene el historial de transacciones analizadas (más recientes primero)
     
     Query params:
     - customer_id: Filtrar por cliente (opcional)
     - decision: Filtrar por tipo de decisión: APPROVE, CHALLENGE, BLOCK, ESCALATE_TO_HUMAN (opcional)
-    - limit: Número máximo de resultados (default: 100)
+    - limit: Tamaño de página (default: 100, máximo 500)
+    - cursor: next_cursor de la página anterior (opcional)
+    - date_from / date_to: Rango de fecha de decisión en UTC (opcional)
+    - projection: full (con datos maestros) o ids (solo IDs, sin JOIN)
     """
-    history = PersistenceService.get_transaction_history(
-        db=db,
-        customer_id=customer_id,
-        decision=decision,
-        limit=limit
-    )
+    try:
+        history, next_cursor = await PersistenceService.get_transaction_history_async(
+            db,
+            customer_id=customer_id,
+            decision=decision,
+            limit=limit,
+            cursor=cursor,
+            date_from=date_from,
+            date_to=date_to,
+            projection=projection
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "total": len(history),
         "filters": {
             "customer_id": customer_id,
             "decision": decision,
-            "limit": limit
+            "limit": limit,
+            "date_from": date_from,
+            "date_to": date_to,
+            "projection": projection
         },
+        "next_cursor": next_cursor,
         "transactions": history
     }
 
 
+@router.get(
+    "/search",
+    summary="Buscar decisiones y casos HITL por texto",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+async def search(
+    q: str,
+    kind: str = None,
+    customer_id: str = None,
+    merchant_id: str = None,
+    decision: str = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    limit: int = Query(SEARCH_DEFAULT_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Búsqueda full-text sobre señales y explicaciones de decisiones, y notas de
+    revisión de casos HITL (más relevantes primero)
+    
+    Query params:
+    - q: Texto a buscar; todos los términos deben aparecer ("frase exacta" entre comillas)
+    - kind: decision o hitl_case (opcional)
+    - customer_id / merchant_id: Filtrar por cliente o comercio (opcional)
+    - decision: Decisión del sistema o del revisor (opcional)
+    - date_from / date_to: Rango de fecha en UTC (opcional)
+    - limit: Tamaño de página (default: 50, máximo 200)
+    - offset: next_offset de la página anterior (opcional)
+    """
+    try:
+        page = await SearchService.search_async(
+            db,
+            q=q,
+            kind=kind,
+            customer_id=customer_id,
+            merchant_id=merchant_id,
+            decision=decision,
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit,
+            offset=offset
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "query": q,
+        "total": len(page["results"]),
+        "filters": {
+            "kind": kind,
+            "customer_id": customer_id,
+            "merchant_id": merchant_id,
+            "decision": decision,
+            "date_from": date_from,
+            "date_to": date_to,
+            "limit": limit,
+            "offset": offset
+        },
+        "next_offset": page["next_offset"],
+        "results": page["results"]
+    }
+
+
+@router.get(
+    "/export",
+    summary="Exportar decisiones (NDJSON, CSV o Parquet)",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+def export_decisions(
+    format: str = "ndjson",
+    gzip: bool = False,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    decision: str = None,
+    customer_id: str = None
+):
+    """
+    Exporta las decisiones en streaming (memoria constante sin importar el tamaño)
+    
+    Query params:
+    - format: ndjson, csv o parquet (parquet requiere pyarrow)
+    - gzip: Comprimir la respuesta (ndjson y csv)
+    - date_from / date_to: Rango de fecha de decisión en UTC (opcional)
+    - decision: Filtrar por tipo de decisión (opcional)
+    - customer_id: Filtrar por cliente (opcional)
+    """
+    from fastapi.responses import StreamingResponse
+    from app.services.export_service import ExportService, EXPORT_FORMATS
+    
+    try:
+        stream = ExportService.stream_decisions(
+            format=format,
+            gzip=gzip,
+            date_from=date_from,
+            date_to=date_to,
+            decision=decision,
+            customer_id=customer_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = ExportService.filename(format, gzip, date_from)
+    return StreamingResponse(
+        stream,
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format][0],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @router.get(
     "/statistics",
     summary="Obtener estadísticas generales",
     dependencies=[Depends(verify_api_key_and_jwt)]
 )
-async def get_statistics(db: Session = Depends(get_db)):
+async def get_statistics(db: AsyncSession = Depends(get_async_read_db)):
     """
     Obtiene estadísticas generales del sistema
     """
-    stats = PersistenceService.get_statistics(db=db)
+    stats = await PersistenceService.get_statistics_async(db)
     return stats
 
+
+@router.get(
+    "/timeseries",
+    summary="Serie de tiempo de decisiones",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+async def get_timeseries(
+    granularity: str = "hour",
+    window: str = "24h",
+    date_from: datetime = None,
+    date_to: datetime = None,
+    decision: str = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Obtiene conteos por decisión, histograma de riesgo y tiempos de
+    procesamiento por intervalo (desde tablas de rollup precalculadas)
+    
+    Query params:
+    - granularity: minute, hour o day (default: hour)
+    - window: Ventana hacia atrás, ej. 90m, 24h, 7d (default: 24h)
+    - date_from / date_to: Rango explícito en UTC (date_from reemplaza a window)
+    - decision: Filtrar por tipo de decisión (opcional)
+    """
+    from app.services.rollup_service import RollupService
+    
+    try:
+        return await RollupService.get_timeseries_async(
+            db,
+            granularity=granularity,
+            window=window,
+            date_from=date_from,
+            date_to=date_to,
+            decision=decision
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post(
+    "/statistics/reconcile",
+    summary="Reconciliar contadores de estadísticas",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+async def reconcile_statistics(db: AsyncSession = Depends(get_async_db)):
+    """
+    Recalcula los contadores desde las tablas y corrige diferencias
+    
+    Returns:
+        Contadores corregidos con su valor anterior y el real
+    """
+    from app.services.statistics_service import StatisticsService
+    
+    drift = await StatisticsService.reconcile_async(db)
+    return {"corrected": len(drift), "drift": drift}
+
 @router.get(
     "/transactions/{transaction_id}",
     summary="Obtener detalles completos de una transacción",
@@ -67,7 +256,8 @@ async def get_statistics(db: Session = Depends(get_db)):
 )
 async def get_transaction_details(
     transaction_id: str,
-    db: Session = Depends(get_db)
+    include_logs: bool = True,
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Obtiene todos los detalles de una transacción incluyendo logs de análisis
@@ -75,10 +265,13 @@ async def get_transaction_details(
     Path params:
     - transaction_id: ID de la transacción
     
+    Query params:
+    - include_logs: Incluir los logs de análisis (default: true)
+    
     Returns:
         Información completa de la transacción con logs
     """
-    details = PersistenceService.get_transaction_details(db, transaction_id)
+    details = await PersistenceService.get_transaction_details_async(db, transaction_id, include_logs=include_logs)
     
     if not details:
         raise HTTPException(
@@ -86,4 +279,51 @@ async def get_transaction_details(
             detail=f"Transacción {transaction_id} no encontrada"
         )
     
-    return details
\ No newline at end of file
+    return details
+
+
+@router.get(
+    "/transactions/{transaction_id}/logs",
+    summary="Obtener logs de análisis de una transacción",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+async def get_transaction_logs(
+    transaction_id: str,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Obtiene solo los logs de análisis de la última decisión de una transacción
+    
+    Path params:
+    - transaction_id: ID de la transacción
+    """
+    from app.database.models import FraudDecisionDB
+    
+    decision = (await db.execute(
+        select(FraudDecisionDB.id).where(
+            FraudDecisionDB.transaction_id == transaction_id
+        ).order_by(FraudDecisionDB.id.desc()).limit(1)
+    )).first()
+    
+    if not decision:
+        # Decisiones fuera de la ventana activa: logs desde el archivo
+        from app.services.retention_service import RetentionService
+        
+        archived = await db.run_sync(RetentionService.get_archived_logs, transaction_id)
+        if archived is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Transacción {transaction_id} no encontrada"
+            )
+        return {
+            "transaction_id": transaction_id,
+            "decision_id": archived[0],
+            "analysis_logs": archived[1],
+            "archived": True
+        }
+    
+    return {
+        "transaction_id": transaction_id,
+        "decision_id": decision.id,
+        "analysis_logs": await PersistenceService.get_analysis_logs_async(db, decision.id)
+    }
@@ -7,13 +7,17 @@ from app.models.schemas import (
     HITLCase,
     HITLCaseResponse,
     HITLReviewRequest,
+    HITLBulkReviewRequest,
     HITLStatus, 
     DecisionType,
     HITLReviewResponse
 )
-from app.services.hitl_service import get_hitl_service
-from typing import List
-from fastapi import Depends
+from app.services.hitl_service import get_hitl_service, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from typing import List, Optional
+from fastapi import Depends, Query, Request, Response
+import hashlib
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.connection import get_async_db, get_async_read_db
 from app.security import verify_api_key_and_jwt, get_current_user
 
 
@@ -21,27 +25,80 @@ router = APIRouter()
 hitl_service = get_hitl_service()
 
 
+def _queue_etag(version: int, *params) -> str:
+    """ETag débil de un listado: versión de la cola + parámetros de la consulta"""
+    digest = hashlib.sha1("|".join(str(p) for p in params).encode("utf-8")).hexdigest()[:12]
+    return f'W/"hitl-{version}-{digest}"'
+
+
+async def _list_cases_response(
+    db: AsyncSession,
+    request: Request,
+    response: Response,
+    status: Optional[HITLStatus],
+    limit: int,
+    cursor: Optional[str],
+    sort: str
+):
+    """
+    Página de casos resumidos con X-Next-Cursor y ETag
+    
+    Si If-None-Match coincide con la versión actual de la cola responde 304
+    sin leer casos.
+    """
+    hitl_service = get_hitl_service()
+    
+    etag = _queue_etag(
+        await hitl_service.get_queue_version_async(db),
+        status.value if status else "", limit, cursor or "", sort
+    )
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    
+    cases, next_cursor = await hitl_service.list_cases_async(
+        db,
+        status=status, limit=limit, cursor=cursor, sort=sort, include_details=False
+    )
+    
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    # Enriquecer cada caso con información de maestros
+    return [_enrich_case_summary(case) for case in cases]
+
+
 @router.get(
     "/pending",
     summary="Obtener casos pendientes de revisión",
     dependencies=[Depends(verify_api_key_and_jwt)]
 )
-async def get_pending_cases():
+async def get_pending_cases(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: str = "oldest",
+    db: AsyncSession = Depends(get_async_read_db)
+):
     """
-    Obtener todos los casos HITL pendientes de revisión con información completa
+    Obtener casos HITL pendientes de revisión (paginados)
+    
+    Query params:
+    - limit: Tamaño de página (default: 100, máximo: 500)
+    - cursor: Valor de X-Next-Cursor de la respuesta anterior
+    - sort: oldest (default), newest o priority (más urgentes primero)
+    
+    Headers de respuesta:
+    - X-Next-Cursor: Cursor de la siguiente página (ausente en la última)
+    - ETag: Enviar en If-None-Match para recibir 304 si la cola no cambió
     """
     try:
-        hitl_service = get_hitl_service()
-        cases = hitl_service.get_pending_cases()
-        
-        # Enriquecer cada caso con información de maestros
-        enriched_cases = []
-        for case in cases:
-            case_data = _enrich_case_summary(case)
-            enriched_cases.append(case_data)
-        
-        return enriched_cases
+        return await _list_cases_response(db, request, response, HITLStatus.PENDING, limit, cursor, sort)
     
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener casos pendientes: {str(e)}")
 
@@ -51,27 +108,118 @@ async def get_pending_cases():
     summary="Obtener todos los casos HITL",
     dependencies=[Depends(verify_api_key_and_jwt)]
 )
-async def get_all_cases(status: HITLStatus = None):
+async def get_all_cases(
+    request: Request,
+    response: Response,
+    status: HITLStatus = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: str = "oldest",
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Obtener casos HITL, opcionalmente filtrados por estado (paginados)
+    
+    Query params:
+    - status: PENDING, CLAIMED, APPROVED, REJECTED, IN_REVIEW (opcional)
+    - limit: Tamaño de página (default: 100, máximo: 500)
+    - cursor: Valor de X-Next-Cursor de la respuesta anterior
+    - sort: oldest (default), newest o priority (más urgentes primero)
+    """
+    try:
+        return await _list_cases_response(db, request, response, status, limit, cursor, sort)
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener casos: {str(e)}")
+
+
+@router.post(
+    "/claim-next",
+    summary="Reservar el siguiente caso de mayor prioridad",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+async def claim_next_case(
+    lease_seconds: Optional[int] = Query(None, ge=30, le=3600),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Obtener todos los casos HITL, opcionalmente filtrados por estado
+    Reservar atómicamente el caso pendiente más urgente para el usuario autenticado
+    
+    El caso pasa a CLAIMED y vuelve a la cola si el lease vence sin heartbeat.
+    Responde 204 si no hay casos pendientes.
     
     Query params:
-    - status: PENDING, APPROVED, REJECTED, IN_REVIEW (opcional)
+    - lease_seconds: Duración de la reserva (default: HITL_LEASE_SECONDS)
     """
     try:
         hitl_service = get_hitl_service()
-        cases = hitl_service.get_all_cases(status)
+        case = await hitl_service.claim_next_async(db, current_user["username"], lease_seconds)
         
-        # Enriquecer cada caso con información de maestros
-        enriched_cases = []
-        for case in cases:
-            case_data = _enrich_case_summary(case)
-            enriched_cases.append(case_data)
+        if not case:
+            return Response(status_code=204)
         
-        return enriched_cases
+        return _enrich_case_full(case)
     
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al obtener casos: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error al reservar caso: {str(e)}")
+
+
+@router.post(
+    "/cases/{case_id}/heartbeat",
+    summary="Renovar la reserva de un caso",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+async def heartbeat_case(
+    case_id: str,
+    lease_seconds: Optional[int] = Query(None, ge=30, le=3600),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Extender el lease de un caso reservado por el usuario autenticado
+    """
+    try:
+        hitl_service = get_hitl_service()
+        lease_expires_at = await hitl_service.heartbeat_async(db, case_id, current_user["username"], lease_seconds)
+        
+        return {
+            "case_id": case_id,
+            "claimed_by": current_user["username"],
+            "lease_expires_at": lease_expires_at.isoformat()
+        }
+    
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al renovar reserva: {str(e)}")
+
+
+@router.post(
+    "/cases/{case_id}/release",
+    summary="Liberar la reserva de un caso",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+async def release_case(
+    case_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Devolver a la cola un caso reservado por el usuario autenticado
+    """
+    try:
+        hitl_service = get_hitl_service()
+        await hitl_service.release_async(db, case_id, current_user["username"])
+        
+        return {"case_id": case_id, "status": HITLStatus.PENDING.value, "success": True}
+    
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al liberar caso: {str(e)}")
 
 
 @router.get(
@@ -79,13 +227,13 @@ async def get_all_cases(status: HITLStatus = None):
     summary="Obtener un caso específico (completo)",
     dependencies=[Depends(verify_api_key_and_jwt)]
 )
-async def get_case(case_id: str):
+async def get_case(case_id: str, db: AsyncSession = Depends(get_async_read_db)):
     """
     Obtener detalles COMPLETOS de un caso HITL específico
     """
     try:
         hitl_service = get_hitl_service()
-        case = hitl_service.get_case(case_id)
+        case = await hitl_service.get_case_async(db, case_id)
         
         if not case:
             raise HTTPException(status_code=404, detail=f"Caso {case_id} no encontrado")
@@ -107,7 +255,8 @@ async def get_case(case_id: str):
 async def review_case(
     case_id: str,
     review: HITLReviewRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Revisar un caso HITL y tomar una decisión final
@@ -116,7 +265,8 @@ async def review_case(
         hitl_service = get_hitl_service()
         
         # Usar el username del usuario autenticado
-        case = hitl_service.review_case(
+        case = await hitl_service.review_case_async(
+            db,
             case_id=case_id,
             reviewer_id=current_user["username"],
             decision=DecisionType[review.decision],
@@ -143,16 +293,59 @@ async def review_case(
         raise HTTPException(status_code=500, detail=f"Error al revisar caso: {str(e)}")
 
 
+@router.post(
+    "/cases/bulk-review",
+    summary="Revisar varios casos con una misma decisión",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+async def bulk_review_cases(
+    review: HITLBulkReviewRequest,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Resolver en una sola transacción una lista de casos o los casos pendientes
+    que cumplan un filtro (ej. todos los de un comercio)
+    
+    Retorna el resultado por caso: reviewed, not_found, already_reviewed o
+    claimed_by_other.
+    """
+    try:
+        hitl_service = get_hitl_service()
+        
+        summary = await hitl_service.bulk_review_async(
+            db,
+            reviewer_id=current_user["username"],
+            decision=review.decision,
+            notes=review.notes,
+            case_ids=review.case_ids,
+            filters=review.filter.model_dump() if review.filter else None,
+            max_cases=review.max_cases
+        )
+        
+        return {
+            **summary,
+            "reviewer_id": current_user["username"],
+            "success": True,
+            "message": f"{summary['reviewed']} de {summary['requested']} casos revisados por {current_user['nombre_usuario']}"
+        }
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en revisión masiva: {str(e)}")
+
+
 @router.get(
     "/statistics",
     summary="Obtener estadísticas de la cola HITL",
         dependencies=[Depends(verify_api_key_and_jwt)]  # ← API KEY + JWT 
 )
-async def get_statistics():
+async def get_statistics(db: AsyncSession = Depends(get_async_read_db)):
     """
     Obtiene estadísticas sobre la cola de revisión manual
     """
-    stats = hitl_service.get_statistics()
+    stats = await hitl_service.get_statistics_async(db)
     return stats
 
 
@@ -179,6 +372,9 @@ def _enrich_case_full(case) -> dict:
         "reviewer_decision": case.reviewer_decision.value if case.reviewer_decision else None,
         "reviewer_notes": case.reviewer_notes,
         "reviewed_at": case.reviewed_at,
+        "risk_score": case.risk_score,
+        "claimed_by": case.claimed_by,
+        "lease_expires_at": case.lease_expires_at,
         
         # DATOS DE LA TRANSACCIÓN (OBJETO COMPLETO)
         "transaction": {
@@ -259,6 +455,8 @@ def _enrich_case_summary(case) -> dict:
         "reviewer_notes": case.reviewer_notes,
         "reviewer_decision": case.reviewer_decision.value if case.reviewer_decision else None,
         "reviewed_at": case.reviewed_at,
+        "risk_score": case.risk_score,
+        "claimed_by": case.claimed_by,
         
         # Datos básicos de la transacción
         "transaction": {
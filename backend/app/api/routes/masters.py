@@ -1,16 +1,49 @@
 """
 Master Data Routes - Datos maestros
+Se sirven desde el cache en memoria, pre-serializados y con ETag. El cache es
+el mismo que usa la ruta de escritura para verificar existencia, así que se
+carga desde la primaria (solo se consulta al cargar o vencer el TTL).
 """
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from typing import List
-from app.database.connection import get_db
-from app.database.models import CustomerDB, CountryDB, ChannelDB, MerchantDB
+from fastapi import APIRouter, Depends, Query, Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
+from app.config import get_settings
+from app.database.connection import get_async_db
 from app.models.master_schemas import Customer, Country, Channel, Merchant
 from app.security import verify_api_key
+from app.services.master_data_cache import get_master_data_cache, content_etag
 
 router = APIRouter()
 
+CUSTOMER_SEARCH_FIELDS = ("customer_id", "nombre", "apellido", "email")
+MAX_CUSTOMERS_PAGE_SIZE = 1000
+
+_ADAPTERS = {
+    "customers": TypeAdapter(List[Customer]),
+    "countries": TypeAdapter(List[Country]),
+    "channels": TypeAdapter(List[Channel]),
+    "merchants": TypeAdapter(List[Merchant]),
+}
+
+
+def _cached_json(request: Request, body: bytes, etag: str, headers: Dict[str, str] = None) -> Response:
+    """Respuesta JSON pre-serializada; 304 si If-None-Match coincide"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={get_settings().MASTER_DATA_CACHE_TTL_SECONDS}",
+        **(headers or {}),
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def _master_response(request: Request, db: AsyncSession, table: str) -> Response:
+    """Tabla maestra completa desde el cache"""
+    body, etag = await get_master_data_cache().serialized_async(db, table, _ADAPTERS[table])
+    return _cached_json(request, body, etag)
+
 
 @router.get(
     "/customers",
@@ -18,14 +51,43 @@ router = APIRouter()
     summary="Obtener lista de clientes",
     dependencies=[Depends(verify_api_key)]
 )
-async def get_customers(db: Session = Depends(get_db)):
+async def get_customers(
+    request: Request,
+    q: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_CUSTOMERS_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Obtiene la lista completa de clientes
+    Obtiene la lista de clientes
+    
+    Query params:
+    - q: Buscar en ID, nombre, apellido o email (opcional)
+    - limit: Tamaño de página (opcional, máximo 1000; sin limit devuelve todos)
+    - offset: Desplazamiento de la página (default: 0)
+    
+    El total de coincidencias va en el header X-Total-Count.
     
     **REQUIERE X-API-Key**
     """
-    customers = db.query(CustomerDB).all()
-    return customers
+    cache = get_master_data_cache()
+    
+    if not q and limit is None and offset == 0:
+        body, etag = await cache.serialized_async(db, "customers", _ADAPTERS["customers"])
+        return _cached_json(request, body, etag, {"X-Total-Count": str(len(await cache.all_async(db, "customers")))})
+    
+    customers = await cache.all_async(db, "customers")
+    if q:
+        term = q.strip().lower()
+        customers = [
+            c for c in customers
+            if any(term in str(c.get(field) or "").lower() for field in CUSTOMER_SEARCH_FIELDS)
+        ]
+    
+    total = len(customers)
+    page = customers[offset:offset + limit if limit is not None else None]
+    body = _ADAPTERS["customers"].dump_json(_ADAPTERS["customers"].validate_python(page))
+    return _cached_json(request, body, content_etag("customers", body), {"X-Total-Count": str(total)})
 
 
 @router.get(
@@ -34,14 +96,13 @@ async def get_customers(db: Session = Depends(get_db)):
     summary="Obtener lista de países",
     dependencies=[Depends(verify_api_key)]
 )
-async def get_countries(db: Session = Depends(get_db)):
+async def get_countries(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene la lista completa de países
     
     **REQUIERE X-API-Key**
     """
-    countries = db.query(CountryDB).all()
-    return countries
+    return await _master_response(request, db, "countries")
 
 
 @router.get(
@@ -50,14 +111,13 @@ async def get_countries(db: Session = Depends(get_db)):
     summary="Obtener lista de canales",
     dependencies=[Depends(verify_api_key)]
 )
-async def get_channels(db: Session = Depends(get_db)):
+async def get_channels(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene la lista completa de canales de transacción
     
     **REQUIERE X-API-Key**
     """
-    channels = db.query(ChannelDB).all()
-    return channels
+    return await _master_response(request, db, "channels")
 
 
 @router.get(
@@ -66,11 +126,10 @@ async def get_channels(db: Session = Depends(get_db)):
     summary="Obtener lista de comercios",
     dependencies=[Depends(verify_api_key)]
 )
-async def get_merchants(db: Session = Depends(get_db)):
+async def get_merchants(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene la lista completa de comercios
     
     **REQUIERE X-API-Key**
     """
-    merchants = db.query(MerchantDB).all()
-    return merchants
\ No newline at end of file
+    return await _master_response(request, db, "merchants")
@@ -0,0 +1,109 @@
+"""
+Policy Routes - Evaluación retroactiva de políticas (backfill)
+"""
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from sqlalchemy.orm import Session
+from app.database.connection import get_db
+from app.models.schemas import PolicyBackfillRequest
+from app.services.policy_backfill_service import PolicyBackfillService, run_backfill_job
+from app.services.policy_rule_engine import PolicyRuleError
+from app.security import verify_api_key_and_jwt, get_current_user
+
+router = APIRouter()
+
+
+@router.post(
+    "/backfill",
+    status_code=202,
+    summary="Evaluar una política sobre el histórico de transacciones",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+async def start_backfill(
+    request: PolicyBackfillRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Inicia un backfill en segundo plano y retorna el ID de ejecución
+    
+    Se debe indicar `policy_id` (usa su condición de fraud_policies.json) o una `condition` ad-hoc.
+    """
+    condition = request.condition
+    version = request.version
+    
+    if request.policy_id and not condition:
+        policy = PolicyBackfillService.load_policy_definition(request.policy_id, request.version)
+        if not policy:
+            raise HTTPException(status_code=404, detail=f"Política {request.policy_id} no encontrada")
+        if not policy.get("condition"):
+            raise HTTPException(status_code=422, detail=f"La política {request.policy_id} no tiene condición declarada")
+        condition = policy["condition"]
+        version = policy["version"]
+    
+    if not condition:
+        raise HTTPException(status_code=422, detail="Indique policy_id o condition")
+    
+    try:
+        run = PolicyBackfillService.create_run(
+            db,
+            condition=condition,
+            policy_id=request.policy_id,
+            version=version,
+            date_from=request.date_from,
+            date_to=request.date_to,
+            created_by=current_user["username"]
+        )
+    except PolicyRuleError as e:
+        raise HTTPException(status_code=422, detail=f"Condición inválida: {str(e)}")
+    
+    background_tasks.add_task(run_backfill_job, run.id, request.chunk_size)
+    
+    return {
+        "run_id": run.id,
+        "status": run.status.value,
+        "condition": condition,
+        "message": f"Backfill #{run.id} iniciado"
+    }
+
+
+@router.get(
+    "/backfill/{run_id}",
+    summary="Obtener estado y estadísticas de un backfill",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+async def get_backfill(run_id: int, db: Session = Depends(get_db)):
+    """
+    Retorna el estado (RUNNING, COMPLETED, FAILED) y las estadísticas del backfill
+    """
+    run = PolicyBackfillService.get_run(db, run_id)
+    
+    if not run:
+        raise HTTPException(status_code=404, detail=f"Backfill {run_id} no encontrado")
+    
+    return run
+
+
+@router.get(
+    "/backfill/{run_id}/matches",
+    summary="Obtener transacciones que cumplen la política",
+    dependencies=[Depends(verify_api_key_and_jwt)]
+)
+async def get_backfill_matches(
+    run_id: int,
+    limit: int = 100,
+    offset: int = 0,
+    db: Session = Depends(get_db)
+):
+    """
+    Lista paginada de transacciones históricas que habrían cumplido la política
+    """
+    if not PolicyBackfillService.get_run(db, run_id):
+        raise HTTPException(status_code=404, detail=f"Backfill {run_id} no encontrado")
+    
+    return {
+        "run_id": run_id,
+        "limit": limit,
+        "offset": offset,
+        "matches": PolicyBackfillService.get_matches(db, run_id, limit=min(limit, 1000), offset=offset)
+    }
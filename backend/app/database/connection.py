@@ -1,39 +1,359 @@
 """
 Database Connection
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, Session
 from app.config import get_settings
 from app.database.models import Base
-from typing import Generator
+from typing import AsyncGenerator, Generator
+import threading
+import time
 
 settings = get_settings()
 
+
+def normalize_database_url(url: str):
+    """
+    Normalizar la URL de conexión
+    
+    postgres:// (Heroku, docker) se acepta como postgresql://, y sin driver
+    explícito se usa psycopg 3 si está instalado.
+    """
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    
+    database_url = make_url(url)
+    if database_url.drivername == "postgresql":
+        try:
+            import psycopg  # noqa: F401
+            database_url = database_url.set(drivername="postgresql+psycopg")
+        except ImportError:
+            pass
+    return database_url
+
+
+def async_database_url(url: str = None):
+    """
+    URL equivalente con driver async
+    
+    sqlite → sqlite+aiosqlite, postgresql (psycopg2 o sin driver) → postgresql+asyncpg;
+    psycopg 3 ya soporta async y se mantiene. DATABASE_ASYNC_URL la reemplaza.
+    """
+    if url is None and settings.DATABASE_ASYNC_URL:
+        return make_url(settings.DATABASE_ASYNC_URL)
+    
+    database_url = normalize_database_url(url or settings.DATABASE_URL)
+    backend = database_url.get_backend_name()
+    driver = database_url.get_driver_name()
+    
+    if backend == "sqlite" and driver != "aiosqlite":
+        return database_url.set(drivername="sqlite+aiosqlite")
+    if backend == "postgresql" and driver not in ("asyncpg", "psycopg"):
+        return database_url.set(drivername="postgresql+asyncpg")
+    return database_url
+
+
+def _apply_sqlite_pragmas(engine: Engine):
+    """Configurar cada conexión SQLite nueva (journal, synchronous, busy_timeout)"""
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+            # journal_mode escribe en el archivo: no aplica a conexiones de solo lectura (mode=ro)
+            read_only = engine.url.query.get("mode") == "ro"
+            if engine.url.database not in (None, "", ":memory:") and not read_only:
+                cursor.execute(f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}")
+        finally:
+            cursor.close()
+
+
+def build_engine(url: str = None, **overrides) -> Engine:
+    """
+    Crear un engine con la configuración de pool y dialecto de Settings
+    
+    Args:
+        url: URL de conexión (default: DATABASE_URL)
+        **overrides: Argumentos extra para create_engine
+    
+    Returns:
+        Engine configurado
+    """
+    database_url = normalize_database_url(url or settings.DATABASE_URL)
+    backend = database_url.get_backend_name()
+    
+    options = {"echo": settings.DB_ECHO, "pool_pre_ping": settings.DB_POOL_PRE_PING}
+    connect_args = {}
+    
+    if backend == "sqlite":
+        connect_args["check_same_thread"] = False
+        connect_args["timeout"] = settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+    else:
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        )
+        if backend == "postgresql" and settings.DB_STATEMENT_TIMEOUT_MS:
+            connect_args["options"] = f"-c statement_timeout={int(settings.DB_STATEMENT_TIMEOUT_MS)}"
+    
+    options["connect_args"] = connect_args
+    options.update(overrides)
+    engine = create_engine(database_url, **options)
+    
+    if backend == "sqlite":
+        _apply_sqlite_pragmas(engine)
+    
+    return engine
+
+
 # Crear engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
-    echo=False  # Cambiar a True para ver queries SQL
-)
+engine = build_engine()
+
+
+def build_async_engine(url: str = None, **overrides):
+    """
+    Crear un AsyncEngine con la misma configuración que build_engine
+    
+    Requiere el driver async del dialecto (aiosqlite o asyncpg).
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+    
+    database_url = async_database_url(url)
+    backend = database_url.get_backend_name()
+    
+    options = {"echo": settings.DB_ECHO, "pool_pre_ping": settings.DB_POOL_PRE_PING}
+    connect_args = {}
+    
+    if backend == "sqlite":
+        connect_args["timeout"] = settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+    else:
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        )
+        if backend == "postgresql" and settings.DB_STATEMENT_TIMEOUT_MS:
+            if database_url.get_driver_name() == "asyncpg":
+                connect_args["server_settings"] = {"statement_timeout": str(int(settings.DB_STATEMENT_TIMEOUT_MS))}
+            else:
+                connect_args["options"] = f"-c statement_timeout={int(settings.DB_STATEMENT_TIMEOUT_MS)}"
+    
+    options["connect_args"] = connect_args
+    options.update(overrides)
+    async_engine = create_async_engine(database_url, **options)
+    
+    if backend == "sqlite":
+        _apply_sqlite_pragmas(async_engine.sync_engine)
+    
+    return async_engine
+
+
+# Engine y session factory async (se crean al primer uso: el driver async es opcional para CLI/batch)
+_async_engine = None
+_async_session_factory = None
+_async_lock = threading.Lock()
+
+
+def get_async_engine():
+    """Obtener el AsyncEngine del proceso"""
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        with _async_lock:
+            if _async_engine is None:
+                from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+                
+                _async_engine = build_async_engine()
+                _async_session_factory = async_sessionmaker(
+                    _async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+                )
+    return _async_engine
+
+
+def AsyncSessionLocal():
+    """Crear una AsyncSession (equivalente async de SessionLocal)"""
+    get_async_engine()
+    return _async_session_factory()
+
+
+# ============================================
+# LECTURAS (réplica o conexión de solo lectura)
+# ============================================
+# Historial, estadísticas, maestros y listados HITL usan un pool propio para no
+# quitar conexiones a la ruta de decisiones. Sin DATABASE_READ_URL (o si la
+# réplica falla) se usa la primaria.
+
+# Marca en Session.info de las sesiones sobre la réplica (los caches compartidos no se cargan desde ellas)
+REPLICA_SESSION = "replica"
+
+_read_session_factory = None
+_async_read_engine = None
+_async_read_session_factory = None
+_read_unavailable_until = 0.0
+
+
+def _read_replica_enabled() -> bool:
+    return bool(settings.DATABASE_READ_URL) and time.monotonic() >= _read_unavailable_until
+
+
+def _mark_read_replica_unavailable(error: Exception):
+    """Usar la primaria durante DATABASE_READ_RETRY_SECONDS tras un fallo de la réplica"""
+    global _read_unavailable_until
+    _read_unavailable_until = time.monotonic() + settings.DATABASE_READ_RETRY_SECONDS
+    print(f"⚠️  Réplica de lectura no disponible, usando la primaria: {error}")
+
+
+def ReadSessionLocal() -> Session:
+    """Crear una sesión de lectura (sync; exportaciones y CLI)"""
+    global _read_session_factory
+    if not _read_replica_enabled():
+        return SessionLocal()
+    
+    if _read_session_factory is None:
+        with _async_lock:
+            if _read_session_factory is None:
+                _read_session_factory = sessionmaker(
+                    autocommit=False, autoflush=False, bind=build_engine(settings.DATABASE_READ_URL),
+                    info={REPLICA_SESSION: True}
+                )
+    
+    db = _read_session_factory()
+    try:
+        db.connection()
+        return db
+    except (OperationalError, OSError) as e:
+        db.close()
+        _mark_read_replica_unavailable(e)
+        return SessionLocal()
+
+
+async def AsyncReadSessionLocal():
+    """Crear una AsyncSession de lectura (conectada; cae a la primaria si la réplica falla)"""
+    global _async_read_engine, _async_read_session_factory
+    if not _read_replica_enabled():
+        return AsyncSessionLocal()
+    
+    if _async_read_engine is None:
+        with _async_lock:
+            if _async_read_engine is None:
+                from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+                
+                _async_read_engine = build_async_engine(settings.DATABASE_READ_URL)
+                _async_read_session_factory = async_sessionmaker(
+                    _async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False,
+                    info={REPLICA_SESSION: True}
+                )
+    
+    db = _async_read_session_factory()
+    try:
+        await db.connection()
+        return db
+    except (OperationalError, OSError) as e:
+        await db.close()
+        _mark_read_replica_unavailable(e)
+        return AsyncSessionLocal()
+
+
+async def dispose_async_engine():
+    """Cerrar los pools async (shutdown)"""
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _async_read_engine is not None:
+        await _async_read_engine.dispose()
 
 # Crear session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def _ensure_columns():
+    """
+    Agregar columnas nuevas (nullable) a tablas existentes
+    
+    create_all no altera tablas ya creadas; esto cubre las columnas
+    agregadas al modelo después del primer despliegue.
+    """
+    from sqlalchemy import inspect, text
+    
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"   ➕ Columna agregada: {table.name}.{column.name}")
+
+
+def _ensure_indexes():
+    """Crear índices nuevos sobre tablas existentes (create_all solo los crea con la tabla)"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _ensure_enum_values():
+    """
+    Agregar valores nuevos a los ENUM nativos de PostgreSQL
+    
+    En SQLite los Enum se guardan como VARCHAR y no requieren cambios.
+    """
+    from sqlalchemy import Enum, text
+    
+    if engine.dialect.name != "postgresql":
+        return
+    
+    # ALTER TYPE ... ADD VALUE no puede usarse en la misma transacción que lo agrega
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in Base.metadata.sorted_tables:
+            for column in table.columns:
+                if not isinstance(column.type, Enum) or not column.type.native_enum:
+                    continue
+                for value in column.type.enums:
+                    conn.execute(text(f"ALTER TYPE {column.type.name} ADD VALUE IF NOT EXISTS '{value}'"))
+
+
 def init_db():
     """
     Inicializar base de datos (crear tablas y poblar datos)
     """
     from app.services.seed_service import SeedService
+    from app.services.statistics_service import StatisticsService
+    from app.services.rollup_service import RollupService
+    from app.services.hitl_service import backfill_priority_keys, backfill_claimed_status
+    from app.services.persistence_service import backfill_decision_customers
+    from app.services.search_service import ensure_search_index, backfill_search_documents
     
     print("🗄️  Inicializando base de datos...")
     Base.metadata.create_all(bind=engine)
+    _ensure_columns()
+    _ensure_enum_values()
+    _ensure_indexes()
+    ensure_search_index(engine)
     print("✅ Tablas creadas")
     
     # Poblar datos maestros
     db = SessionLocal()
     try:
+        # Solo en el primer arranque: reconciliar aquí pisaría los incrementos
+        # de otros workers ya activos (se hace bajo demanda)
+        StatisticsService.initialize(db)
         SeedService.seed_all(db)
+        backfill_claimed_status(db)
+        RollupService.ensure_built(db)
+        backfill_priority_keys(db)
+        backfill_decision_customers(db)
+        backfill_search_documents(db)
     finally:
         db.close()
 
@@ -46,4 +366,32 @@ def get_db() -> Generator[Session, None, None]:
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db() -> AsyncGenerator:
+    """
+    Dependency para obtener una AsyncSession
+    
+    Las consultas no bloquean el event loop; los servicios sync se ejecutan
+    sobre la misma conexión con await db.run_sync(...).
+    """
+    db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+async def get_async_read_db() -> AsyncGenerator:
+    """
+    Dependency para rutas de solo lectura (réplica si está configurada)
+    
+    Las escrituras deben usar get_async_db: la réplica puede ir atrasada o
+    ser de solo lectura.
+    """
+    db = await AsyncReadSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
@@ -1,7 +1,7 @@
 """
 Database Models - SQLAlchemy ORM
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, LargeBinary, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 import enum
@@ -19,12 +19,20 @@ class DecisionTypeEnum(str, enum.Enum):
     ESCALATE_TO_HUMAN = "ESCALATE_TO_HUMAN"
 
 
+class BackfillStatusEnum(str, enum.Enum):
+    """Enum para estados de ejecución de backfill de políticas"""
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+
 class HITLStatusEnum(str, enum.Enum):
     """Enum para estados HITL"""
     PENDING = "PENDING"
     APPROVED = "APPROVED"
     REJECTED = "REJECTED"
     IN_REVIEW = "IN_REVIEW"
+    CLAIMED = "CLAIMED"  # Reservado por un revisor (lease vigente), aún sin revisar
 
 
 class TransactionDB(Base):
@@ -61,6 +69,15 @@ class FraudDecisionDB(Base):
     explanation_customer = Column(Text, nullable=True)
     explanation_audit = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    # Desnormalizado de transactions para filtrar el historial sin JOIN
+    customer_id = Column(String(50), nullable=True)
+    
+    __table_args__ = (
+        # Paginación keyset del historial (created_at, id) por filtro común
+        Index("ix_fraud_decisions_created_id", "created_at", "id"),
+        Index("ix_fraud_decisions_customer_created_id", "customer_id", "created_at", "id"),
+        Index("ix_fraud_decisions_decision_created_id", "decision", "created_at", "id"),
+    )
     
     # Relaciones
     transaction = relationship("TransactionDB", back_populates="decisions")
@@ -68,6 +85,7 @@ class FraudDecisionDB(Base):
     citations_internal = relationship("InternalCitationDB", back_populates="decision", cascade="all, delete-orphan")
     citations_external = relationship("ExternalCitationDB", back_populates="decision", cascade="all, delete-orphan")
     logs = relationship("AnalysisLogDB", back_populates="decision", cascade="all, delete-orphan")
+    log_blob = relationship("AnalysisLogBlobDB", back_populates="decision", uselist=False, cascade="all, delete-orphan")
 
 
 
@@ -76,7 +94,7 @@ class SignalDB(Base):
     __tablename__ = "signals"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    decision_id = Column(Integer, ForeignKey("fraud_decisions.id"), nullable=False)
+    decision_id = Column(Integer, ForeignKey("fraud_decisions.id"), nullable=False, index=True)
     signal_text = Column(Text, nullable=False)
     source_agent = Column(String(100), nullable=True)
     
@@ -89,7 +107,7 @@ class InternalCitationDB(Base):
     __tablename__ = "citations_internal"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    decision_id = Column(Integer, ForeignKey("fraud_decisions.id"), nullable=False)
+    decision_id = Column(Integer, ForeignKey("fraud_decisions.id"), nullable=False, index=True)
     policy_id = Column(String(50), nullable=False)
     version = Column(String(20), nullable=False)
     chunk_id = Column(String(10), nullable=True)
@@ -103,7 +121,7 @@ class ExternalCitationDB(Base):
     __tablename__ = "citations_external"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    decision_id = Column(Integer, ForeignKey("fraud_decisions.id"), nullable=False)
+    decision_id = Column(Integer, ForeignKey("fraud_decisions.id"), nullable=False, index=True)
     url = Column(Text, nullable=False)
     summary = Column(Text, nullable=True)
     
@@ -134,8 +152,21 @@ class HITLCaseDB(Base):
     reviewer_notes = Column(Text, nullable=True)
     reviewed_at = Column(DateTime, nullable=True)
     
+    # Prioridad y reserva (claim/lease) por revisor
+    risk_score = Column(Float, nullable=True)
+    priority_key = Column(Float, nullable=True)  # score estático - peso_edad * horas(created_at)
+    claimed_by = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    
     # Relaciones
     transaction = relationship("TransactionDB")
+    
+    __table_args__ = (
+        # Paginación keyset de la cola por estado
+        Index("ix_hitl_cases_status_created_case", "status", "created_at", "case_id"),
+        # Cola priorizada (claim-next)
+        Index("ix_hitl_cases_status_priority", "status", "priority_key"),
+    )
 
 class CustomerDB(Base):
     """Tabla de clientes"""
@@ -150,6 +181,22 @@ class CustomerDB(Base):
     
     # Relaciones
     transactions = relationship("TransactionDB", back_populates="customer")
+    behavior = relationship("CustomerBehaviorDB", back_populates="customer", uselist=False)
+
+
+class CustomerBehaviorDB(Base):
+    """Tabla de perfiles de comportamiento habitual de clientes"""
+    __tablename__ = "customer_behaviors"
+    
+    customer_id = Column(String(50), ForeignKey("customers.customer_id"), primary_key=True)
+    usual_amount_avg = Column(Float, nullable=False)
+    usual_hours = Column(String(20), nullable=False)
+    usual_countries = Column(String(200), nullable=False)
+    usual_devices = Column(String(200), nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relaciones
+    customer = relationship("CustomerDB", back_populates="behavior")
 
 
 class CountryDB(Base):
@@ -194,4 +241,129 @@ class AnalysisLogDB(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relación
-    decision = relationship("FraudDecisionDB", back_populates="logs")
\ No newline at end of file
+    decision = relationship("FraudDecisionDB", back_populates="logs")
+
+
+class AnalysisLogBlobDB(Base):
+    """Tabla de logs de análisis compactos (un blob comprimido por decisión)"""
+    __tablename__ = "analysis_log_blobs"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    decision_id = Column(Integer, ForeignKey("fraud_decisions.id"), nullable=False, unique=True, index=True)
+    encoding = Column(String(20), nullable=False)  # json+zlib
+    event_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relación
+    decision = relationship("FraudDecisionDB", back_populates="log_blob")
+
+
+class PolicyBackfillRunDB(Base):
+    """Tabla de ejecuciones de backfill retroactivo de políticas"""
+    __tablename__ = "policy_backfill_runs"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    policy_id = Column(String(50), nullable=True, index=True)
+    version = Column(String(20), nullable=True)
+    condition = Column(Text, nullable=False)
+    status = Column(SQLEnum(BackfillStatusEnum), nullable=False, default=BackfillStatusEnum.RUNNING)
+    date_from = Column(DateTime, nullable=True)
+    date_to = Column(DateTime, nullable=True)
+    
+    # Estadísticas
+    scanned_count = Column(Integer, nullable=False, default=0)
+    matched_count = Column(Integer, nullable=False, default=0)
+    skipped_count = Column(Integer, nullable=False, default=0)  # Sin perfil de cliente
+    matched_amount_total = Column(Float, nullable=False, default=0.0)
+    summary = Column(Text, nullable=True)  # JSON con desglose por decisión, canal, país
+    error = Column(Text, nullable=True)
+    
+    created_by = Column(String(100), nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    
+    # Relaciones
+    matches = relationship("PolicyBackfillMatchDB", back_populates="run", cascade="all, delete-orphan")
+
+
+class PolicyBackfillMatchDB(Base):
+    """Tabla de transacciones históricas que cumplen la política evaluada"""
+    __tablename__ = "policy_backfill_matches"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(Integer, ForeignKey("policy_backfill_runs.id"), nullable=False, index=True)
+    transaction_id = Column(String(50), nullable=False)
+    customer_id = Column(String(50), nullable=False)
+    amount = Column(Float, nullable=False)
+    channel = Column(String(20), nullable=False)
+    country = Column(String(10), nullable=False)
+    transaction_timestamp = Column(DateTime, nullable=False)
+    
+    # Relaciones
+    run = relationship("PolicyBackfillRunDB", back_populates="matches")
+
+
+class StatisticsCounterDB(Base):
+    """Tabla de contadores agregados (mantenidos en la misma transacción que cada escritura)"""
+    __tablename__ = "statistics_counters"
+    
+    key = Column(String(100), primary_key=True)  # transactions, decisions.BLOCK, hitl.PENDING...
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DecisionRollupDB(Base):
+    """Tabla de agregados de decisiones por intervalo de tiempo (minute, hour, day)"""
+    __tablename__ = "decision_rollups"
+    
+    granularity = Column(String(10), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    decision = Column(String(30), primary_key=True)
+    risk_bucket = Column(Integer, primary_key=True)  # floor(risk_score * 10) en 0-9, -1 sin score
+    count = Column(Integer, nullable=False, default=0)
+    processing_time_sum = Column(Float, nullable=False, default=0.0)
+    processing_time_max = Column(Float, nullable=False, default=0.0)
+
+
+class IdSequenceDB(Base):
+    """Tabla de secuencias de IDs (contador atómico, reservado por bloques)"""
+    __tablename__ = "id_sequences"
+    
+    name = Column(String(50), primary_key=True)  # hitl_case
+    next_value = Column(Integer, nullable=False)
+
+
+class ArchivedDecisionDB(Base):
+    """Índice de decisiones movidas al archivo mensual (el documento completo vive en el archivo)"""
+    __tablename__ = "archived_decisions"
+    
+    decision_id = Column(Integer, primary_key=True)
+    transaction_id = Column(String(50), nullable=False, index=True)
+    customer_id = Column(String(50), nullable=True)
+    decision = Column(SQLEnum(DecisionTypeEnum), nullable=False)
+    risk_score = Column(Float, nullable=True)
+    processing_time_ms = Column(Float, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    archive_month = Column(String(7), nullable=False)  # YYYY-MM (archivo decisions-YYYY-MM.db)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SearchDocumentDB(Base):
+    """Documentos de búsqueda full-text (decisiones: señales + explicaciones; casos HITL: notas de revisión)"""
+    __tablename__ = "search_documents"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(20), nullable=False)  # decision, hitl_case
+    decision_id = Column(Integer, nullable=True, unique=True)
+    case_id = Column(String(50), nullable=True, unique=True)
+    transaction_id = Column(String(50), nullable=False, index=True)
+    customer_id = Column(String(50), nullable=True)
+    merchant_id = Column(String(50), nullable=True)
+    decision = Column(String(30), nullable=True)  # Decisión del sistema o del revisor
+    created_at = Column(DateTime, nullable=False)
+    content = Column(Text, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_search_documents_kind_created", "kind", "created_at"),
+    )
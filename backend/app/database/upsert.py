@@ -0,0 +1,105 @@
+"""
+Upsert helpers - INSERT ... ON CONFLICT según el dialecto de la BD
+"""
+from sqlalchemy import update, insert, case, func
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Dict, List
+
+
+def _dialect_insert(db: Session, model):
+    """insert() con soporte ON CONFLICT para SQLite/PostgreSQL (None en otros dialectos)"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(model)
+
+
+def accumulate_rows(db: Session, model, key_columns: List[str], rows: List[Dict],
+                    sum_columns: List[str] = (), max_columns: List[str] = ()):
+    """
+    Insertar filas o acumularlas sobre las existentes con la misma clave
+
+    Las columnas de sum_columns se suman, las de max_columns conservan el
+    máximo y el resto toma el valor nuevo. Atómico frente a escrituras
+    concurrentes (ON CONFLICT DO UPDATE). No hace commit.
+
+    Args:
+        db: Sesión de base de datos
+        model: Modelo con restricción única (o PK) sobre key_columns
+        key_columns: Columnas que identifican la fila
+        rows: Filas a insertar/acumular (todas con las mismas claves)
+        sum_columns: Columnas acumuladas por suma
+        max_columns: Columnas acumuladas por máximo
+    """
+    if not rows:
+        return
+
+    other_columns = [c for c in rows[0] if c not in key_columns and c not in sum_columns and c not in max_columns]
+
+    stmt = _dialect_insert(db, model)
+    if stmt is not None:
+        greatest = func.max if db.get_bind().dialect.name == "sqlite" else func.greatest
+        set_ = {c: getattr(model, c) + stmt.excluded[c] for c in sum_columns}
+        set_.update({c: greatest(getattr(model, c), stmt.excluded[c]) for c in max_columns})
+        set_.update({c: stmt.excluded[c] for c in other_columns})
+        db.execute(stmt.on_conflict_do_update(index_elements=key_columns, set_=set_), rows)
+        return
+
+    # Otros dialectos: UPDATE y, si no existía, INSERT
+    for row in rows:
+        values = {c: getattr(model, c) + row[c] for c in sum_columns}
+        values.update({
+            c: case((getattr(model, c) < row[c], row[c]), else_=getattr(model, c))
+            for c in max_columns
+        })
+        values.update({c: row[c] for c in other_columns})
+        result = db.execute(
+            update(model).where(*[getattr(model, c) == row[c] for c in key_columns]).values(**values)
+        )
+        if result.rowcount == 0:
+            db.execute(insert(model).values(**row))
+
+
+def increment_counters(db: Session, model, deltas: Dict[str, int]):
+    """
+    Sumar deltas a contadores (key, value), creándolos si no existen. No hace commit.
+
+    Args:
+        db: Sesión de base de datos
+        model: Modelo con columnas key, value y updated_at
+        deltas: {clave: incremento}
+    """
+    now = datetime.utcnow()
+    rows = [{"key": key, "value": delta, "updated_at": now} for key, delta in deltas.items() if delta]
+    accumulate_rows(db, model, ["key"], rows, sum_columns=["value"])
+
+
+def set_counters(db: Session, model, values: Dict[str, int]):
+    """
+    Fijar el valor absoluto de contadores (usado por la reconciliación). No hace commit.
+    """
+    now = datetime.utcnow()
+    rows = [{"key": key, "value": value, "updated_at": now} for key, value in values.items()]
+    if not rows:
+        return
+
+    stmt = _dialect_insert(db, model)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[model.key],
+            set_={"value": stmt.excluded.value, "updated_at": stmt.excluded.updated_at},
+        )
+        db.execute(stmt, rows)
+        return
+
+    for row in rows:
+        result = db.execute(
+            update(model).where(model.key == row["key"]).values(value=row["value"], updated_at=now)
+        )
+        if result.rowcount == 0:
+            db.execute(insert(model).values(**row))
@@ -13,13 +13,19 @@ import json
 from pathlib import Path
 from datetime import datetime
 from fastapi import Depends
-from app.database.connection import init_db, get_db
+from app.database.connection import init_db, get_db, dispose_async_engine
 from app.services.persistence_service import PersistenceService
 from sqlalchemy.orm import Session
 from app.security import verify_api_key_and_jwt, get_current_user
-from app.api.routes import hitl, history, auth, masters
-from fastapi.responses import StreamingResponse
+from app.api.routes import hitl, history, auth, masters, policies
+from fastapi.responses import StreamingResponse, JSONResponse
 from app.services.streaming_service import StreamingService
+from app.services.profile_store import get_profile_store
+from app.services.readiness_service import get_readiness_service, ComponentStatus
+from app.services.write_behind_service import persist_analysis, get_write_behind_queue, WriteBehindFullError
+from app.services.admission_service import get_admission_controller, admit_analysis, AdmissionRejectedError
+from starlette.background import BackgroundTask
+import asyncio
 from dotenv import load_dotenv
 import os
 
@@ -71,6 +77,12 @@ app.include_router(
     tags=["History & Statistics"]
 )
 
+app.include_router(
+    policies.router,
+    prefix=f"{settings.API_V1_PREFIX}/policies",
+    tags=["Policies"]
+)
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -81,18 +93,23 @@ app.add_middleware(
 )
 
 
+# Backpressure de los endpoints de análisis (cola llena o espera agotada)
+@app.exception_handler(AdmissionRejectedError)
+async def admission_rejected_handler(request, exc: AdmissionRejectedError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 # ============================================
 # HELPERS
 # ============================================
 
 def load_customer_behavior(customer_id: str):
-    """Cargar comportamiento del cliente desde JSON"""
-    data_path = Path("data/customer_behavior.json")
-    if data_path.exists():
-        with open(data_path, "r", encoding="utf-8") as f:
-            behaviors = json.load(f)
-            return behaviors.get(customer_id)
-    return None
+    """Cargar comportamiento del cliente desde el store de perfiles (en memoria)"""
+    return get_profile_store().get(customer_id)
 
 
 def _generate_customer_explanation(decision: DecisionType, signals: list) -> str:
@@ -121,6 +138,8 @@ async def root():
         "docs": "/docs",
         "endpoints": {
             "health": "/health",
+            "ready": "/ready",
+            "admission_metrics": "/metrics/admission",
             "llm_config": "/config/llm",
             "analyze_transaction": "/api/v1/transactions/analyze"
         }
@@ -140,6 +159,37 @@ async def health_check():
     }
 
 
+@app.get("/metrics/admission")
+async def admission_metrics():
+    """Métricas del control de admisión: cupos en uso, profundidad de cola, esperas y rechazos (sin autenticación)"""
+    return {
+        "enabled": settings.ADMISSION_ENABLED,
+        "timestamp": datetime.now().isoformat(),
+        **get_admission_controller().snapshot()
+    }
+
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Verificar que la instancia está lista para recibir tráfico (sin autenticación)
+    
+    Retorna 503 mientras algún componente (BD, perfiles, feed de amenazas,
+    clientes LLM, RAG) no haya terminado su warmup.
+    """
+    readiness = get_readiness_service()
+    ready = readiness.is_ready()
+    
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "timestamp": datetime.now().isoformat(),
+            "components": readiness.snapshot()
+        }
+    )
+
+
 @app.get(
     "/config/llm",
     dependencies=[Depends(verify_api_key_and_jwt)]  # ← API KEY + JWT
@@ -161,7 +211,7 @@ async def get_llm_config():
     f"{settings.API_V1_PREFIX}/transactions/analyze",
     response_model=DecisionResponse,
     summary="Analizar transacción para detectar fraude",
-    dependencies=[Depends(verify_api_key_and_jwt)]  # ← API KEY + JWT
+    dependencies=[Depends(verify_api_key_and_jwt), Depends(admit_analysis)]  # ← API KEY + JWT + cupo de análisis
 )
 async def analyze_transaction(request: TransactionAnalysisRequest, current_user: dict = Depends(get_current_user)):
     """
@@ -191,6 +241,8 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
     # ============================================
     # SISTEMA MULTI-AGENTE COMPLETO (7 AGENTES)
     # ============================================
+    # Los agentes son síncronos (llamadas al LLM): cada analyze corre en un hilo
+    # para no bloquear el event loop (admisión, métricas y el resto de requests)
     try:
         from app.agents.transaction_context_agent import TransactionContextAgent
         from app.agents.behavioral_pattern_agent import BehavioralPatternAgent
@@ -208,7 +260,7 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
         # ============================================
         print("\n📍 FASE 1: Análisis de Contexto")
         context_agent = TransactionContextAgent()
-        context_result = context_agent.analyze(transaction, customer_behavior)
+        context_result = await asyncio.to_thread(context_agent.analyze, transaction, customer_behavior)
         agent_route.append(context_result.get("agent"))
         
         print(f"   ✅ Riesgo: {context_result.get('risk_level')}")
@@ -218,7 +270,8 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
         # ============================================
         print("\n📍 FASE 2: Análisis de Patrones")
         behavioral_agent = BehavioralPatternAgent()
-        behavioral_result = behavioral_agent.analyze(
+        behavioral_result = await asyncio.to_thread(
+            behavioral_agent.analyze,
             transaction, customer_behavior,
             context_signals=context_result.get("signals", [])
         )
@@ -231,7 +284,8 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
         # ============================================
         print("\n📍 FASE 3: Consulta de Políticas (RAG)")
         policy_agent = PolicyRAGAgent()
-        policy_result = policy_agent.analyze(
+        policy_result = await asyncio.to_thread(
+            policy_agent.analyze,
             transaction, customer_behavior,
             context_signals=context_result.get("signals", []),
             behavioral_anomalies=behavioral_result.get("anomalies", [])
@@ -254,7 +308,8 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
         # ============================================
         print("\n📍 FASE 4: Inteligencia de Amenazas")
         threat_agent = ThreatIntelAgent()
-        threat_result = threat_agent.analyze(
+        threat_result = await asyncio.to_thread(
+            threat_agent.analyze,
             transaction,
             context_signals=context_result.get("signals", [])
         )
@@ -275,7 +330,8 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
         # ============================================
         print("\n📍 FASE 5: Agregación de Evidencias")
         evidence_agent = EvidenceAggregationAgent()
-        evidence_result = evidence_agent.analyze(
+        evidence_result = await asyncio.to_thread(
+            evidence_agent.analyze,
             context_result, behavioral_result,
             policy_result, threat_result
         )
@@ -291,7 +347,8 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
         # ============================================
         print("\n📍 FASE 6: Debate Pro-Fraud vs Pro-Customer")
         debate_agents = DebateAgents()
-        debate_result = debate_agents.analyze(
+        debate_result = await asyncio.to_thread(
+            debate_agents.analyze,
             transaction.transaction_id,
             all_signals,
             aggregated_risk,
@@ -335,6 +392,7 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
             (len(citations_external) > 0 and aggregated_risk > 0.7)  # Si hay alertas externas
         )
         
+        hitl_case = None
         if should_escalate_to_hitl:
             from app.services.hitl_service import get_hitl_service
             
@@ -342,7 +400,7 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
             print(f"   📋 Razón: decision={decision}, confidence={confidence}, risk={aggregated_risk:.2f}")
             
             hitl_service = get_hitl_service()
-            hitl_case = hitl_service.create_case(
+            hitl_case = hitl_service.build_case(
                 transaction=transaction,
                 decision_recommendation=decision,
                 confidence=confidence,
@@ -350,7 +408,8 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
                 citations_internal=citations_internal,
                 citations_external=citations_external,
                 agent_route=" → ".join(agent_route),
-                created_by=current_user["username"]
+                created_by=current_user["username"],
+                risk_score=aggregated_risk
             )
             
             print(f"   ✅ Caso HITL creado: {hitl_case.case_id}")
@@ -392,24 +451,22 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
         # ============================================
         # PERSISTIR EN BASE DE DATOS
         # ============================================
-        db = next(get_db())
-        try:
-            PersistenceService.save_transaction_analysis(
-                db=db,
-                transaction=transaction,
-                decision=decision,
-                confidence=confidence,
-                risk_score=aggregated_risk,
-                signals=all_signals[:10],
-                citations_internal=citations_internal,
-                citations_external=citations_external,
-                explanation_customer=explanation_customer,
-                explanation_audit=explanation_audit,
-                agent_route=" → ".join(agent_route),
-                processing_time_ms=processing_time
-            )
-        finally:
-            db.close()
+        # Decisión y caso HITL en una sola transacción (en modo write_behind solo se encola)
+        # En un hilo: el commit no bloquea el event loop
+        await asyncio.to_thread(persist_analysis, {
+            "transaction": transaction,
+            "decision": decision,
+            "confidence": confidence,
+            "risk_score": aggregated_risk,
+            "signals": all_signals[:10],
+            "citations_internal": citations_internal,
+            "citations_external": citations_external,
+            "explanation_customer": explanation_customer,
+            "explanation_audit": explanation_audit,
+            "agent_route": " → ".join(agent_route),
+            "processing_time_ms": processing_time,
+            "hitl_case": hitl_case,
+        })
         
         response = DecisionResponse(
             transaction_id=transaction.transaction_id,
@@ -426,6 +483,10 @@ async def analyze_transaction(request: TransactionAnalysisRequest, current_user:
         
         return response
         
+    except WriteBehindFullError as e:
+        # Backpressure: la cola de persistencia está llena
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        
     except Exception as e:
         print(f"\n   ❌ ERROR en el sistema multi-agente: {str(e)}")
         import traceback
@@ -460,6 +521,9 @@ async def analyze_transaction_stream(
     """
     Analiza una transacción con streaming de logs en tiempo real (SSE)
     """
+    # Cupo de análisis antes de abrir el stream (el rechazo llega como 429/503,
+    # no como un evento SSE); se libera al terminar o cortarse el stream
+    ticket = await get_admission_controller().acquire() if settings.ADMISSION_ENABLED else None
     
     async def event_generator():
         """Generador de eventos SSE"""
@@ -477,7 +541,8 @@ async def analyze_transaction_stream(
         log_event = {
                 "event_type": "phase",
                 "phase": "INICIO",
-                "message": f"Analizando transacción: {transaction.transaction_id}"
+                "message": f"Analizando transacción: {transaction.transaction_id}",
+                "timestamp": datetime.utcnow().isoformat()
             }
         analysis_logs.append(log_event)
         yield await StreamingService.emit_phase("INICIO", log_event["message"])
@@ -507,6 +572,8 @@ async def analyze_transaction_stream(
             citations_internal = []
             citations_external = []
             
+            # Los agentes corren en un hilo (asyncio.to_thread) para no bloquear el event loop
+            
             # Helper para log + yield
             async def log_and_emit(event_type, message, phase=None, agent=None, data=None):
                 analysis_logs.append({
@@ -514,7 +581,8 @@ async def analyze_transaction_stream(
                     "phase": phase,
                     "agent": agent,
                     "message": message,
-                    "data": data
+                    "data": data,
+                    "timestamp": datetime.utcnow().isoformat()
                 })
                 
                 if event_type == "phase":
@@ -531,7 +599,7 @@ async def analyze_transaction_stream(
             # FASE 1
             yield await log_and_emit("phase", "FASE 1: Análisis de Contexto", phase="FASE_1")
             context_agent = TransactionContextAgent()
-            context_result = context_agent.analyze(transaction, customer_behavior)
+            context_result = await asyncio.to_thread(context_agent.analyze, transaction, customer_behavior)
             agent_route.append(context_result.get("agent"))
             yield await log_and_emit(
                 "success",
@@ -542,7 +610,8 @@ async def analyze_transaction_stream(
             # FASE 2
             yield await log_and_emit("phase", "FASE 2: Análisis de Patrones", phase="FASE_2")
             behavioral_agent = BehavioralPatternAgent()
-            behavioral_result = behavioral_agent.analyze(
+            behavioral_result = await asyncio.to_thread(
+                behavioral_agent.analyze,
                 transaction, customer_behavior,
                 context_signals=context_result.get("signals", [])
             )
@@ -556,7 +625,8 @@ async def analyze_transaction_stream(
             # FASE 3
             yield await log_and_emit("phase", "FASE 3: Consulta de Políticas", phase="FASE_3")
             policy_agent = PolicyRAGAgent()
-            policy_result = policy_agent.analyze(
+            policy_result = await asyncio.to_thread(
+                policy_agent.analyze,
                 transaction, customer_behavior,
                 context_signals=context_result.get("signals", []),
                 behavioral_anomalies=behavioral_result.get("anomalies", [])
@@ -580,7 +650,8 @@ async def analyze_transaction_stream(
             # FASE 4
             yield await log_and_emit("phase", "FASE 4: Inteligencia de Amenazas", phase="FASE_4")
             threat_agent = ThreatIntelAgent()
-            threat_result = threat_agent.analyze(
+            threat_result = await asyncio.to_thread(
+                threat_agent.analyze,
                 transaction,
                 context_signals=context_result.get("signals", [])
             )
@@ -602,7 +673,8 @@ async def analyze_transaction_stream(
             # FASE 5
             yield await log_and_emit("phase", "FASE 5: Agregación de Evidencias", phase="FASE_5")
             evidence_agent = EvidenceAggregationAgent()
-            evidence_result = evidence_agent.analyze(
+            evidence_result = await asyncio.to_thread(
+                evidence_agent.analyze,
                 context_result, behavioral_result,
                 policy_result, threat_result
             )
@@ -619,7 +691,8 @@ async def analyze_transaction_stream(
             # FASE 6: Debate y Decisión
             yield await log_and_emit("phase", "FASE 6: Debate y Decisión", phase="FASE_6")
             debate_agents = DebateAgents()
-            debate_result = debate_agents.analyze(
+            debate_result = await asyncio.to_thread(
+                debate_agents.analyze,
                 transaction.transaction_id,
                 all_signals,
                 aggregated_risk,
@@ -664,11 +737,12 @@ async def analyze_transaction_stream(
                 (len(citations_external) > 0 and aggregated_risk > 0.7)
             )
             
+            hitl_case = None
             if should_escalate_to_hitl:
                 yield await log_and_emit("phase", "FASE 8: Escalando a HITL", phase="FASE_8")
                 from app.services.hitl_service import get_hitl_service
                 hitl_service = get_hitl_service()
-                hitl_case = hitl_service.create_case(
+                hitl_case = hitl_service.build_case(
                     transaction=transaction,
                     decision_recommendation=decision,
                     confidence=confidence,
@@ -676,7 +750,8 @@ async def analyze_transaction_stream(
                     citations_internal=citations_internal,
                     citations_external=citations_external,
                     agent_route=" → ".join(agent_route),
-                    created_by=current_user["username"]
+                    created_by=current_user["username"],
+                    risk_score=aggregated_risk
                 )
                 yield await log_and_emit("info", f"Caso HITL creado: {hitl_case.case_id}")
                 
@@ -686,37 +761,22 @@ async def analyze_transaction_stream(
             # Agregar tiempo de procesamiento a la explicación de auditoría
             explanation_audit += f" | Tiempo: {processing_time:.0f}ms"
             
-            # Persistir
-            db = next(get_db())
-            try:
-                # Guardar análisis
-                decision_db = PersistenceService.save_transaction_analysis(
-                    db=db, transaction=transaction, decision=decision,
-                    confidence=confidence, risk_score=aggregated_risk,
-                    signals=all_signals[:10], citations_internal=citations_internal,
-                    citations_external=citations_external,
-                    explanation_customer=explanation_customer,
-                    explanation_audit=explanation_audit,
-                    agent_route=" → ".join(agent_route),
-                    processing_time_ms=processing_time
-                )
-                
-                # Guardar logs de análisis
-                for log in analysis_logs:
-                    PersistenceService.save_analysis_log(
-                        db=db,
-                        decision_id=decision_db.id,
-                        event_type=log["event_type"],
-                        message=log["message"],
-                        phase=log.get("phase"),
-                        agent=log.get("agent"),
-                        event_data=log.get("data")
-                    )
-                
-                db.commit()
-                
-            finally:
-                db.close()
+            # Persistir análisis, logs y caso HITL (una sola transacción, o encolado en write_behind)
+            await asyncio.to_thread(persist_analysis, {
+                "transaction": transaction,
+                "decision": decision,
+                "confidence": confidence,
+                "risk_score": aggregated_risk,
+                "signals": all_signals[:10],
+                "citations_internal": citations_internal,
+                "citations_external": citations_external,
+                "explanation_customer": explanation_customer,
+                "explanation_audit": explanation_audit,
+                "agent_route": " → ".join(agent_route),
+                "processing_time_ms": processing_time,
+                "analysis_logs": list(analysis_logs),
+                "hitl_case": hitl_case,
+            })
             
             # Resultado final
             response_data = {
@@ -754,14 +814,24 @@ async def analyze_transaction_stream(
                 f"Error en análisis: {str(e)}"
             )
     
+    async def admitted_stream():
+        try:
+            async for event in event_generator():
+                yield event
+        finally:
+            if ticket is not None:
+                ticket.release()
+    
     return StreamingResponse(
-        event_generator(),
+        admitted_stream(),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "X-Accel-Buffering": "no"
-        }
+        },
+        # Si el stream nunca se itera (cliente desconectado antes de empezar)
+        background=BackgroundTask(ticket.release) if ticket is not None else None
     )
 
 # ============================================
@@ -779,12 +849,52 @@ async def startup_event():
     print(f"📚 ReDoc: http://localhost:8000/redoc")
     print("=" * 60)
 
+    readiness = get_readiness_service()
+    
     # Inicializar base de datos
-    init_db()
+    try:
+        init_db()
+        readiness.mark("database", ComponentStatus.READY)
+    except Exception as e:
+        readiness.mark("database", ComponentStatus.FAILED, error=str(e))
+        raise
+    
+    # Escritor write-behind (reprocesa el spool pendiente antes de drenar la cola)
+    if settings.PERSISTENCE_MODE == "write_behind":
+        get_write_behind_queue().start()
+    
+    # Warmup en segundo plano: /health responde de inmediato y /ready
+    # retorna 503 hasta que RAG, LLM, perfiles y feed estén inicializados
+    app.state.warmup_task = asyncio.create_task(asyncio.to_thread(readiness.warmup))
+    
+    # Retención: archivar periódicamente las decisiones fuera de la ventana activa
+    app.state.retention_task = None
+    if settings.RETENTION_ENABLED:
+        from app.services.retention_service import retention_loop
+        app.state.retention_task = asyncio.create_task(retention_loop(settings.RETENTION_INTERVAL_SECONDS))
+    
+    # Reservas HITL vencidas: vuelven a la cola aunque nadie haga claim ni revise
+    from app.services.hitl_service import lease_expiry_loop
+    app.state.lease_expiry_task = asyncio.create_task(lease_expiry_loop(settings.HITL_LEASE_SWEEP_SECONDS))
+    
+    # Rollups por minuto: solo se conserva la ventana que se sirve a esa resolución
+    from app.services.rollup_service import rollup_prune_loop
+    app.state.rollup_prune_task = asyncio.create_task(rollup_prune_loop(settings.ROLLUP_PRUNE_INTERVAL_SECONDS))
 
     
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Ejecutar al apagar la aplicación"""
-    print("👋 Cerrando aplicación...")
\ No newline at end of file
+    print("👋 Cerrando aplicación...")
+    
+    get_readiness_service().stop()
+    
+    for task_name in ("retention_task", "lease_expiry_task", "rollup_prune_task"):
+        if getattr(app.state, task_name, None) is not None:
+            getattr(app.state, task_name).cancel()
+    
+    if settings.PERSISTENCE_MODE == "write_behind":
+        await asyncio.to_thread(get_write_behind_queue().stop)
+    
+    await dispose_async_engine()
\ No newline at end of file
@@ -1,7 +1,7 @@
 """
 Modelos de datos base con Pydantic
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
@@ -92,13 +92,46 @@ class FraudPolicy(BaseModel):
     policy_id: str = Field(..., description="ID de la política")
     rule: str = Field(..., description="Descripción de la regla")
     version: str = Field(..., description="Versión de la política")
+    condition: Optional[str] = Field(None, description="Condición declarativa (ej: amount_ratio > 3 AND NOT in_usual_hours)")
+    action: Optional[DecisionType] = Field(None, description="Decisión recomendada cuando la condición se cumple")
+    channels: List[str] = Field(default_factory=lambda: ["*"], description="Canales donde aplica (* = todos)")
+    countries: List[str] = Field(default_factory=lambda: ["*"], description="Países donde aplica (* = todos)")
+    effective_from: Optional[str] = Field(None, description="Inicio de vigencia (YYYY-MM-DD)")
+    effective_to: Optional[str] = Field(None, description="Fin de vigencia (YYYY-MM-DD, opcional)")
+    status: str = Field(default="active", description="Estado: active, retired")
     
     class Config:
         json_schema_extra = {
             "example": {
                 "policy_id": "FP-01",
                 "rule": "Monto > 3x promedio habitual y horario fuera de rango → CHALLENGE",
-                "version": "2025.1"
+                "version": "2025.1",
+                "condition": "amount_ratio > 3 AND NOT in_usual_hours",
+                "action": "CHALLENGE",
+                "channels": ["*"],
+                "countries": ["*"],
+                "effective_from": "2025-01-01",
+                "effective_to": None,
+                "status": "active"
+            }
+        }
+
+
+class PolicyBackfillRequest(BaseModel):
+    """Request para evaluar una política sobre transacciones históricas"""
+    policy_id: Optional[str] = Field(None, description="ID de la política en fraud_policies.json")
+    version: Optional[str] = Field(None, description="Versión de la política (default: la más reciente)")
+    condition: Optional[str] = Field(None, description="Condición ad-hoc (reemplaza la de la política)")
+    date_from: Optional[datetime] = Field(None, description="Desde (inclusive)")
+    date_to: Optional[datetime] = Field(None, description="Hasta (exclusivo)")
+    chunk_size: int = Field(default=5000, ge=100, le=100000, description="Transacciones por bloque")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "policy_id": "FP-01",
+                "date_from": "2025-01-01T00:00:00",
+                "date_to": "2026-01-01T00:00:00"
             }
         }
 
@@ -208,6 +241,7 @@ class HITLStatus(str, PyEnum):
     APPROVED = "APPROVED"
     REJECTED = "REJECTED"
     IN_REVIEW = "IN_REVIEW"
+    CLAIMED = "CLAIMED"
 
 
 class HITLCase(BaseModel):
@@ -227,6 +261,9 @@ class HITLCase(BaseModel):
     reviewer_decision: Optional[DecisionType] = None
     reviewer_notes: Optional[str] = None
     reviewed_at: Optional[datetime] = None
+    risk_score: Optional[float] = None
+    claimed_by: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
     
     class Config:
         json_schema_extra = {
@@ -266,6 +303,39 @@ class HITLReviewRequest(BaseModel):
             }
         }
 
+class HITLBulkReviewFilter(BaseModel):
+    """Filtro de casos pendientes para revisión masiva"""
+    merchant_id: Optional[str] = None
+    customer_id: Optional[str] = None
+    country: Optional[str] = None
+    decision_recommendation: Optional[DecisionType] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+
+
+class HITLBulkReviewRequest(BaseModel):
+    """Request para revisar varios casos HITL con una misma decisión"""
+    case_ids: Optional[List[str]] = Field(None, description="Casos a revisar (o usar filter)")
+    filter: Optional[HITLBulkReviewFilter] = Field(None, description="Filtro sobre casos pendientes")
+    decision: DecisionType = Field(..., description="Decisión del revisor")
+    notes: Optional[str] = Field(None, description="Notas del revisor")
+    max_cases: int = Field(1000, ge=1, le=5000, description="Máximo de casos afectados")
+    
+    @model_validator(mode="after")
+    def check_target(self):
+        if bool(self.case_ids) == bool(self.filter):
+            raise ValueError("Indique case_ids o filter (solo uno)")
+        return self
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "filter": {"merchant_id": "M-002"},
+                "decision": "BLOCK",
+                "notes": "Comercio comprometido (incidente INC-123)"
+            }
+        }
+
 """ 
 class HITLCaseResponse(BaseModel):
     
@@ -0,0 +1,226 @@
+"""
+Admission Service - Control de admisión de los endpoints de análisis
+Limita los análisis simultáneos por proceso (cada uno dispara varias llamadas
+al LLM). Las requests que exceden el cupo esperan en una cola acotada con un
+presupuesto de espera; si la cola está llena o el presupuesto se agota se
+rechazan de inmediato con Retry-After en lugar de degradar a todas las demás.
+"""
+from collections import deque
+from app.config import get_settings
+from typing import Deque, Dict, Optional
+import asyncio
+import math
+import threading
+import time
+
+
+# Ventana de tiempos de espera para los percentiles de /metrics/admission
+WAIT_SAMPLES = 1000
+# Suavizado del tiempo medio de servicio (estimación de Retry-After)
+SERVICE_TIME_ALPHA = 0.2
+
+
+class AdmissionRejectedError(Exception):
+    """Request rechazada por el control de admisión (429 cola llena, 503 espera agotada)"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """Cupo concedido; release es idempotente (se puede llamar desde varios caminos)"""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(time.monotonic() - self._admitted_at)
+
+
+class AdmissionController:
+    """Semáforo con cola FIFO acotada y presupuesto de espera (un event loop por proceso)"""
+
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 32, queue_timeout_ms: int = 2000,
+                 retry_after_max_seconds: int = 30):
+        """
+        Inicializar controlador
+
+        Args:
+            max_concurrent: Análisis en curso permitidos
+            max_queue: Requests que pueden esperar un cupo (0 = rechazar sin esperar)
+            queue_timeout_ms: Espera máxima en la cola antes de rechazar con 503
+            retry_after_max_seconds: Tope del Retry-After sugerido
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_ms = queue_timeout_ms
+        self.retry_after_max_seconds = retry_after_max_seconds
+
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._waits_ms: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._service_time_s: Optional[float] = None
+
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.abandoned = 0
+        self.max_queue_depth = 0
+
+    def _retry_after(self) -> int:
+        """Segundos estimados hasta que se libere un cupo para toda la cola actual"""
+        service_time = self._service_time_s or 1.0
+        estimate = service_time * (len(self._waiters) + 1) / self.max_concurrent
+        return max(1, min(self.retry_after_max_seconds, math.ceil(estimate)))
+
+    async def acquire(self) -> AdmissionTicket:
+        """
+        Obtener un cupo (esperando en la cola si hace falta)
+
+        Raises:
+            AdmissionRejectedError: 429 si la cola está llena, 503 si se agota la espera
+        """
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            return self._admit(0.0)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejectedError(
+                429, "Demasiados análisis en curso; reintente más tarde", self._retry_after()
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        queued_at = time.monotonic()
+
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # El cupo llegó junto con el timeout: devolverlo
+                self._release(None)
+            else:
+                self._discard(waiter)
+            self.rejected_timeout += 1
+            self._waits_ms.append((time.monotonic() - queued_at) * 1000)
+            raise AdmissionRejectedError(
+                503, "Tiempo de espera por un cupo de análisis agotado", self._retry_after()
+            )
+        except asyncio.CancelledError:
+            # Cliente desconectado: devolver el cupo si ya se había concedido
+            if waiter.done() and not waiter.cancelled():
+                self._release(None)
+            else:
+                self._discard(waiter)
+            self.abandoned += 1
+            raise
+
+        # El cupo lo transfiere _release (active no cambia)
+        return self._admit((time.monotonic() - queued_at) * 1000)
+
+    def _admit(self, wait_ms: float) -> AdmissionTicket:
+        self.admitted += 1
+        self._waits_ms.append(wait_ms)
+        return AdmissionTicket(self)
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release(self, held_seconds: Optional[float]):
+        """Liberar un cupo: pasarlo al primer request en espera o reducir los activos"""
+        if held_seconds is not None:
+            if self._service_time_s is None:
+                self._service_time_s = held_seconds
+            else:
+                self._service_time_s += SERVICE_TIME_ALPHA * (held_seconds - self._service_time_s)
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self._active -= 1
+
+    def snapshot(self) -> Dict:
+        """Métricas actuales (profundidad de cola, tiempos de espera y rechazos)"""
+        waits = sorted(self._waits_ms)
+
+        def percentile(p: float) -> Optional[float]:
+            if not waits:
+                return None
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 2)
+
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout_ms": self.queue_timeout_ms,
+            "active": self._active,
+            "queue_depth": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "admitted_total": self.admitted,
+            "rejected_total": {
+                "queue_full": self.rejected_queue_full,
+                "timeout": self.rejected_timeout,
+            },
+            "abandoned_total": self.abandoned,
+            "wait_ms": {
+                "samples": len(waits),
+                "avg": round(sum(waits) / len(waits), 2) if waits else None,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": round(waits[-1], 2) if waits else None,
+            },
+            "service_time_ms_avg": round(self._service_time_s * 1000, 2) if self._service_time_s is not None else None,
+            "retry_after_seconds": self._retry_after(),
+        }
+
+
+# ============================================
+# INSTANCIA GLOBAL
+# ============================================
+
+_admission_controller = None
+_admission_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Obtener el controlador de admisión de los endpoints de análisis"""
+    global _admission_controller
+    if _admission_controller is None:
+        with _admission_controller_lock:
+            if _admission_controller is None:
+                settings = get_settings()
+                _admission_controller = AdmissionController(
+                    max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+                    max_queue=settings.ADMISSION_MAX_QUEUE,
+                    queue_timeout_ms=settings.ADMISSION_QUEUE_TIMEOUT_MS,
+                    retry_after_max_seconds=settings.ADMISSION_RETRY_AFTER_MAX_SECONDS,
+                )
+    return _admission_controller
+
+
+async def admit_analysis():
+    """Dependencia FastAPI: un cupo de análisis durante toda la request (no usar con streaming)"""
+    if not get_settings().ADMISSION_ENABLED:
+        yield None
+        return
+
+    ticket = await get_admission_controller().acquire()
+    try:
+        yield ticket
+    finally:
+        ticket.release()
@@ -0,0 +1,289 @@
+"""
+Export Service - Exportación masiva de decisiones en streaming
+Las filas se leen con un cursor del servidor (yield_per) y se codifican por
+bloques, así la memoria no crece con el tamaño de la exportación.
+"""
+from sqlalchemy import select
+from app.database.models import FraudDecisionDB, TransactionDB, DecisionTypeEnum
+from datetime import datetime
+from typing import Iterator, List, Optional
+import csv
+import io
+import json
+import zlib
+
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# formato: (media type, extensión)
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+EXPORT_COLUMNS = [
+    FraudDecisionDB.id.label("decision_id"),
+    FraudDecisionDB.transaction_id,
+    FraudDecisionDB.customer_id,
+    FraudDecisionDB.decision,
+    FraudDecisionDB.confidence,
+    FraudDecisionDB.risk_score,
+    FraudDecisionDB.processing_time_ms,
+    FraudDecisionDB.agent_route,
+    FraudDecisionDB.created_at,
+    TransactionDB.amount,
+    TransactionDB.currency,
+    TransactionDB.country,
+    TransactionDB.channel,
+    TransactionDB.merchant_id,
+    TransactionDB.device_id,
+    TransactionDB.transaction_timestamp,
+]
+COLUMN_NAMES = [column.key for column in EXPORT_COLUMNS]
+
+
+def _serialize(value):
+    """Valor exportable (fechas ISO 8601, enums por valor)"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return getattr(value, "value", value)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Destino de escritura que acumula bytes hasta que se drenan (para Parquet)"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ExportService:
+    """Servicio de exportación de decisiones (NDJSON, CSV o Parquet)"""
+
+    @staticmethod
+    def _query(
+        date_from: datetime = None,
+        date_to: datetime = None,
+        decision: str = None,
+        customer_id: str = None
+    ):
+        """SELECT de decisiones con su transacción en orden estable (created_at, id)"""
+        query = select(*EXPORT_COLUMNS).join(
+            TransactionDB, TransactionDB.transaction_id == FraudDecisionDB.transaction_id
+        )
+
+        if date_from:
+            query = query.where(FraudDecisionDB.created_at >= date_from)
+        if date_to:
+            query = query.where(FraudDecisionDB.created_at < date_to)
+        if decision:
+            if decision.upper() not in DecisionTypeEnum.__members__:
+                raise ValueError(f"Decisión inválida: {decision}")
+            query = query.where(FraudDecisionDB.decision == DecisionTypeEnum[decision.upper()])
+        if customer_id:
+            query = query.where(FraudDecisionDB.customer_id == customer_id)
+
+        return query.order_by(FraudDecisionDB.created_at.asc(), FraudDecisionDB.id.asc())
+
+    @staticmethod
+    def _batches(query, chunk_size: int) -> Iterator[List]:
+        """Leer el resultado por bloques con una sesión de lectura propia (cursor del servidor)"""
+        from app.database.connection import ReadSessionLocal
+
+        db = ReadSessionLocal()
+        try:
+            result = db.execute(query.execution_options(yield_per=chunk_size))
+            for partition in result.partitions():
+                yield partition
+        finally:
+            db.close()
+
+    @staticmethod
+    def _encode_ndjson(batches: Iterator[List]) -> Iterator[bytes]:
+        """Una línea JSON por fila"""
+        for batch in batches:
+            yield "".join(
+                json.dumps(dict(zip(COLUMN_NAMES, map(_serialize, row))), ensure_ascii=False) + "\n"
+                for row in batch
+            ).encode("utf-8")
+
+    @staticmethod
+    def _encode_csv(batches: Iterator[List]) -> Iterator[bytes]:
+        """CSV con encabezado"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMN_NAMES)
+
+        for batch in batches:
+            writer.writerows([_serialize(value) for value in row] for row in batch)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+
+        # Encabezado aunque no haya filas
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    @staticmethod
+    def _encode_parquet(batches: Iterator[List]) -> Iterator[bytes]:
+        """Parquet con un row group por bloque (columnar, comprimido con zstd)"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([
+            ("decision_id", pa.int64()),
+            ("transaction_id", pa.string()),
+            ("customer_id", pa.string()),
+            ("decision", pa.string()),
+            ("confidence", pa.float64()),
+            ("risk_score", pa.float64()),
+            ("processing_time_ms", pa.float64()),
+            ("agent_route", pa.string()),
+            ("created_at", pa.timestamp("us")),
+            ("amount", pa.float64()),
+            ("currency", pa.string()),
+            ("country", pa.string()),
+            ("channel", pa.string()),
+            ("merchant_id", pa.string()),
+            ("device_id", pa.string()),
+            ("transaction_timestamp", pa.timestamp("us")),
+        ])
+
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        try:
+            for batch in batches:
+                columns = zip(*batch)
+                writer.write_table(pa.Table.from_arrays(
+                    [
+                        pa.array([getattr(value, "value", value) for value in column], type=field.type)
+                        for field, column in zip(schema, columns)
+                    ],
+                    schema=schema
+                ))
+                yield sink.drain()
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    @staticmethod
+    def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Comprimir el stream como un único miembro gzip"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    @staticmethod
+    def stream_decisions(
+        format: str = "ndjson",
+        gzip: bool = False,
+        date_from: datetime = None,
+        date_to: datetime = None,
+        decision: str = None,
+        customer_id: str = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """
+        Exportar decisiones como un iterador de bytes
+
+        Los parámetros se validan al llamar (antes de abrir la sesión); la
+        lectura empieza al consumir el iterador.
+
+        Args:
+            format: ndjson, csv o parquet
+            gzip: Comprimir el stream (solo ndjson y csv; parquet ya va comprimido)
+            date_from: Inicio del rango de created_at (inclusive, opcional)
+            date_to: Fin del rango de created_at (exclusivo, opcional)
+            decision: Filtrar por tipo de decisión (opcional)
+            customer_id: Filtrar por cliente (opcional)
+            chunk_size: Filas leídas y codificadas por bloque
+
+        Returns:
+            Iterador de bloques de bytes
+
+        Raises:
+            ValueError: Si el formato o los filtros son inválidos
+        """
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Formato inválido: {format} (use {', '.join(EXPORT_FORMATS)})")
+        if format == "parquet":
+            if gzip:
+                raise ValueError("gzip no aplica a parquet (ya va comprimido)")
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ValueError("La exportación parquet requiere pyarrow (pip install pyarrow)")
+
+        query = ExportService._query(date_from, date_to, decision, customer_id)
+        batches = ExportService._batches(query, max(1, chunk_size))
+        encoder = {
+            "ndjson": ExportService._encode_ndjson,
+            "csv": ExportService._encode_csv,
+            "parquet": ExportService._encode_parquet,
+        }[format]
+
+        chunks = encoder(batches)
+        return ExportService._gzip(chunks) if gzip else chunks
+
+    @staticmethod
+    def filename(format: str, gzip: bool = False, date_from: Optional[datetime] = None) -> str:
+        """Nombre de archivo sugerido para la exportación"""
+        stamp = (date_from or datetime.utcnow()).strftime("%Y%m%d")
+        name = f"decisions-{stamp}.{EXPORT_FORMATS[format][1]}"
+        return f"{name}.gz" if gzip else name
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.services.export_service --format csv --date-from 2025-01-01 --date-to 2025-01-02 -o extract.csv
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Exportar decisiones")
+    parser.add_argument("--format", default="ndjson", choices=list(EXPORT_FORMATS))
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--date-from", type=datetime.fromisoformat)
+    parser.add_argument("--date-to", type=datetime.fromisoformat)
+    parser.add_argument("--decision")
+    parser.add_argument("--customer-id")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("-o", "--output", default="-", help="Archivo destino (- para stdout)")
+    args = parser.parse_args()
+
+    stream = ExportService.stream_decisions(
+        format=args.format,
+        gzip=args.gzip,
+        date_from=args.date_from,
+        date_to=args.date_to,
+        decision=args.decision,
+        customer_id=args.customer_id,
+        chunk_size=args.chunk_size,
+    )
+
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in stream:
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
@@ -1,12 +1,110 @@
 """
 Human-in-the-Loop Service
 """
-from typing import List, Dict, Optional
-from datetime import datetime
+from sqlalchemy import update, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime, timedelta
+from app.config import get_settings
 from app.models.schemas import (
     Transaction, DecisionType, HITLCase, HITLStatus,
     InternalCitation, ExternalCitation
 )
+from app.services.statistics_service import StatisticsService
+from app.services.search_service import SearchService
+from app.services import statistics_service as statistics
+from app.utils.pagination import encode_cursor, decode_cursor
+import asyncio
+import math
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+SORT_OPTIONS = ("oldest", "newest", "priority")
+CLAIM_CANDIDATES = 5
+CLAIM_ATTEMPTS = 3
+PRIORITY_EPOCH = datetime(2025, 1, 1)
+
+
+def compute_priority_key(confidence: float, amount: float, risk_score: Optional[float], created_at) -> float:
+    """
+    Clave de prioridad de un caso (mayor = más urgente)
+    
+    El peso por antigüedad crece igual para todos los casos con el tiempo, así
+    que ordenar por score + W_AGE * horas_espera equivale a ordenar por
+    score - W_AGE * horas(created_at): la clave es fija y se puede indexar.
+    """
+    settings = get_settings()
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    
+    score = (
+        (risk_score or 0.0) * settings.HITL_PRIORITY_WEIGHT_RISK
+        + math.log10(max(amount or 0.0, 0.0) + 1) * settings.HITL_PRIORITY_WEIGHT_AMOUNT
+        + (confidence or 0.0) * settings.HITL_PRIORITY_WEIGHT_CONFIDENCE
+    )
+    created_hours = (created_at - PRIORITY_EPOCH).total_seconds() / 3600
+    return score - settings.HITL_PRIORITY_WEIGHT_AGE * created_hours
+
+
+def backfill_priority_keys(db) -> int:
+    """Calcular priority_key de casos creados antes de la cola priorizada"""
+    from app.database.models import HITLCaseDB, TransactionDB
+    
+    rows = db.query(
+        HITLCaseDB.case_id, HITLCaseDB.confidence, HITLCaseDB.risk_score,
+        HITLCaseDB.created_at, TransactionDB.amount
+    ).outerjoin(
+        TransactionDB, TransactionDB.transaction_id == HITLCaseDB.transaction_id
+    ).filter(HITLCaseDB.priority_key.is_(None)).all()
+    
+    if not rows:
+        return 0
+    
+    db.execute(update(HITLCaseDB), [
+        {
+            "case_id": row.case_id,
+            "priority_key": compute_priority_key(
+                row.confidence, row.amount, row.risk_score, row.created_at or datetime.utcnow()
+            )
+        }
+        for row in rows
+    ])
+    db.commit()
+    print(f"   ✅ Prioridad calculada para {len(rows)} casos HITL")
+    return len(rows)
+
+
+def backfill_claimed_status(db) -> int:
+    """Pasar a CLAIMED las reservas guardadas como IN_REVIEW antes de existir ese estado"""
+    from app.database.models import HITLCaseDB, HITLStatusEnum
+    
+    result = db.execute(
+        update(HITLCaseDB)
+        .where(
+            HITLCaseDB.status == HITLStatusEnum.IN_REVIEW,
+            HITLCaseDB.reviewer_decision.is_(None),
+            HITLCaseDB.lease_expires_at.isnot(None)
+        )
+        .values(status=HITLStatusEnum.CLAIMED)
+    )
+    if result.rowcount:
+        StatisticsService.increment(db, {
+            statistics.hitl_key(HITLStatusEnum.IN_REVIEW): -result.rowcount,
+            statistics.hitl_key(HITLStatusEnum.CLAIMED): result.rowcount,
+        })
+    db.commit()
+    if result.rowcount:
+        print(f"   ✅ {result.rowcount} reservas HITL migradas a CLAIMED")
+    return result.rowcount
+
+
+def _session(db=None):
+    """Sesión del llamador (p. ej. la de AsyncSession.run_sync) o una propia que se cierra al terminar"""
+    if db is not None:
+        return db, False
+    from app.database.connection import SessionLocal
+    return SessionLocal(), True
 
 
 class HITLService:
@@ -17,16 +115,10 @@ class HITLService:
         pass
     
     def _get_next_case_id(self) -> str:
-        """Generar el siguiente ID de caso basado en la BD"""
-        from app.database.connection import get_db
-        from app.database.models import HITLCaseDB
+        """Generar el siguiente ID de caso (secuencia atómica, sin COUNT)"""
+        from app.services.id_sequence_service import get_case_id_sequence
         
-        db = next(get_db())
-        try:
-            count = db.query(HITLCaseDB).count()
-            return f"HITL-{count + 1:05d}"
-        finally:
-            db.close()
+        return f"HITL-{get_case_id_sequence().next_value():05d}"
     
     def create_case(
         self,
@@ -37,7 +129,9 @@ class HITLService:
         citations_internal: List,
         citations_external: List,
         agent_route: str,
-        created_by: str = None
+        created_by: str = None,
+        risk_score: float = None,
+        db=None
     ) -> HITLCase:
         """
         Crear un nuevo caso HITL
@@ -51,14 +145,13 @@ class HITLService:
             citations_external: Citaciones externas
             agent_route: Ruta de agentes ejecutados
             created_by: Usuario que generó la transacción (opcional)
+            risk_score: Riesgo agregado (se usa para priorizar la cola)
+            db: Sesión del llamador (el caso se agrega sin commit); None usa una sesión propia
         
         Returns:
             Caso HITL creado
         """
-        case_id = self._get_next_case_id()
-        
-        case = HITLCase(
-            case_id=case_id,
+        case = self.build_case(
             transaction=transaction,
             decision_recommendation=decision_recommendation,
             confidence=confidence,
@@ -67,34 +160,91 @@ class HITLService:
             citations_external=citations_external,
             agent_route=agent_route,
             created_by=created_by,
-            created_at=datetime.now().isoformat(),
-            status=HITLStatus.PENDING
+            risk_score=risk_score
         )
         
         # Persistir en base de datos
-        self._persist_case(case)
+        if db is not None:
+            self.add_cases(db, [case])
+        else:
+            self._persist_case(case)
         
-        print(f"   ✅ Caso HITL creado: {case_id}")
+        print(f"   ✅ Caso HITL creado: {case.case_id}")
         
         return case
     
+    def build_case(
+        self,
+        transaction: Transaction,
+        decision_recommendation: DecisionType,
+        confidence: float,
+        signals: List[str],
+        citations_internal: List,
+        citations_external: List,
+        agent_route: str,
+        created_by: str = None,
+        risk_score: float = None
+    ) -> HITLCase:
+        """
+        Armar un caso HITL con su ID sin persistirlo
+        
+        Se guarda después con add_cases dentro de la transacción del análisis
+        (ver PersistenceService.save_transaction_analyses, clave "hitl_case").
+        """
+        return HITLCase(
+            case_id=self._get_next_case_id(),
+            transaction=transaction,
+            decision_recommendation=decision_recommendation,
+            confidence=confidence,
+            signals=signals,
+            citations_internal=citations_internal,
+            citations_external=citations_external,
+            agent_route=agent_route,
+            created_by=created_by,
+            created_at=datetime.utcnow().isoformat(),
+            status=HITLStatus.PENDING,
+            risk_score=risk_score
+        )
+    
+    def add_cases(self, db, cases: List[HITLCase]):
+        """Insertar casos HITL y sus contadores en la sesión dada (sin commit)"""
+        from sqlalchemy import insert
+        from app.database.models import HITLCaseDB, DecisionTypeEnum, HITLStatusEnum
+        
+        if not cases:
+            return
+        
+        rows = []
+        for case in cases:
+            rows.append({
+                "case_id": case.case_id,
+                "transaction_id": case.transaction.transaction_id,
+                "decision_recommendation": DecisionTypeEnum[case.decision_recommendation.value],
+                "confidence": case.confidence,
+                "status": HITLStatusEnum[case.status.value],
+                "agent_route": case.agent_route,
+                "created_by": case.created_by,
+                "created_at": case.created_at,
+                "risk_score": case.risk_score,
+                "priority_key": compute_priority_key(
+                    case.confidence, case.transaction.amount, case.risk_score, case.created_at
+                ),
+            })
+        db.execute(insert(HITLCaseDB), rows)
+        
+        deltas = {statistics.HITL_TOTAL: len(rows), statistics.HITL_QUEUE_VERSION: 1}
+        for row in rows:
+            key = statistics.hitl_key(row["status"])
+            deltas[key] = deltas.get(key, 0) + 1
+        StatisticsService.increment(db, deltas)
+    
     def _persist_case(self, case: HITLCase):
-        """Persistir caso HITL en base de datos"""
+        """Persistir caso HITL en base de datos (sesión propia)"""
         from app.database.connection import get_db
-        from app.database.models import HITLCaseDB, DecisionTypeEnum, HITLStatusEnum
         
         db = next(get_db())
         try:
-            hitl_case_db = HITLCaseDB(
-                case_id=case.case_id,
-                transaction_id=case.transaction.transaction_id,
-                decision_recommendation=DecisionTypeEnum[case.decision_recommendation.value],
-                confidence=case.confidence,
-                status=HITLStatusEnum[case.status.value],
-                agent_route=case.agent_route,
-                created_by=case.created_by
-            )
-            db.add(hitl_case_db)
+            self.add_cases(db, [case])
             db.commit()
             print(f"   💾 Caso HITL guardado en BD: {case.case_id}")
         except Exception as e:
@@ -103,8 +253,8 @@ class HITLService:
         finally:
             db.close()
     
-    def get_pending_cases(self) -> List[HITLCase]:
-        """Obtener casos pendientes desde la BD"""
+    def get_pending_cases(self, include_details: bool = True) -> List[HITLCase]:
+        """Obtener casos pendientes desde la BD (include_details=False omite señales y citaciones)"""
         from app.database.connection import get_db
         from app.database.models import HITLCaseDB, HITLStatusEnum, TransactionDB
         
@@ -114,11 +264,11 @@ class HITLService:
                 HITLCaseDB.status == HITLStatusEnum.PENDING
             ).all()
             
-            return self._convert_cases_to_schema(cases_db, db)
+            return self._convert_cases_to_schema(cases_db, db, include_details)
         finally:
             db.close()
     
-    def get_all_cases(self, status: Optional[HITLStatus] = None) -> List[HITLCase]:
+    def get_all_cases(self, status: Optional[HITLStatus] = None, include_details: bool = True) -> List[HITLCase]:
         """Obtener todos los casos (opcionalmente filtrados por estado)"""
         from app.database.connection import get_db
         from app.database.models import HITLCaseDB, HITLStatusEnum
@@ -131,16 +281,118 @@ class HITLService:
                 query = query.filter(HITLCaseDB.status == HITLStatusEnum[status.value])
             
             cases_db = query.all()
-            return self._convert_cases_to_schema(cases_db, db)
+            return self._convert_cases_to_schema(cases_db, db, include_details)
         finally:
             db.close()
     
-    def get_case(self, case_id: str) -> Optional[HITLCase]:
+    def list_cases(
+        self,
+        status: Optional[HITLStatus] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        sort: str = "oldest",
+        include_details: bool = False,
+        db=None
+    ) -> Tuple[List[HITLCase], Optional[str]]:
+        """
+        Obtener una página de casos con paginación keyset (created_at, case_id)
+        
+        Args:
+            status: Filtrar por estado (opcional)
+            limit: Tamaño de página (máximo MAX_PAGE_SIZE)
+            cursor: Cursor de la página anterior (None para la primera)
+            sort: oldest (más antiguos primero), newest o priority (más urgentes primero)
+            include_details: Cargar señales y citaciones
+            db: Sesión del llamador (opcional; None abre una propia)
+        
+        Returns:
+            (casos de la página, cursor de la siguiente página o None)
+        
+        Raises:
+            ValueError: Si el cursor o sort son inválidos
+        """
+        from app.database.models import HITLCaseDB, HITLStatusEnum
+        
+        if sort not in SORT_OPTIONS:
+            raise ValueError(f"sort inválido: {sort} (use {' o '.join(SORT_OPTIONS)})")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        descending = sort == "newest"
+        
+        db, owned = _session(db)
+        try:
+            query = db.query(HITLCaseDB)
+            
+            if status:
+                query = query.filter(HITLCaseDB.status == HITLStatusEnum[status.value])
+            
+            if cursor:
+                position = decode_cursor(cursor)
+                try:
+                    case_id = position["case_id"]
+                    if sort == "priority":
+                        priority_key = float(position["priority_key"])
+                    else:
+                        created_at = datetime.fromisoformat(position["created_at"])
+                except (KeyError, TypeError, ValueError):
+                    raise ValueError("Cursor inválido")
+                
+                if sort == "priority":
+                    query = query.filter(or_(
+                        HITLCaseDB.priority_key < priority_key,
+                        and_(HITLCaseDB.priority_key == priority_key, HITLCaseDB.case_id > case_id)
+                    ))
+                elif descending:
+                    query = query.filter(or_(
+                        HITLCaseDB.created_at < created_at,
+                        and_(HITLCaseDB.created_at == created_at, HITLCaseDB.case_id < case_id)
+                    ))
+                else:
+                    query = query.filter(or_(
+                        HITLCaseDB.created_at > created_at,
+                        and_(HITLCaseDB.created_at == created_at, HITLCaseDB.case_id > case_id)
+                    ))
+            
+            if sort == "priority":
+                query = query.filter(HITLCaseDB.priority_key.isnot(None)).order_by(
+                    HITLCaseDB.priority_key.desc(), HITLCaseDB.case_id.asc()
+                )
+            elif descending:
+                query = query.order_by(HITLCaseDB.created_at.desc(), HITLCaseDB.case_id.desc())
+            else:
+                query = query.order_by(HITLCaseDB.created_at.asc(), HITLCaseDB.case_id.asc())
+            
+            cases_db = query.limit(limit + 1).all()
+            
+            next_cursor = None
+            if len(cases_db) > limit:
+                cases_db = cases_db[:limit]
+                last = cases_db[-1]
+                next_cursor = encode_cursor({
+                    "created_at": last.created_at.isoformat(),
+                    "priority_key": last.priority_key,
+                    "case_id": last.case_id
+                })
+            
+            return self._convert_cases_to_schema(cases_db, db, include_details), next_cursor
+        finally:
+            if owned:
+                db.close()
+    
+    def get_queue_version(self, db=None) -> int:
+        """Versión actual de la cola (cambia con cada alta o revisión de casos)"""
+        
+        db, owned = _session(db)
+        try:
+            return StatisticsService.get_counters(db, [statistics.HITL_QUEUE_VERSION])[statistics.HITL_QUEUE_VERSION]
+        finally:
+            if owned:
+                db.close()
+    
+    def get_case(self, case_id: str, db=None) -> Optional[HITLCase]:
         """Obtener un caso específico desde la BD"""
-        from app.database.connection import get_db
         from app.database.models import HITLCaseDB
         
-        db = next(get_db())
+        db, owned = _session(db)
         try:
             case_db = db.query(HITLCaseDB).filter(
                 HITLCaseDB.case_id == case_id
@@ -152,14 +404,16 @@ class HITLService:
             cases = self._convert_cases_to_schema([case_db], db)
             return cases[0] if cases else None
         finally:
-            db.close()
+            if owned:
+                db.close()
     
     def review_case(
         self,
         case_id: str,
         reviewer_id: str,
         decision: DecisionType,
-        notes: str = None
+        notes: str = None,
+        db=None
     ) -> HITLCase:
         """
         Revisar y resolver un caso HITL
@@ -169,15 +423,15 @@ class HITLService:
             reviewer_id: ID del revisor
             decision: Decisión final del revisor
             notes: Notas de la revisión
+            db: Sesión del llamador (opcional; None abre una propia)
         
         Returns:
             Caso actualizado
         """
-        from app.database.connection import get_db
         from app.database.models import HITLCaseDB, DecisionTypeEnum, HITLStatusEnum
         from datetime import datetime as dt
         
-        db = next(get_db())
+        db, owned = _session(db)
         try:
             case_db = db.query(HITLCaseDB).filter(
                 HITLCaseDB.case_id == case_id
@@ -186,23 +440,47 @@ class HITLService:
             if not case_db:
                 raise ValueError(f"Caso {case_id} no encontrado")
             
-            if case_db.status != HITLStatusEnum.PENDING:
-                raise ValueError(f"Caso {case_id} ya fue revisado")
-            
-            # Actualizar caso
-            case_db.reviewer_id = reviewer_id
-            case_db.reviewer_decision = DecisionTypeEnum[decision.value]
-            case_db.reviewer_notes = notes
-            case_db.reviewed_at = dt.now()
-            
             # Determinar estado final
             if decision == DecisionType.APPROVE:
-                case_db.status = HITLStatusEnum.APPROVED
+                new_status = HITLStatusEnum.APPROVED
             elif decision == DecisionType.BLOCK:
-                case_db.status = HITLStatusEnum.REJECTED
+                new_status = HITLStatusEnum.REJECTED
             else:
-                case_db.status = HITLStatusEnum.IN_REVIEW
+                new_status = HITLStatusEnum.IN_REVIEW
+            
+            # Las reservas vencidas vuelven a PENDING antes de revisar
+            self._release_expired_leases(db)
+            
+            # Actualización condicional por estado de origen: el caso debe seguir
+            # pendiente o estar reservado (CLAIMED) por este mismo revisor; el
+            # UPDATE que afecta la fila indica el estado previo real
+            previous_status = None
+            for status, condition in self._reviewable_conditions(reviewer_id):
+                result = db.execute(
+                    update(HITLCaseDB)
+                    .where(HITLCaseDB.case_id == case_id, condition)
+                    .values(
+                        reviewer_id=reviewer_id,
+                        reviewer_decision=DecisionTypeEnum[decision.value],
+                        reviewer_notes=notes,
+                        reviewed_at=dt.now(),
+                        status=new_status,
+                        claimed_by=reviewer_id,
+                        lease_expires_at=None
+                    )
+                )
+                if result.rowcount:
+                    previous_status = status
+                    break
             
+            if previous_status is None:
+                db.rollback()
+                if case_db.status == HITLStatusEnum.CLAIMED:
+                    raise ValueError(f"Caso {case_id} está reservado por {case_db.claimed_by}")
+                raise ValueError(f"Caso {case_id} ya fue revisado")
+            
+            StatisticsService.hitl_transition(db, previous_status, new_status)
+            SearchService.index_hitl_cases(db, [case_id])
             db.commit()
             db.refresh(case_db)
             
@@ -216,89 +494,422 @@ class HITLService:
             db.rollback()
             raise e
         finally:
-            db.close()
+            if owned:
+                db.close()
     
-    def _convert_cases_to_schema(self, cases_db: list, db) -> List[HITLCase]:
-        """Convertir casos de BD a schema HITLCase con información completa"""
-        from app.database.models import (
-            TransactionDB, CustomerDB, CountryDB, 
-            ChannelDB, MerchantDB, FraudDecisionDB,
-            SignalDB, InternalCitationDB, ExternalCitationDB
-        )
+    def bulk_review(
+        self,
+        reviewer_id: str,
+        decision: DecisionType,
+        notes: str = None,
+        case_ids: Optional[List[str]] = None,
+        filters: Optional[Dict] = None,
+        max_cases: int = 1000,
+        db=None
+    ) -> Dict:
+        """
+        Revisar varios casos con una misma decisión en una sola transacción
         
-        result = []
+        Los casos se resuelven con un único UPDATE; solo se modifican los que
+        siguen pendientes o están reservados (CLAIMED) por este revisor.
         
-        for case_db in cases_db:
-            # Obtener transacción con JOINS
-            transaction_query = db.query(
-                TransactionDB,
-                CustomerDB,
-                CountryDB,
-                ChannelDB,
-                MerchantDB
-            ).join(
-                CustomerDB,
-                TransactionDB.customer_id == CustomerDB.customer_id
-            ).join(
-                CountryDB,
-                TransactionDB.country == CountryDB.code
-            ).join(
-                ChannelDB,
-                TransactionDB.channel == ChannelDB.code
-            ).join(
-                MerchantDB,
-                TransactionDB.merchant_id == MerchantDB.merchant_id
-            ).filter(
-                TransactionDB.transaction_id == case_db.transaction_id
-            ).first()
+        Args:
+            reviewer_id: ID del revisor
+            decision: Decisión para todos los casos
+            notes: Notas de la revisión
+            case_ids: Casos explícitos (o usar filters)
+            filters: merchant_id, customer_id, country, decision_recommendation,
+                created_from, created_to (sobre casos PENDING)
+            max_cases: Máximo de casos afectados
+            db: Sesión del llamador (opcional; None abre una propia)
+        
+        Returns:
+            Resumen con el resultado por caso
+        
+        Raises:
+            ValueError: Si el filtro selecciona más de max_cases casos
+        """
+        from app.database.models import HITLCaseDB, TransactionDB, DecisionTypeEnum, HITLStatusEnum
+        
+        if decision == DecisionType.APPROVE:
+            new_status = HITLStatusEnum.APPROVED
+        elif decision == DecisionType.BLOCK:
+            new_status = HITLStatusEnum.REJECTED
+        else:
+            new_status = HITLStatusEnum.IN_REVIEW
+        
+        db, owned = _session(db)
+        try:
+            # Las reservas vencidas vuelven a PENDING (y a ser seleccionables)
+            self._release_expired_leases(db)
             
-            if not transaction_query:
-                continue
+            # 1. Resolver los casos objetivo
+            if case_ids:
+                requested = list(dict.fromkeys(case_ids))
+            else:
+                filters = filters or {}
+                query = db.query(HITLCaseDB.case_id).filter(HITLCaseDB.status == HITLStatusEnum.PENDING)
+                
+                if any(filters.get(k) for k in ("merchant_id", "customer_id", "country")):
+                    query = query.join(TransactionDB, TransactionDB.transaction_id == HITLCaseDB.transaction_id)
+                    for key in ("merchant_id", "customer_id", "country"):
+                        if filters.get(key):
+                            query = query.filter(getattr(TransactionDB, key) == filters[key])
+                if filters.get("decision_recommendation"):
+                    query = query.filter(HITLCaseDB.decision_recommendation == DecisionTypeEnum[
+                        getattr(filters["decision_recommendation"], "value", filters["decision_recommendation"])
+                    ])
+                if filters.get("created_from"):
+                    query = query.filter(HITLCaseDB.created_at >= filters["created_from"])
+                if filters.get("created_to"):
+                    query = query.filter(HITLCaseDB.created_at < filters["created_to"])
+                
+                requested = [row.case_id for row in query.order_by(HITLCaseDB.case_id).limit(max_cases + 1)]
             
-            transaction_db, customer_db, country_db, channel_db, merchant_db = transaction_query
+            if len(requested) > max_cases:
+                raise ValueError(f"La selección supera max_cases={max_cases}; acote el filtro")
             
-            # Obtener decisión de fraude para signals y citations
-            decision_db = db.query(FraudDecisionDB).filter(
-                FraudDecisionDB.transaction_id == case_db.transaction_id
-            ).first()
+            # 2. Estado actual (para explicar los casos no modificados)
+            current = {
+                row.case_id: row
+                for row in db.query(
+                    HITLCaseDB.case_id, HITLCaseDB.status, HITLCaseDB.claimed_by
+                ).filter(HITLCaseDB.case_id.in_(requested))
+            } if requested else {}
+            
+            # 3. Un UPDATE condicional por estado de origen (RETURNING indica
+            # qué casos cambiaron y desde qué estado, sin depender de la lectura previa)
+            reviewed = {}
+            if current:
+                for status, condition in self._reviewable_conditions(reviewer_id):
+                    for case_id in db.scalars(
+                        update(HITLCaseDB)
+                        .where(HITLCaseDB.case_id.in_(list(current)), condition)
+                        .values(
+                            reviewer_id=reviewer_id,
+                            reviewer_decision=DecisionTypeEnum[decision.value],
+                            reviewer_notes=notes,
+                            reviewed_at=datetime.now(),
+                            status=new_status,
+                            claimed_by=reviewer_id,
+                            lease_expires_at=None
+                        )
+                        .returning(HITLCaseDB.case_id)
+                        .execution_options(synchronize_session=False)
+                    ).all():
+                        reviewed[case_id] = status
+            
+            # 4. Contadores (misma transacción)
+            if reviewed:
+                deltas = {statistics.HITL_QUEUE_VERSION: 1}
+                for case_id, previous_status in reviewed.items():
+                    old_key = statistics.hitl_key(previous_status)
+                    deltas[old_key] = deltas.get(old_key, 0) - 1
+                new_key = statistics.hitl_key(new_status)
+                deltas[new_key] = deltas.get(new_key, 0) + len(reviewed)
+                StatisticsService.increment(db, deltas)
+                SearchService.index_hitl_cases(db, list(reviewed))
+            
+            db.commit()
+            
+            # 5. Resultado por caso
+            results = []
+            for case_id in requested:
+                if case_id in reviewed:
+                    outcome = "reviewed"
+                elif case_id not in current:
+                    outcome = "not_found"
+                elif current[case_id].status == HITLStatusEnum.CLAIMED:
+                    outcome = "claimed_by_other"
+                else:
+                    outcome = "already_reviewed"
+                results.append({"case_id": case_id, "outcome": outcome})
             
-            signals = []
-            citations_internal = []
-            citations_external = []
+            print(f"   💾 Revisión masiva por {reviewer_id}: {len(reviewed)}/{len(requested)} casos → {new_status.value}")
+            
+            return {
+                "decision": decision.value,
+                "status": new_status.value,
+                "requested": len(requested),
+                "reviewed": len(reviewed),
+                "skipped": len(requested) - len(reviewed),
+                "results": results
+            }
+        
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if owned:
+                db.close()
+    
+    # ============================================
+    # COLA PRIORIZADA (claim / lease)
+    # ============================================
+    
+    @staticmethod
+    def _reviewable_conditions(reviewer_id: str) -> List[tuple]:
+        """(estado previo, condición) de los casos que un revisor puede resolver"""
+        from app.database.models import HITLCaseDB, HITLStatusEnum
+        
+        return [
+            (HITLStatusEnum.PENDING, HITLCaseDB.status == HITLStatusEnum.PENDING),
+            (HITLStatusEnum.CLAIMED, and_(
+                HITLCaseDB.status == HITLStatusEnum.CLAIMED,
+                HITLCaseDB.claimed_by == reviewer_id
+            )),
+        ]
+    
+    @staticmethod
+    def _release_expired_leases(db) -> int:
+        """Devolver a PENDING los casos con lease vencido (sin commit)"""
+        from app.database.models import HITLCaseDB, HITLStatusEnum
+        
+        result = db.execute(
+            update(HITLCaseDB)
+            .where(
+                HITLCaseDB.status == HITLStatusEnum.CLAIMED,
+                HITLCaseDB.lease_expires_at < datetime.utcnow()
+            )
+            .values(status=HITLStatusEnum.PENDING, claimed_by=None, lease_expires_at=None)
+        )
+        
+        if result.rowcount:
+            StatisticsService.increment(db, {
+                statistics.hitl_key(HITLStatusEnum.CLAIMED): -result.rowcount,
+                statistics.hitl_key(HITLStatusEnum.PENDING): result.rowcount,
+                statistics.HITL_QUEUE_VERSION: 1,
+            })
+            print(f"   ⏰ {result.rowcount} reservas HITL vencidas liberadas")
+        return result.rowcount
+    
+    @staticmethod
+    def release_expired_leases() -> int:
+        """Devolver a PENDING los casos con lease vencido (sesión propia, con commit)"""
+        from app.database.connection import SessionLocal
+        
+        db = SessionLocal()
+        try:
+            released = HITLService._release_expired_leases(db)
+            db.commit()
+            return released
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    def claim_next(self, reviewer_id: str, lease_seconds: int = None, db=None) -> Optional[HITLCase]:
+        """
+        Reservar el caso pendiente de mayor prioridad para un revisor
+        
+        El caso pasa a CLAIMED con un lease; si no se renueva con heartbeat
+        antes de vencer, vuelve a la cola.
+        
+        Args:
+            reviewer_id: Revisor que toma el caso
+            lease_seconds: Duración de la reserva (default: HITL_LEASE_SECONDS)
+            db: Sesión del llamador (opcional; None abre una propia)
+        
+        Returns:
+            Caso reservado (completo) o None si la cola está vacía
+        """
+        from app.database.models import HITLCaseDB, HITLStatusEnum
+        
+        lease_seconds = lease_seconds or get_settings().HITL_LEASE_SECONDS
+        
+        db, owned = _session(db)
+        try:
+            self._release_expired_leases(db)
+            db.commit()
             
-            if decision_db:
-                # Obtener señales
-                signals_db = db.query(SignalDB).filter(
-                    SignalDB.decision_id == decision_db.id
-                ).all()
-                signals = [s.signal_text for s in signals_db]
+            for _ in range(CLAIM_ATTEMPTS):
+                # Candidatos en orden de prioridad (índice status + priority_key)
+                candidates = [
+                    row.case_id for row in db.query(HITLCaseDB.case_id).filter(
+                        HITLCaseDB.status == HITLStatusEnum.PENDING
+                    ).order_by(
+                        HITLCaseDB.priority_key.desc(), HITLCaseDB.case_id.asc()
+                    ).limit(CLAIM_CANDIDATES).all()
+                ]
+                if not candidates:
+                    return None
                 
-                # Obtener citaciones internas
-                citations_int_db = db.query(InternalCitationDB).filter(
-                    InternalCitationDB.decision_id == decision_db.id
-                ).all()
-                from app.models.schemas import InternalCitation
-                citations_internal = [
-                    InternalCitation(
-                        policy_id=c.policy_id,
-                        version=c.version,
-                        chunk_id=c.chunk_id
+                for case_id in candidates:
+                    # Solo uno gana: la condición status = PENDING se evalúa al actualizar
+                    result = db.execute(
+                        update(HITLCaseDB)
+                        .where(HITLCaseDB.case_id == case_id, HITLCaseDB.status == HITLStatusEnum.PENDING)
+                        .values(
+                            status=HITLStatusEnum.CLAIMED,
+                            claimed_by=reviewer_id,
+                            lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds)
+                        )
                     )
-                    for c in citations_int_db
-                ]
+                    if result.rowcount == 1:
+                        StatisticsService.hitl_transition(db, HITLStatusEnum.PENDING, HITLStatusEnum.CLAIMED)
+                        db.commit()
+                        print(f"   🔒 Caso {case_id} reservado por {reviewer_id}")
+                        
+                        case_db = db.get(HITLCaseDB, case_id)
+                        cases = self._convert_cases_to_schema([case_db], db)
+                        return cases[0] if cases else None
+                    db.rollback()
+            
+            return None
+        finally:
+            if owned:
+                db.close()
+    
+    def heartbeat(self, case_id: str, reviewer_id: str, lease_seconds: int = None, db=None) -> datetime:
+        """
+        Renovar la reserva de un caso
+        
+        Returns:
+            Nuevo vencimiento del lease
+        
+        Raises:
+            ValueError: Si el caso no está reservado por este revisor
+        """
+        from app.database.models import HITLCaseDB, HITLStatusEnum
+        
+        lease_expires_at = datetime.utcnow() + timedelta(
+            seconds=lease_seconds or get_settings().HITL_LEASE_SECONDS
+        )
+        
+        db, owned = _session(db)
+        try:
+            result = db.execute(
+                update(HITLCaseDB)
+                .where(
+                    HITLCaseDB.case_id == case_id,
+                    HITLCaseDB.status == HITLStatusEnum.CLAIMED,
+                    HITLCaseDB.claimed_by == reviewer_id
+                )
+                .values(lease_expires_at=lease_expires_at)
+            )
+            if result.rowcount == 0:
+                db.rollback()
+                raise ValueError(f"Caso {case_id} no está reservado por {reviewer_id}")
+            db.commit()
+            return lease_expires_at
+        finally:
+            if owned:
+                db.close()
+    
+    def release(self, case_id: str, reviewer_id: str, db=None):
+        """
+        Liberar una reserva y devolver el caso a la cola
+        
+        Raises:
+            ValueError: Si el caso no está reservado por este revisor
+        """
+        from app.database.models import HITLCaseDB, HITLStatusEnum
+        
+        db, owned = _session(db)
+        try:
+            result = db.execute(
+                update(HITLCaseDB)
+                .where(
+                    HITLCaseDB.case_id == case_id,
+                    HITLCaseDB.status == HITLStatusEnum.CLAIMED,
+                    HITLCaseDB.claimed_by == reviewer_id
+                )
+                .values(status=HITLStatusEnum.PENDING, claimed_by=None, lease_expires_at=None)
+            )
+            if result.rowcount == 0:
+                db.rollback()
+                raise ValueError(f"Caso {case_id} no está reservado por {reviewer_id}")
+            StatisticsService.hitl_transition(db, HITLStatusEnum.CLAIMED, HITLStatusEnum.PENDING)
+            db.commit()
+            print(f"   🔓 Caso {case_id} liberado por {reviewer_id}")
+        finally:
+            if owned:
+                db.close()
+    
+    def _convert_cases_to_schema(self, cases_db: list, db, include_details: bool = True) -> List[HITLCase]:
+        """
+        Convertir casos de BD a schema HITLCase con información completa
+        
+        Usa un número constante de consultas sin importar cuántos casos haya:
+        transacciones con IN, maestros desde el cache en memoria, última
+        decisión por transacción y (si include_details) señales y citaciones
+        con IN sobre los IDs de decisión.
+        
+        Args:
+            cases_db: Casos HITLCaseDB
+            db: Sesión de base de datos
+            include_details: Cargar señales y citaciones (False para listados)
+        """
+        from sqlalchemy import func
+        from app.database.models import (
+            TransactionDB, FraudDecisionDB,
+            SignalDB, InternalCitationDB, ExternalCitationDB
+        )
+        from app.services.master_data_cache import get_master_data_cache
+        
+        if not cases_db:
+            return []
+        
+        transaction_ids = {case_db.transaction_id for case_db in cases_db}
+        
+        # 1. Transacciones (una consulta)
+        transactions = {
+            t.transaction_id: t
+            for t in db.query(TransactionDB).filter(
+                TransactionDB.transaction_id.in_(transaction_ids)
+            ).all()
+        }
+        
+        # 2. Señales y citaciones de la última decisión de cada transacción
+        signals_by_tx = {}
+        internal_by_tx = {}
+        external_by_tx = {}
+        
+        if include_details:
+            latest_decisions = dict(
+                db.query(func.max(FraudDecisionDB.id), FraudDecisionDB.transaction_id).filter(
+                    FraudDecisionDB.transaction_id.in_(transaction_ids)
+                ).group_by(FraudDecisionDB.transaction_id).all()
+            )
+            decision_ids = list(latest_decisions)
+            
+            if decision_ids:
+                for signal in db.query(SignalDB).filter(
+                    SignalDB.decision_id.in_(decision_ids)
+                ).order_by(SignalDB.id).all():
+                    signals_by_tx.setdefault(latest_decisions[signal.decision_id], []).append(signal.signal_text)
                 
-                # Obtener citaciones externas
-                citations_ext_db = db.query(ExternalCitationDB).filter(
-                    ExternalCitationDB.decision_id == decision_db.id
-                ).all()
-                from app.models.schemas import ExternalCitation
-                citations_external = [
-                    ExternalCitation(
-                        url=c.url,
-                        summary=c.summary
+                for c in db.query(InternalCitationDB).filter(
+                    InternalCitationDB.decision_id.in_(decision_ids)
+                ).order_by(InternalCitationDB.id).all():
+                    internal_by_tx.setdefault(latest_decisions[c.decision_id], []).append(
+                        InternalCitation(policy_id=c.policy_id, version=c.version, chunk_id=c.chunk_id)
                     )
-                    for c in citations_ext_db
-                ]
+                
+                for c in db.query(ExternalCitationDB).filter(
+                    ExternalCitationDB.decision_id.in_(decision_ids)
+                ).order_by(ExternalCitationDB.id).all():
+                    external_by_tx.setdefault(latest_decisions[c.decision_id], []).append(
+                        ExternalCitation(url=c.url, summary=c.summary)
+                    )
+        
+        # 3. Construir casos (maestros desde cache, sin consultas)
+        cache = get_master_data_cache()
+        result = []
+        
+        for case_db in cases_db:
+            transaction_db = transactions.get(case_db.transaction_id)
+            if not transaction_db:
+                continue
+            
+            customer = cache.get(db, "customers", transaction_db.customer_id)
+            country = cache.get(db, "countries", transaction_db.country)
+            channel = cache.get(db, "channels", transaction_db.channel)
+            merchant = cache.get(db, "merchants", transaction_db.merchant_id)
+            
+            if not (customer and country and channel and merchant):
+                continue
             
             # Construir Transaction con información enriquecida
             transaction = Transaction(
@@ -319,9 +930,9 @@ class HITLService:
                 transaction=transaction,
                 decision_recommendation=DecisionType[case_db.decision_recommendation.value],
                 confidence=case_db.confidence,
-                signals=signals,
-                citations_internal=citations_internal,
-                citations_external=citations_external,
+                signals=signals_by_tx.get(case_db.transaction_id, []),
+                citations_internal=internal_by_tx.get(case_db.transaction_id, []),
+                citations_external=external_by_tx.get(case_db.transaction_id, []),
                 agent_route=case_db.agent_route or "",
                 created_by=case_db.created_by,
                 created_at=case_db.created_at.isoformat(),
@@ -329,74 +940,114 @@ class HITLService:
                 reviewer_id=case_db.reviewer_id,
                 reviewer_decision=DecisionType[case_db.reviewer_decision.value] if case_db.reviewer_decision else None,
                 reviewer_notes=case_db.reviewer_notes,
-                reviewed_at=case_db.reviewed_at.isoformat() if case_db.reviewed_at else None
+                reviewed_at=case_db.reviewed_at.isoformat() if case_db.reviewed_at else None,
+                risk_score=case_db.risk_score,
+                claimed_by=case_db.claimed_by,
+                lease_expires_at=case_db.lease_expires_at
             )
             
             # AGREGAR INFORMACIÓN DE MAESTROS AL CASO
             # (Lo haremos en el endpoint directamente para no modificar el schema HITLCase)
             case._customer = {
-                "customer_id": customer_db.customer_id,
-                "nombre": customer_db.nombre,
-                "apellido": customer_db.apellido,
-                "email": customer_db.email,
-                "telefono": customer_db.telefono
+                "customer_id": customer["customer_id"],
+                "nombre": customer["nombre"],
+                "apellido": customer["apellido"],
+                "email": customer["email"],
+                "telefono": customer["telefono"]
             }
             
             case._country = {
-                "code": country_db.code,
-                "name": country_db.name,
-                "currency": country_db.currency
+                "code": country["code"],
+                "name": country["name"],
+                "currency": country["currency"]
             }
             
             case._channel = {
-                "code": channel_db.code,
-                "name": channel_db.name,
-                "description": channel_db.description
+                "code": channel["code"],
+                "name": channel["name"],
+                "description": channel["description"]
             }
             
             case._merchant = {
-                "merchant_id": merchant_db.merchant_id,
-                "nombre": merchant_db.nombre,
-                "categoria": merchant_db.categoria,
-                "pais": merchant_db.pais
+                "merchant_id": merchant["merchant_id"],
+                "nombre": merchant["nombre"],
+                "categoria": merchant["categoria"],
+                "pais": merchant["pais"]
             }
             
             result.append(case)
         
         return result
     
-    def get_statistics(self) -> Dict:
-        """Obtener estadísticas de HITL desde la BD"""
-        from app.database.connection import get_db
-        from app.database.models import HITLCaseDB, HITLStatusEnum
+    def get_statistics(self, db=None) -> Dict:
+        """Obtener estadísticas de HITL (desde statistics_counters)"""
+        from app.database.models import HITLStatusEnum
         
-        db = next(get_db())
+        db, owned = _session(db)
         try:
-            total = db.query(HITLCaseDB).count()
-            pending = db.query(HITLCaseDB).filter(
-                HITLCaseDB.status == HITLStatusEnum.PENDING
-            ).count()
-            approved = db.query(HITLCaseDB).filter(
-                HITLCaseDB.status == HITLStatusEnum.APPROVED
-            ).count()
-            rejected = db.query(HITLCaseDB).filter(
-                HITLCaseDB.status == HITLStatusEnum.REJECTED
-            ).count()
-            in_review = db.query(HITLCaseDB).filter(
-                HITLCaseDB.status == HITLStatusEnum.IN_REVIEW
-            ).count()
+            statuses = list(HITLStatusEnum)
+            counters = StatisticsService.get_counters(
+                db, [statistics.HITL_TOTAL, *[statistics.hitl_key(s) for s in statuses]]
+            )
             
             return {
-                "total": total,
-                "pending": pending,
-                "approved": approved,
-                "rejected": rejected,
-                "in_review": in_review
+                "total": counters[statistics.HITL_TOTAL],
+                **{s.value.lower(): counters[statistics.hitl_key(s)] for s in statuses}
             }
         finally:
-            db.close()
+            if owned:
+                db.close()
+    
+    # ============================================
+    # VARIANTES ASYNC (rutas; misma lógica sobre la conexión de la AsyncSession)
+    # ============================================
+    
+    async def list_cases_async(self, db: AsyncSession, **kwargs) -> Tuple[List[HITLCase], Optional[str]]:
+        """list_cases sin bloquear el event loop"""
+        return await db.run_sync(lambda session: self.list_cases(db=session, **kwargs))
+    
+    async def get_queue_version_async(self, db: AsyncSession) -> int:
+        """get_queue_version sin bloquear el event loop"""
+        return await db.run_sync(lambda session: self.get_queue_version(db=session))
+    
+    async def get_case_async(self, db: AsyncSession, case_id: str) -> Optional[HITLCase]:
+        """get_case sin bloquear el event loop"""
+        return await db.run_sync(lambda session: self.get_case(case_id, db=session))
+    
+    async def review_case_async(self, db: AsyncSession, **kwargs) -> HITLCase:
+        """review_case sin bloquear el event loop"""
+        return await db.run_sync(lambda session: self.review_case(db=session, **kwargs))
+    
+    async def bulk_review_async(self, db: AsyncSession, **kwargs) -> Dict:
+        """bulk_review sin bloquear el event loop"""
+        return await db.run_sync(lambda session: self.bulk_review(db=session, **kwargs))
+    
+    async def claim_next_async(self, db: AsyncSession, reviewer_id: str, lease_seconds: int = None) -> Optional[HITLCase]:
+        """claim_next sin bloquear el event loop"""
+        return await db.run_sync(lambda session: self.claim_next(reviewer_id, lease_seconds, db=session))
+    
+    async def heartbeat_async(self, db: AsyncSession, case_id: str, reviewer_id: str, lease_seconds: int = None) -> datetime:
+        """heartbeat sin bloquear el event loop"""
+        return await db.run_sync(lambda session: self.heartbeat(case_id, reviewer_id, lease_seconds, db=session))
+    
+    async def release_async(self, db: AsyncSession, case_id: str, reviewer_id: str):
+        """release sin bloquear el event loop"""
+        return await db.run_sync(lambda session: self.release(case_id, reviewer_id, db=session))
+    
+    async def get_statistics_async(self, db: AsyncSession) -> Dict:
+        """get_statistics sin bloquear el event loop"""
+        return await db.run_sync(lambda session: self.get_statistics(db=session))
 
 
+async def lease_expiry_loop(interval_seconds: int):
+    """Tarea de fondo: devolver a la cola las reservas vencidas (listados y ETag las ven sin esperar un claim)"""
+    while True:
+        try:
+            await asyncio.to_thread(HITLService.release_expired_leases)
+        except Exception as e:
+            print(f"   ⚠️ Error liberando reservas HITL vencidas: {e}")
+        await asyncio.sleep(interval_seconds)
+
 # ============================================
 # INSTANCIA GLOBAL
 # ============================================
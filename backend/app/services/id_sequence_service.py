@@ -0,0 +1,113 @@
+"""
+ID Sequence Service - Asignación de IDs secuenciales sin COUNT ni colisiones
+Cada proceso reserva bloques de valores con un UPDATE atómico sobre
+id_sequences y los entrega desde memoria.
+"""
+from sqlalchemy import update, func
+from sqlalchemy.exc import IntegrityError
+from app.database.models import IdSequenceDB, HITLCaseDB
+from app.config import get_settings
+from typing import Callable, Optional
+import threading
+
+
+def _max_hitl_case_number(db) -> int:
+    """Mayor número de caso existente (compara por longitud y luego valor: HITL-99999 < HITL-100000)"""
+    case_id = db.query(HITLCaseDB.case_id).filter(
+        HITLCaseDB.case_id.like("HITL-%")
+    ).order_by(
+        func.length(HITLCaseDB.case_id).desc(), HITLCaseDB.case_id.desc()
+    ).limit(1).scalar()
+
+    if not case_id:
+        return 0
+    try:
+        return int(case_id.split("-", 1)[1])
+    except ValueError:
+        return 0
+
+
+class IdSequence:
+    """Secuencia con reserva de bloques en proceso (segura entre hilos y procesos)"""
+
+    def __init__(self, name: str, block_size: int = 20, initial_value: Callable = None):
+        """
+        Inicializar secuencia
+
+        Args:
+            name: Nombre de la fila en id_sequences
+            block_size: Valores reservados por cada viaje a la BD
+            initial_value: Función(db) -> último valor ya usado (al crear la fila)
+        """
+        self.name = name
+        self.block_size = max(1, block_size)
+        self.initial_value = initial_value or (lambda db: 0)
+        self._lock = threading.Lock()
+        self._next: Optional[int] = None
+        self._limit: Optional[int] = None
+
+    def next_value(self) -> int:
+        """Obtener el siguiente valor (solo accede a la BD al agotar el bloque)"""
+        with self._lock:
+            if self._next is None or self._next >= self._limit:
+                self._next, self._limit = self._reserve_block()
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve_block(self):
+        """Reservar [inicio, fin) en una transacción propia"""
+        from app.database.connection import SessionLocal
+
+        db = SessionLocal()
+        try:
+            for _ in range(3):
+                result = db.execute(
+                    update(IdSequenceDB)
+                    .where(IdSequenceDB.name == self.name)
+                    .values(next_value=IdSequenceDB.next_value + self.block_size)
+                )
+                if result.rowcount:
+                    # El UPDATE bloquea la fila hasta el commit: la lectura es consistente
+                    end = db.query(IdSequenceDB.next_value).filter(
+                        IdSequenceDB.name == self.name
+                    ).scalar()
+                    db.commit()
+                    return end - self.block_size, end
+
+                # Primera vez: crear la fila a partir de los datos existentes
+                try:
+                    db.add(IdSequenceDB(name=self.name, next_value=self.initial_value(db) + 1))
+                    db.commit()
+                except IntegrityError:
+                    # Otro proceso la creó primero
+                    db.rollback()
+
+            raise RuntimeError(f"No se pudo reservar un bloque de la secuencia {self.name}")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+# ============================================
+# INSTANCIA GLOBAL
+# ============================================
+
+_case_id_sequence = None
+_case_id_sequence_lock = threading.Lock()
+
+
+def get_case_id_sequence() -> IdSequence:
+    """Obtener la secuencia de IDs de casos HITL"""
+    global _case_id_sequence
+    if _case_id_sequence is None:
+        with _case_id_sequence_lock:
+            if _case_id_sequence is None:
+                _case_id_sequence = IdSequence(
+                    "hitl_case",
+                    block_size=get_settings().HITL_CASE_ID_BLOCK_SIZE,
+                    initial_value=_max_hitl_case_number,
+                )
+    return _case_id_sequence
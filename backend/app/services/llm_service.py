@@ -3,14 +3,25 @@ Servicio para interactuar con LLMs (OpenAI o Azure OpenAI)
 """
 from langchain_openai import ChatOpenAI, AzureChatOpenAI
 from app.config import get_settings
+import threading
 
 settings = get_settings()
 
+# Temperaturas usadas por los agentes (para precalentar clientes al iniciar)
+AGENT_TEMPERATURES = (0.1, 0.2, 0.3, 0.5)
+
+# Clientes LLM reutilizables por (temperatura, modelo)
+_llm_clients = {}
+_llm_lock = threading.Lock()
+
 
 def get_llm(temperature: float = None, model: str = None):
     """
     Obtener instancia del LLM configurado (OpenAI o Azure)
     
+    Los clientes se crean una sola vez por combinación de temperatura y modelo
+    y se reutilizan entre requests (comparten el pool HTTP).
+    
     Args:
         temperature: Temperatura para la generación (0.0 - 1.0)
         model: Modelo a usar (solo aplica para OpenAI directo)
@@ -19,7 +30,23 @@ def get_llm(temperature: float = None, model: str = None):
         ChatOpenAI o AzureChatOpenAI: Instancia del modelo
     """
     temp = temperature if temperature is not None else settings.LLM_TEMPERATURE
+    key = (temp, model)
+    
+    client = _llm_clients.get(key)
+    if client is not None:
+        return client
+    
+    with _llm_lock:
+        client = _llm_clients.get(key)
+        if client is None:
+            client = _create_llm(temp, model)
+            _llm_clients[key] = client
     
+    return client
+
+
+def _create_llm(temp: float, model: str = None):
+    """Crear un cliente LLM nuevo"""
     # ============================================
     # OPCIÓN 1: AZURE OPENAI
     # ============================================
@@ -47,6 +74,12 @@ def get_llm(temperature: float = None, model: str = None):
         )
 
 
+def warmup_llm_clients():
+    """Crear de antemano los clientes LLM usados por los agentes"""
+    for temperature in AGENT_TEMPERATURES:
+        get_llm(temperature=temperature)
+
+
 def invoke_llm(prompt: str, temperature: float = None) -> str:
     """
     Invocar el LLM con un prompt simple
@@ -0,0 +1,204 @@
+"""
+Master Data Cache - Datos maestros en memoria (clientes, países, canales, comercios)
+Evita un SELECT por maestro en cada decisión persistida
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import get_settings
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import threading
+import time
+
+
+# Tabla lógica → (modelo, columna clave, columnas expuestas)
+MASTER_TABLES = {
+    "customers": ("CustomerDB", "customer_id", ("customer_id", "nombre", "apellido", "email", "telefono", "created_at")),
+    "countries": ("CountryDB", "code", ("code", "name", "currency")),
+    "channels": ("ChannelDB", "code", ("code", "name", "description")),
+    "merchants": ("MerchantDB", "merchant_id", ("merchant_id", "nombre", "categoria", "pais", "created_at")),
+}
+
+# Clave en Session.info de los maestros a publicar cuando la transacción confirme
+_PENDING_KEY = "master_data_cache_pending"
+
+
+def _model(table: str):
+    from app.database import models
+    return getattr(models, MASTER_TABLES[table][0])
+
+
+def to_record(table: str, row) -> Dict:
+    """Convertir una fila ORM de maestro a diccionario"""
+    return {column: getattr(row, column) for column in MASTER_TABLES[table][2]}
+
+
+class MasterDataCache:
+    """Cache en proceso de los datos maestros, cargado una vez desde la BD"""
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict[str, Dict]] = {}
+        self._versions: Dict[str, int] = {table: 0 for table in MASTER_TABLES}
+        self._loaded_at: Dict[str, float] = {}
+        self._serialized: Dict[str, Tuple[int, bytes, str]] = {}
+        self.ttl_seconds = ttl_seconds
+
+    def _load_table(self, db: Session, table: str):
+        model = _model(table)
+        rows = db.query(model).all()
+
+        # La sesión ve sus propios maestros sin confirmar: no publicarlos todavía
+        key = MASTER_TABLES[table][1]
+        pending = {record[key] for _, name, record in db.info.get(_PENDING_KEY, ()) if name == table}
+        if pending:
+            rows = [row for row in rows if getattr(row, key) not in pending]
+        self.replace(table, rows)
+
+    def _is_fresh(self, table: str) -> bool:
+        if table not in self._records:
+            return False
+        return not self.ttl_seconds or time.monotonic() - self._loaded_at.get(table, 0) <= self.ttl_seconds
+
+    def ensure_loaded(self, db: Session, table: str = None):
+        """Cargar desde la BD las tablas que aún no están en memoria (o vencidas)"""
+        tables = [table] if table else list(MASTER_TABLES)
+        for name in tables:
+            if not self._is_fresh(name):
+                self._load_table(db, name)
+
+    def _table(self, db: Session, table: str) -> Dict[str, Dict]:
+        """
+        Registros de una tabla: los del cache, o cargados desde db
+
+        Una sesión de réplica puede ir atrasada: si la tabla no está en
+        memoria se lee para esta consulta pero no se guarda (el cache que usa
+        la ruta de escritura solo se carga desde la primaria).
+        """
+        from app.database.connection import REPLICA_SESSION
+
+        if db.info.get(REPLICA_SESSION):
+            if self._is_fresh(table):
+                return self._records[table]
+            key = MASTER_TABLES[table][1]
+            return {getattr(row, key): to_record(table, row) for row in db.query(_model(table)).all()}
+
+        self.ensure_loaded(db, table)
+        return self._records[table]
+
+    def contains(self, db: Session, table: str, key: str) -> bool:
+        """Verificar si existe un maestro (sin consultar la BD si ya está cargado)"""
+        return key in self._table(db, table)
+
+    def get(self, db: Session, table: str, key: str) -> Optional[Dict]:
+        """Obtener un maestro por su clave"""
+        return self._table(db, table).get(key)
+
+    def all(self, db: Session, table: str) -> List[Dict]:
+        """Obtener todos los registros de una tabla maestra"""
+        return list(self._table(db, table).values())
+
+    def put(self, table: str, row):
+        """Registrar un maestro recién insertado"""
+        record = to_record(table, row) if not isinstance(row, dict) else row
+        key = record[MASTER_TABLES[table][1]]
+        with self._lock:
+            if table in self._records:
+                self._records[table][key] = record
+            self._versions[table] += 1
+
+    def put_after_commit(self, db: Session, table: str, row):
+        """
+        Registrar un maestro cuando la transacción de db confirme
+
+        Otra sesión no debe darlo por existente mientras no esté confirmado;
+        si la transacción hace rollback se descarta sin tocar el cache.
+        """
+        record = to_record(table, row) if not isinstance(row, dict) else row
+        db.info.setdefault(_PENDING_KEY, []).append((self, table, record))
+
+    def replace(self, table: str, rows):
+        """Reemplazar una tabla completa con filas recién leídas de la BD"""
+        key = MASTER_TABLES[table][1]
+        records = {}
+        for row in rows:
+            record = to_record(table, row)
+            records[record[key]] = record
+        with self._lock:
+            if self._records.get(table) != records:
+                self._versions[table] += 1
+            self._records[table] = records
+            self._loaded_at[table] = time.monotonic()
+
+    def invalidate(self, table: str = None):
+        """Descartar una tabla (o todas); se recargan en el próximo uso"""
+        with self._lock:
+            for name in ([table] if table else list(MASTER_TABLES)):
+                self._records.pop(name, None)
+                self._versions[name] += 1
+
+    def version(self, table: str) -> int:
+        """Versión de la tabla (cambia con cada inserción o invalidación)"""
+        return self._versions[table]
+
+    def serialized(self, db: Session, table: str, adapter) -> Tuple[bytes, str]:
+        """
+        JSON de la tabla completa y su ETag, recalculados solo al cambiar la versión
+
+        Args:
+            db: Sesión de la primaria (para la carga inicial; no usar la réplica)
+            table: Tabla lógica
+            adapter: TypeAdapter de la lista de esquemas de respuesta
+
+        Returns:
+            (cuerpo JSON, ETag débil por contenido, igual en todos los workers)
+        """
+        self.ensure_loaded(db, table)
+        version = self._versions[table]
+        cached = self._serialized.get(table)
+        if cached and cached[0] == version:
+            return cached[1], cached[2]
+
+        body = adapter.dump_json(adapter.validate_python(self.all(db, table)))
+        etag = content_etag(table, body)
+        with self._lock:
+            self._serialized[table] = (version, body, etag)
+        return body, etag
+
+
+    async def serialized_async(self, db: AsyncSession, table: str, adapter) -> Tuple[bytes, str]:
+        """serialized sobre una AsyncSession (solo toca la BD al cargar o recargar)"""
+        return await db.run_sync(lambda session: self.serialized(session, table, adapter))
+
+    async def all_async(self, db: AsyncSession, table: str) -> List[Dict]:
+        """all sobre una AsyncSession"""
+        return await db.run_sync(lambda session: self.all(session, table))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session):
+    for cache, table, record in session.info.pop(_PENDING_KEY, ()):
+        cache.put(table, record)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def content_etag(prefix: str, body: bytes) -> str:
+    """ETag débil a partir del contenido serializado"""
+    return f'W/"{prefix}-{hashlib.sha1(body).hexdigest()[:16]}"'
+
+
+# ============================================
+# INSTANCIA GLOBAL
+# ============================================
+
+_master_data_cache = MasterDataCache(ttl_seconds=get_settings().MASTER_DATA_CACHE_TTL_SECONDS)
+
+
+def get_master_data_cache() -> MasterDataCache:
+    """Obtener instancia única del cache de maestros"""
+    return _master_data_cache
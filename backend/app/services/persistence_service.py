@@ -2,6 +2,8 @@
 Persistence Service - Guardar decisiones en base de datos
 """
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, update, select, union_all, literal, null, cast, Text, or_, and_
 from app.database.models import (
     TransactionDB, FraudDecisionDB, SignalDB,
     InternalCitationDB, ExternalCitationDB, HITLCaseDB,
@@ -11,8 +13,41 @@ from app.database.models import (
 from app.models.schemas import (
     Transaction, DecisionType, InternalCitation, ExternalCitation
 )
-from typing import List, Dict
+from app.services.master_data_cache import get_master_data_cache
+from app.utils.log_codec import encode_logs, decode_logs, ENCODING_JSON_ZLIB
+from app.config import get_settings
+from app.services.statistics_service import StatisticsService
+from app.services import statistics_service as statistics
+from app.services.rollup_service import RollupService
+from app.utils.lru_cache import LRUCache
+from app.utils.pagination import encode_cursor, decode_cursor
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
+import threading
+
+
+# Historial de transacciones
+HISTORY_DEFAULT_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 500
+HISTORY_PROJECTIONS = ("full", "ids")
+
+
+def backfill_decision_customers(db: Session) -> int:
+    """Copiar customer_id de transactions a decisiones anteriores a la desnormalización"""
+    customer_id = select(TransactionDB.customer_id).where(
+        TransactionDB.transaction_id == FraudDecisionDB.transaction_id
+    ).scalar_subquery()
+    
+    result = db.execute(
+        update(FraudDecisionDB)
+        .where(FraudDecisionDB.customer_id.is_(None))
+        .values(customer_id=customer_id)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount:
+        print(f"   ✅ customer_id copiado a {result.rowcount} decisiones")
+    return result.rowcount
 
 
 class PersistenceService:
@@ -21,6 +56,10 @@ class PersistenceService:
     @staticmethod
     def _ensure_customer_exists(db: Session, customer_id: str):
         """Verificar que el cliente exista, si no, crear temporal"""
+        cache = get_master_data_cache()
+        if cache.contains(db, "customers", customer_id):
+            return cache.get(db, "customers", customer_id)
+        
         customer = db.query(CustomerDB).filter(
             CustomerDB.customer_id == customer_id
         ).first()
@@ -35,12 +74,18 @@ class PersistenceService:
             )
             db.add(customer)
             db.flush()
+            StatisticsService.increment(db, {statistics.CUSTOMERS: 1})
         
+        cache.put_after_commit(db, "customers", customer)
         return customer
     
     @staticmethod
     def _ensure_country_exists(db: Session, country_code: str):
         """Verificar que el país exista, si no, crear temporal"""
+        cache = get_master_data_cache()
+        if cache.contains(db, "countries", country_code):
+            return cache.get(db, "countries", country_code)
+        
         country = db.query(CountryDB).filter(
             CountryDB.code == country_code
         ).first()
@@ -55,11 +100,16 @@ class PersistenceService:
             db.add(country)
             db.flush()
         
+        cache.put_after_commit(db, "countries", country)
         return country
     
     @staticmethod
     def _ensure_channel_exists(db: Session, channel_code: str):
         """Verificar que el canal exista, si no, crear temporal"""
+        cache = get_master_data_cache()
+        if cache.contains(db, "channels", channel_code):
+            return cache.get(db, "channels", channel_code)
+        
         channel = db.query(ChannelDB).filter(
             ChannelDB.code == channel_code
         ).first()
@@ -74,11 +124,16 @@ class PersistenceService:
             db.add(channel)
             db.flush()
         
+        cache.put_after_commit(db, "channels", channel)
         return channel
     
     @staticmethod
     def _ensure_merchant_exists(db: Session, merchant_id: str, country_code: str = None):
         """Verificar que el comercio exista, si no, crear temporal"""
+        cache = get_master_data_cache()
+        if cache.contains(db, "merchants", merchant_id):
+            return cache.get(db, "merchants", merchant_id)
+        
         merchant = db.query(MerchantDB).filter(
             MerchantDB.merchant_id == merchant_id
         ).first()
@@ -93,7 +148,9 @@ class PersistenceService:
             )
             db.add(merchant)
             db.flush()
+            StatisticsService.increment(db, {statistics.MERCHANTS: 1})
         
+        cache.put_after_commit(db, "merchants", merchant)
         return merchant
     
     @staticmethod
@@ -117,81 +174,312 @@ class PersistenceService:
         Returns:
             FraudDecisionDB: Decisión guardada con ID
         """
+        decisions = PersistenceService.save_transaction_analyses(db, [{
+            "transaction": transaction,
+            "decision": decision,
+            "confidence": confidence,
+            "risk_score": risk_score,
+            "signals": signals,
+            "citations_internal": citations_internal,
+            "citations_external": citations_external,
+            "explanation_customer": explanation_customer,
+            "explanation_audit": explanation_audit,
+            "agent_route": agent_route,
+            "processing_time_ms": processing_time_ms,
+        }])
+        
+        return decisions[0]
+    
+    @staticmethod
+    def save_transaction_analyses(db: Session, analyses: List[Dict], commit: bool = True) -> List[FraudDecisionDB]:
+        """
+        Guardar un lote de análisis con un número constante de sentencias
         
-        # 1. Verificar/crear maestros necesarios
-        PersistenceService._ensure_customer_exists(db, transaction.customer_id)
-        PersistenceService._ensure_country_exists(db, transaction.country)
-        PersistenceService._ensure_channel_exists(db, transaction.channel)
-        PersistenceService._ensure_merchant_exists(db, transaction.merchant_id, transaction.country)
+        Los maestros se verifican contra el cache en memoria (sin SELECT en
+        régimen normal); transacciones, decisiones, señales y citaciones se
+        insertan con un INSERT multi-fila por tabla.
         
-        # 2. Guardar o actualizar transacción
-        transaction_db = db.query(TransactionDB).filter(
-            TransactionDB.transaction_id == transaction.transaction_id
-        ).first()
+        Args:
+            db: Sesión de base de datos
+            analyses: Lista de dicts con los mismos campos que save_transaction_analysis
+                (opcionales: "analysis_logs" con los eventos del stream, "created_at" y
+                "hitl_case" con el HITLCase de HITLService.build_case)
+            commit: Hacer commit al final (False para incluirlo en una transacción mayor)
+        
+        Returns:
+            Lista de FraudDecisionDB en el mismo orden que analyses
+        """
+        if not analyses:
+            return []
         
-        if not transaction_db:
-            transaction_db = TransactionDB(
-                transaction_id=transaction.transaction_id,
-                customer_id=transaction.customer_id,
-                amount=transaction.amount,
-                currency=transaction.currency,
-                country=transaction.country,
-                channel=transaction.channel,
-                device_id=transaction.device_id,
-                merchant_id=transaction.merchant_id,
-                transaction_timestamp=transaction.timestamp,
+        # Los maestros temporales se publican en el cache recién al confirmar
+        # la transacción (este commit o el del llamador si commit=False)
+        decisions_db = PersistenceService._insert_analyses(db, analyses)
+        # IDs de RETURNING antes del commit (después los objetos expiran y cada acceso haría un SELECT)
+        decision_ids = [d.id for d in decisions_db]
+        
+        # Commit
+        if commit:
+            db.commit()
+            # Una lectura concurrente pudo cachear el estado previo al commit
+            PersistenceService.invalidate_transaction_details(
+                a["transaction"].transaction_id for a in analyses
             )
-            db.add(transaction_db)
-            db.flush()  # Para obtener el ID
         
-        # 3. Guardar decisión
-        decision_db = FraudDecisionDB(
-            transaction_id=transaction.transaction_id,
-            decision=DecisionTypeEnum(decision.value),
-            confidence=confidence,
-            risk_score=risk_score,
-            agent_route=agent_route,
-            processing_time_ms=processing_time_ms,
-            explanation_customer=explanation_customer,
-            explanation_audit=explanation_audit,
-        )
-        db.add(decision_db)
-        db.flush()  # Para obtener el ID
-        
-        # 4. Guardar señales
-        for signal_text in signals:
-            signal_db = SignalDB(
-                decision_id=decision_db.id,
-                signal_text=signal_text,
+        print(f"   💾 {len(decisions_db)} análisis guardados en BD - Decision IDs: {decision_ids}")
+        
+        return decisions_db
+    
+    @staticmethod
+    def _insert_analyses(db: Session, analyses: List[Dict]) -> List[FraudDecisionDB]:
+        """Insertar maestros faltantes, transacciones, decisiones e hijos (sin commit)"""
+        # 1. Verificar/crear maestros necesarios (cache en memoria)
+        for analysis in analyses:
+            transaction = analysis["transaction"]
+            PersistenceService._ensure_customer_exists(db, transaction.customer_id)
+            PersistenceService._ensure_country_exists(db, transaction.country)
+            PersistenceService._ensure_channel_exists(db, getattr(transaction.channel, "value", transaction.channel))
+            PersistenceService._ensure_merchant_exists(db, transaction.merchant_id, transaction.country)
+        
+        # 2. Guardar transacciones nuevas
+        transaction_ids = {a["transaction"].transaction_id for a in analyses}
+        existing_ids = {
+            row[0] for row in db.query(TransactionDB.transaction_id).filter(
+                TransactionDB.transaction_id.in_(transaction_ids)
+            ).all()
+        }
+        
+        new_transactions = {}
+        for analysis in analyses:
+            transaction = analysis["transaction"]
+            if transaction.transaction_id in existing_ids or transaction.transaction_id in new_transactions:
+                continue
+            new_transactions[transaction.transaction_id] = {
+                "transaction_id": transaction.transaction_id,
+                "customer_id": transaction.customer_id,
+                "amount": transaction.amount,
+                "currency": transaction.currency,
+                "country": transaction.country,
+                "channel": getattr(transaction.channel, "value", transaction.channel),
+                "device_id": transaction.device_id,
+                "merchant_id": transaction.merchant_id,
+                "transaction_timestamp": transaction.timestamp,
+            }
+        
+        if new_transactions:
+            db.execute(insert(TransactionDB), list(new_transactions.values()))
+        
+        # 3. Guardar decisiones (INSERT ... RETURNING para obtener los IDs)
+        decisions_db = list(db.scalars(
+            insert(FraudDecisionDB).returning(FraudDecisionDB, sort_by_parameter_order=True),
+            [
+                {
+                    "transaction_id": a["transaction"].transaction_id,
+                    "customer_id": a["transaction"].customer_id,
+                    "decision": DecisionTypeEnum(a["decision"].value),
+                    "confidence": a["confidence"],
+                    "risk_score": a["risk_score"],
+                    "agent_route": a["agent_route"],
+                    "processing_time_ms": a["processing_time_ms"],
+                    "explanation_customer": a["explanation_customer"],
+                    "explanation_audit": a["explanation_audit"],
+                    "created_at": a.get("created_at") or datetime.utcnow(),
+                }
+                for a in analyses
+            ]
+        ))
+        
+        # 4-7. Guardar señales, citaciones y logs (un executemany por tabla)
+        signal_rows = []
+        internal_rows = []
+        external_rows = []
+        log_rows = []
+        
+        for analysis, decision_db in zip(analyses, decisions_db):
+            signal_rows.extend(
+                {"decision_id": decision_db.id, "signal_text": signal_text}
+                for signal_text in analysis["signals"]
             )
-            db.add(signal_db)
-        
-        # 5. Guardar citaciones internas
-        for citation in citations_internal:
-            citation_db = InternalCitationDB(
-                decision_id=decision_db.id,
-                policy_id=citation.policy_id,
-                version=citation.version,
-                chunk_id=citation.chunk_id,
+            internal_rows.extend(
+                {
+                    "decision_id": decision_db.id,
+                    "policy_id": citation.policy_id,
+                    "version": citation.version,
+                    "chunk_id": citation.chunk_id,
+                }
+                for citation in analysis["citations_internal"]
             )
-            db.add(citation_db)
-        
-        # 6. Guardar citaciones externas
-        for citation in citations_external:
-            citation_db = ExternalCitationDB(
-                decision_id=decision_db.id,
-                url=citation.url,
-                summary=citation.summary,
+            external_rows.extend(
+                {"decision_id": decision_db.id, "url": citation.url, "summary": citation.summary}
+                for citation in analysis["citations_external"]
             )
-            db.add(citation_db)
+            if analysis.get("analysis_logs"):
+                log_rows.extend(
+                    PersistenceService._analysis_log_rows(decision_db.id, analysis["analysis_logs"])
+                )
+        
+        if signal_rows:
+            db.execute(insert(SignalDB), signal_rows)
+        if internal_rows:
+            db.execute(insert(InternalCitationDB), internal_rows)
+        if external_rows:
+            db.execute(insert(ExternalCitationDB), external_rows)
+        if log_rows:
+            db.execute(insert(PersistenceService._analysis_log_model()), log_rows)
+        
+        # 8. Documentos de búsqueda full-text (señales y explicaciones)
+        from app.services.search_service import SearchService
+        
+        SearchService.index_decisions(db, [
+            {
+                "decision_id": decision_db.id,
+                "transaction_id": decision_db.transaction_id,
+                "customer_id": decision_db.customer_id,
+                "merchant_id": analysis["transaction"].merchant_id,
+                "decision": decision_db.decision,
+                "created_at": decision_db.created_at,
+                "signals": analysis["signals"],
+                "explanation_customer": analysis["explanation_customer"],
+                "explanation_audit": analysis["explanation_audit"],
+            }
+            for analysis, decision_db in zip(analyses, decisions_db)
+        ])
+        
+        # 9. Casos HITL armados durante el análisis (misma unidad de trabajo que la decisión)
+        hitl_cases = [a["hitl_case"] for a in analyses if a.get("hitl_case")]
+        if hitl_cases:
+            from app.services.hitl_service import get_hitl_service
+            get_hitl_service().add_cases(db, hitl_cases)
+        
+        # 10. Contadores y rollups de estadísticas (misma transacción)
+        deltas = {statistics.TRANSACTIONS: len(new_transactions), statistics.DECISIONS: len(analyses)}
+        for analysis in analyses:
+            key = statistics.decision_key(analysis["decision"])
+            deltas[key] = deltas.get(key, 0) + 1
+        StatisticsService.increment(db, deltas)
+        RollupService.record(db, decisions_db)
+        
+        # 11. Los detalles cacheados de estas transacciones ya no son la última decisión
+        PersistenceService.invalidate_transaction_details(transaction_ids)
+        
+        return decisions_db
+    
+    @staticmethod
+    def _analysis_log_model():
+        """Modelo destino de los logs según ANALYSIS_LOG_STORAGE"""
+        from app.database.models import AnalysisLogDB, AnalysisLogBlobDB
         
-        # Commit
-        db.commit()
-        db.refresh(decision_db)
+        if get_settings().ANALYSIS_LOG_STORAGE == "compact":
+            return AnalysisLogBlobDB
+        return AnalysisLogDB
+    
+    @staticmethod
+    def _analysis_log_rows(decision_id: int, logs: List[Dict]) -> List[Dict]:
+        """
+        Convertir los eventos del stream a filas para insertar
+        
+        En modo compact retorna una sola fila (blob comprimido con todos los
+        eventos); en modo rows, una fila por evento.
+        """
+        import json
+        
+        events = [
+            {
+                "event_type": log["event_type"],
+                "phase": log.get("phase"),
+                "agent": log.get("agent"),
+                "message": log["message"],
+                "data": log.get("data"),
+                "timestamp": log.get("timestamp") or datetime.utcnow().isoformat(),
+            }
+            for log in logs
+        ]
+        
+        if get_settings().ANALYSIS_LOG_STORAGE == "compact":
+            return [{
+                "decision_id": decision_id,
+                "encoding": ENCODING_JSON_ZLIB,
+                "event_count": len(events),
+                "payload": encode_logs(events),
+            }]
+        
+        return [
+            {
+                "decision_id": decision_id,
+                "event_type": event["event_type"],
+                "phase": event["phase"],
+                "agent": event["agent"],
+                "message": event["message"],
+                "event_data": json.dumps(event["data"]) if event["data"] else None,
+                "created_at": datetime.fromisoformat(event["timestamp"]),
+            }
+            for event in events
+        ]
+    
+    @staticmethod
+    def save_analysis_logs(db: Session, decision_id: int, logs: List[Dict]):
+        """
+        Guardar todos los logs de un análisis en un solo INSERT (sin commit)
+        
+        Args:
+            db: Sesión de base de datos
+            decision_id: ID de la decisión
+            logs: Eventos del stream (event_type, message, phase, agent, data, timestamp)
+        """
+        if not logs:
+            return
+        
+        db.execute(
+            insert(PersistenceService._analysis_log_model()),
+            PersistenceService._analysis_log_rows(decision_id, logs)
+        )
+        transaction_id = db.query(FraudDecisionDB.transaction_id).filter(
+            FraudDecisionDB.id == decision_id
+        ).scalar()
+        PersistenceService.invalidate_transaction_details([transaction_id])
+    
+    @staticmethod
+    def get_analysis_logs(db: Session, decision_id: int) -> List[Dict]:
+        """
+        Obtener los logs de una decisión (blob compacto o filas por evento)
         
-        print(f"   💾 Análisis guardado en BD - Decision ID: {decision_db.id}")
+        Returns:
+            Lista de eventos con event_type, phase, agent, message, data y timestamp
+        """
+        return PersistenceService.get_analysis_logs_bulk(db, [decision_id])[decision_id]
+    
+    @staticmethod
+    def get_analysis_logs_bulk(db: Session, decision_ids: List[int]) -> Dict[int, List[Dict]]:
+        """Logs de varias decisiones con una consulta por formato de almacenamiento"""
+        import json
+        from app.database.models import AnalysisLogDB, AnalysisLogBlobDB
+        
+        result = {decision_id: [] for decision_id in decision_ids}
+        if not decision_ids:
+            return result
+        
+        for blob in db.query(
+            AnalysisLogBlobDB.decision_id, AnalysisLogBlobDB.encoding, AnalysisLogBlobDB.payload
+        ).filter(AnalysisLogBlobDB.decision_id.in_(decision_ids)):
+            result[blob.decision_id] = decode_logs(blob.payload, blob.encoding)
+        
+        pending = [decision_id for decision_id in decision_ids if not result[decision_id]]
+        if pending:
+            logs = db.query(AnalysisLogDB).filter(
+                AnalysisLogDB.decision_id.in_(pending)
+            ).order_by(AnalysisLogDB.created_at.asc(), AnalysisLogDB.id.asc()).all()
+            
+            for log in logs:
+                result[log.decision_id].append({
+                    "event_type": log.event_type,
+                    "phase": log.phase,
+                    "agent": log.agent,
+                    "message": log.message,
+                    "data": json.loads(log.event_data) if log.event_data else None,
+                    "timestamp": log.created_at.isoformat()
+                })
         
-        return decision_db
+        return result
     
     @staticmethod
     def save_hitl_case(
@@ -213,6 +501,11 @@ class PersistenceService:
             agent_route=agent_route,
         )
         db.add(hitl_case_db)
+        StatisticsService.increment(db, {
+            statistics.HITL_TOTAL: 1,
+            statistics.HITL_QUEUE_VERSION: 1,
+            statistics.hitl_key(HITLStatusEnum.PENDING): 1,
+        })
         db.commit()
         db.refresh(hitl_case_db)
         
@@ -225,48 +518,74 @@ class PersistenceService:
         db: Session,
         customer_id: str = None,
         decision: str = None,
-        limit: int = 100
-    ) -> List[Dict]:
+        limit: int = HISTORY_DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        date_from: datetime = None,
+        date_to: datetime = None,
+        projection: str = "full"
+    ) -> Tuple[List[Dict], Optional[str]]:
         """
-        Obtener historial de transacciones con información completa
+        Obtener una página del historial con paginación keyset (created_at, id)
+        
+        Los filtros usan columnas de fraud_decisions (customer_id desnormalizado)
+        para que cada combinación común recorra un índice compuesto.
         
         Args:
             db: Sesión de base de datos
             customer_id: Filtrar por ID de cliente (opcional)
             decision: Filtrar por tipo de decisión (opcional)
-            limit: Límite de resultados
+            limit: Tamaño de página (máximo HISTORY_MAX_PAGE_SIZE)
+            cursor: Cursor de la página anterior (None para la primera)
+            date_from: Inicio del rango de created_at (inclusive, opcional)
+            date_to: Fin del rango de created_at (exclusivo, opcional)
+            projection: full (con maestros) o ids (solo columnas de la decisión, sin JOIN)
         
         Returns:
-            Lista de transacciones con información completa
-        """
+            (transacciones de la página, cursor de la siguiente página o None)
         
-        query = db.query(
-            FraudDecisionDB,
-            TransactionDB,
-            CustomerDB,
-            CountryDB,
-            ChannelDB,
-            MerchantDB
-        ).join(
-            TransactionDB,
-            FraudDecisionDB.transaction_id == TransactionDB.transaction_id
-        ).join(
-            CustomerDB,
-            TransactionDB.customer_id == CustomerDB.customer_id
-        ).join(
-            CountryDB,
-            TransactionDB.country == CountryDB.code
-        ).join(
-            ChannelDB,
-            TransactionDB.channel == ChannelDB.code
-        ).join(
-            MerchantDB,
-            TransactionDB.merchant_id == MerchantDB.merchant_id
-        )
+        Raises:
+            ValueError: Si el cursor o projection son inválidos
+        """
+        if projection not in HISTORY_PROJECTIONS:
+            raise ValueError(f"projection inválida: {projection} (use {' o '.join(HISTORY_PROJECTIONS)})")
+        limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+        
+        if projection == "ids":
+            query = db.query(
+                FraudDecisionDB.id,
+                FraudDecisionDB.transaction_id,
+                FraudDecisionDB.customer_id,
+                FraudDecisionDB.decision,
+                FraudDecisionDB.created_at
+            )
+        else:
+            query = db.query(
+                FraudDecisionDB,
+                TransactionDB,
+                CustomerDB,
+                CountryDB,
+                ChannelDB,
+                MerchantDB
+            ).join(
+                TransactionDB,
+                FraudDecisionDB.transaction_id == TransactionDB.transaction_id
+            ).join(
+                CustomerDB,
+                TransactionDB.customer_id == CustomerDB.customer_id
+            ).join(
+                CountryDB,
+                TransactionDB.country == CountryDB.code
+            ).join(
+                ChannelDB,
+                TransactionDB.channel == ChannelDB.code
+            ).join(
+                MerchantDB,
+                TransactionDB.merchant_id == MerchantDB.merchant_id
+            )
         
         # Filtrar por customer_id si se proporciona
         if customer_id:
-            query = query.filter(TransactionDB.customer_id == customer_id)
+            query = query.filter(FraudDecisionDB.customer_id == customer_id)
         
         # Filtrar por decision si se proporciona
         if decision:
@@ -277,7 +596,47 @@ class PersistenceService:
                 # Si la decisión no es válida, no aplicar filtro
                 pass
         
-        results = query.order_by(FraudDecisionDB.created_at.desc()).limit(limit).all()
+        # Rango de fechas
+        if date_from:
+            query = query.filter(FraudDecisionDB.created_at >= date_from)
+        if date_to:
+            query = query.filter(FraudDecisionDB.created_at < date_to)
+        
+        # Continuar después de la última fila de la página anterior
+        if cursor:
+            position = decode_cursor(cursor)
+            try:
+                created_at = datetime.fromisoformat(position["created_at"])
+                decision_id = int(position["id"])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Cursor inválido")
+            
+            query = query.filter(or_(
+                FraudDecisionDB.created_at < created_at,
+                and_(FraudDecisionDB.created_at == created_at, FraudDecisionDB.id < decision_id)
+            ))
+        
+        results = query.order_by(
+            FraudDecisionDB.created_at.desc(), FraudDecisionDB.id.desc()
+        ).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            last = results[-1] if projection == "ids" else results[-1][0]
+            next_cursor = encode_cursor({"created_at": last.created_at.isoformat(), "id": last.id})
+        
+        if projection == "ids":
+            return [
+                {
+                    "decision_id": row.id,
+                    "transaction_id": row.transaction_id,
+                    "customer_id": row.customer_id,
+                    "decision": row.decision.value,
+                    "created_at": row.created_at.isoformat()
+                }
+                for row in results
+            ], next_cursor
         
         transactions = []
         for decision_obj, transaction, customer, country, channel, merchant in results:
@@ -312,63 +671,34 @@ class PersistenceService:
                 "transaction_timestamp": transaction.transaction_timestamp.isoformat()
             })
         
-        return transactions
+        return transactions, next_cursor
     
     @staticmethod
     def get_statistics(db: Session) -> Dict:
-        """Obtener estadísticas generales"""
+        """Obtener estadísticas generales (desde statistics_counters, una sola consulta)"""
+        decision_types = ["APPROVE", "CHALLENGE", "BLOCK", "ESCALATE_TO_HUMAN"]
+        hitl_statuses = list(HITLStatusEnum)
         
-        total_transactions = db.query(TransactionDB).count()
-        total_decisions = db.query(FraudDecisionDB).count()
-        total_customers = db.query(CustomerDB).count()
-        total_merchants = db.query(MerchantDB).count()
+        counters = StatisticsService.get_counters(db, [
+            statistics.TRANSACTIONS, statistics.DECISIONS,
+            statistics.CUSTOMERS, statistics.MERCHANTS, statistics.HITL_TOTAL,
+            *[statistics.decision_key(d) for d in decision_types],
+            *[statistics.hitl_key(s) for s in hitl_statuses],
+        ])
         
-        # Contar por tipo de decisión
-        approve_count = db.query(FraudDecisionDB).filter(
-            FraudDecisionDB.decision == DecisionTypeEnum.APPROVE
-        ).count()
-        
-        challenge_count = db.query(FraudDecisionDB).filter(
-            FraudDecisionDB.decision == DecisionTypeEnum.CHALLENGE
-        ).count()
-        
-        block_count = db.query(FraudDecisionDB).filter(
-            FraudDecisionDB.decision == DecisionTypeEnum.BLOCK
-        ).count()
-        
-        escalate_count = db.query(FraudDecisionDB).filter(
-            FraudDecisionDB.decision == DecisionTypeEnum.ESCALATE_TO_HUMAN
-        ).count()
-        
-        # HITL stats
-        hitl_pending = db.query(HITLCaseDB).filter(
-            HITLCaseDB.status == HITLStatusEnum.PENDING
-        ).count()
-        
-        hitl_approved = db.query(HITLCaseDB).filter(
-            HITLCaseDB.status == HITLStatusEnum.APPROVED
-        ).count()
-        
-        hitl_rejected = db.query(HITLCaseDB).filter(
-            HITLCaseDB.status == HITLStatusEnum.REJECTED
-        ).count()
+        hitl_cases = {s.value.lower(): counters[statistics.hitl_key(s)] for s in hitl_statuses}
         
         return {
-            "total_transactions": total_transactions,
-            "total_decisions": total_decisions,
-            "total_customers": total_customers,
-            "total_merchants": total_merchants,
+            "total_transactions": counters[statistics.TRANSACTIONS],
+            "total_decisions": counters[statistics.DECISIONS],
+            "total_customers": counters[statistics.CUSTOMERS],
+            "total_merchants": counters[statistics.MERCHANTS],
             "decisions_by_type": {
-                "APPROVE": approve_count,
-                "CHALLENGE": challenge_count,
-                "BLOCK": block_count,
-                "ESCALATE_TO_HUMAN": escalate_count,
+                d: counters[statistics.decision_key(d)] for d in decision_types
             },
             "hitl_cases": {
-                "pending": hitl_pending,
-                "approved": hitl_approved,
-                "rejected": hitl_rejected,
-                "total": hitl_pending + hitl_approved + hitl_rejected,
+                **hitl_cases,
+                "total": counters[statistics.HITL_TOTAL],
             }
         }
     
@@ -400,77 +730,63 @@ class PersistenceService:
         return log_db
     
     @staticmethod
-    def get_transaction_details(db: Session, transaction_id: str) -> Dict:
-        """
-        Obtener detalles completos de una transacción incluyendo logs
-        
-        Args:
-            db: Sesión de base de datos
-            transaction_id: ID de la transacción
-        
-        Returns:
-            Dict con toda la información de la transacción
-        """
-        import json
-        from app.database.models import (
-            FraudDecisionDB, TransactionDB, CustomerDB,
-            CountryDB, ChannelDB, MerchantDB, AnalysisLogDB,
-            SignalDB, InternalCitationDB, ExternalCitationDB
+    def _detail_query(db: Session):
+        """Decisiones con su transacción y maestros (JOIN) para armar el detalle"""
+        return db.query(
+            FraudDecisionDB, TransactionDB, CustomerDB, CountryDB, ChannelDB, MerchantDB
+        ).join(
+            TransactionDB, TransactionDB.transaction_id == FraudDecisionDB.transaction_id
+        ).outerjoin(
+            CustomerDB, CustomerDB.customer_id == TransactionDB.customer_id
+        ).outerjoin(
+            CountryDB, CountryDB.code == TransactionDB.country
+        ).outerjoin(
+            ChannelDB, ChannelDB.code == TransactionDB.channel
+        ).outerjoin(
+            MerchantDB, MerchantDB.merchant_id == TransactionDB.merchant_id
         )
-        
-        # Obtener decisión con todas las relaciones
-        decision = db.query(FraudDecisionDB).filter(
-            FraudDecisionDB.transaction_id == transaction_id
-        ).first()
-        
-        if not decision:
-            return None
-        
-        # Obtener transacción con relaciones
-        transaction = db.query(TransactionDB).filter(
-            TransactionDB.transaction_id == transaction_id
-        ).first()
-        
-        if not transaction:
-            return None
-        
-        # Obtener maestros
-        customer = db.query(CustomerDB).filter(
-            CustomerDB.customer_id == transaction.customer_id
-        ).first()
-        
-        country = db.query(CountryDB).filter(
-            CountryDB.code == transaction.country
-        ).first()
-        
-        channel = db.query(ChannelDB).filter(
-            ChannelDB.code == transaction.channel
-        ).first()
-        
-        merchant = db.query(MerchantDB).filter(
-            MerchantDB.merchant_id == transaction.merchant_id
-        ).first()
-        
-        # Obtener señales
-        signals = db.query(SignalDB).filter(
-            SignalDB.decision_id == decision.id
-        ).all()
-        
-        # Obtener citaciones internas
-        citations_internal = db.query(InternalCitationDB).filter(
-            InternalCitationDB.decision_id == decision.id
-        ).all()
-        
-        # Obtener citaciones externas
-        citations_external = db.query(ExternalCitationDB).filter(
-            ExternalCitationDB.decision_id == decision.id
-        ).all()
-        
-        # Obtener logs de análisis (NUEVO)
-        logs = db.query(AnalysisLogDB).filter(
-            AnalysisLogDB.decision_id == decision.id
-        ).order_by(AnalysisLogDB.created_at.asc()).all()
-        
+    
+    @staticmethod
+    def _detail_children(db: Session, decision_ids: List[int]) -> Dict[int, Tuple[List, List, List]]:
+        """Señales, citaciones internas y externas de varias decisiones en una consulta"""
+        result = {decision_id: ([], [], []) for decision_id in decision_ids}
+        if not decision_ids:
+            return result
+        
+        children = union_all(
+            select(
+                literal("signal").label("kind"), SignalDB.decision_id.label("decision_id"), SignalDB.id.label("id"),
+                SignalDB.signal_text.label("a"), cast(null(), Text).label("b"), cast(null(), Text).label("c")
+            ).where(SignalDB.decision_id.in_(decision_ids)),
+            select(
+                literal("internal"), InternalCitationDB.decision_id, InternalCitationDB.id,
+                InternalCitationDB.policy_id, InternalCitationDB.version, InternalCitationDB.chunk_id
+            ).where(InternalCitationDB.decision_id.in_(decision_ids)),
+            select(
+                literal("external"), ExternalCitationDB.decision_id, ExternalCitationDB.id,
+                ExternalCitationDB.url, ExternalCitationDB.summary, cast(null(), Text)
+            ).where(ExternalCitationDB.decision_id.in_(decision_ids)),
+        )
+        children = children.order_by(children.selected_columns.kind, children.selected_columns.id)
+        
+        for child in db.execute(children):
+            signals, citations_internal, citations_external = result[child.decision_id]
+            if child.kind == "signal":
+                signals.append(child.a)
+            elif child.kind == "internal":
+                citations_internal.append({"policy_id": child.a, "version": child.b, "chunk_id": child.c})
+            else:
+                citations_external.append({"url": child.a, "summary": child.b})
+        
+        return result
+    
+    @staticmethod
+    def _detail_document(
+        decision, transaction, customer, country, channel, merchant,
+        signals: List[str], citations_internal: List[Dict], citations_external: List[Dict],
+        analysis_logs: Optional[List[Dict]]
+    ) -> Dict:
+        """Documento de detalle de una decisión (respuesta de /transactions/{id} y archivo)"""
         # Construir respuesta completa
         result = {
             # Información básica
@@ -525,43 +841,134 @@ class PersistenceService:
             } if merchant else None,
             
             # Señales
-            "signals": [signal.signal_text for signal in signals],
+            "signals": signals,
             
             # Citaciones internas
-            "citations_internal": [
-                {
-                    "policy_id": citation.policy_id,
-                    "version": citation.version,
-                    "chunk_id": citation.chunk_id
-                }
-                for citation in citations_internal
-            ],
+            "citations_internal": citations_internal,
             
             # Citaciones externas
-            "citations_external": [
-                {
-                    "url": citation.url,
-                    "summary": citation.summary
-                }
-                for citation in citations_external
-            ],
+            "citations_external": citations_external,
             
             # Explicaciones
             "explanation_customer": decision.explanation_customer,
             "explanation_audit": decision.explanation_audit,
             
-            # LOGS DE ANÁLISIS (NUEVO)
-            "analysis_logs": [
-                {
-                    "event_type": log.event_type,
-                    "phase": log.phase,
-                    "agent": log.agent,
-                    "message": log.message,
-                    "data": json.loads(log.event_data) if log.event_data else None,
-                    "timestamp": log.created_at.isoformat()
-                }
-                for log in logs
-            ]
+            # LOGS DE ANÁLISIS (None si no se pidieron)
+            "analysis_logs": analysis_logs
         }
         
-        return result
\ No newline at end of file
+        return result
+    
+    @staticmethod
+    def get_transaction_details(db: Session, transaction_id: str, include_logs: bool = True) -> Dict:
+        """
+        Obtener detalles completos de una transacción incluyendo logs
+        
+        Usa dos consultas (decisión + transacción + maestros con JOIN, y
+        señales + citaciones con UNION ALL) y guarda el resultado en un cache
+        LRU que se invalida al escribir una nueva decisión de la transacción.
+        Si la transacción solo tiene decisiones archivadas (retención), el
+        detalle se lee del archivo mensual y lleva "archived": True.
+        
+        Args:
+            db: Sesión de base de datos
+            transaction_id: ID de la transacción
+            include_logs: Leer y decodificar los logs de análisis (False los omite)
+        
+        Returns:
+            Dict con toda la información de la transacción
+        """
+        cache = get_transaction_detail_cache()
+        cache_key = (transaction_id, include_logs)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # 1. Última decisión con transacción y maestros (un solo round-trip)
+        row = PersistenceService._detail_query(db).filter(
+            FraudDecisionDB.transaction_id == transaction_id
+        ).order_by(FraudDecisionDB.id.desc()).first()
+        
+        if not row:
+            # Decisiones fuera de la ventana activa: buscar en el archivo
+            from app.services.retention_service import RetentionService
+            
+            result = RetentionService.get_archived_details(db, transaction_id, include_logs)
+            if result is not None:
+                cache.put(cache_key, result)
+            return result
+        
+        decision, transaction, customer, country, channel, merchant = row
+        
+        # 2. Señales y citaciones (UNION ALL sobre los índices de decision_id)
+        signals, citations_internal, citations_external = PersistenceService._detail_children(
+            db, [decision.id]
+        )[decision.id]
+        
+        result = PersistenceService._detail_document(
+            decision, transaction, customer, country, channel, merchant,
+            signals, citations_internal, citations_external,
+            PersistenceService.get_analysis_logs(db, decision.id) if include_logs else None
+        )
+        
+        cache.put(cache_key, result)
+        return result
+    
+    # ============================================
+    # VARIANTES ASYNC (rutas; misma lógica sobre la conexión de la AsyncSession)
+    # ============================================
+    
+    @staticmethod
+    async def get_transaction_history_async(db: AsyncSession, **kwargs) -> Tuple[List[Dict], Optional[str]]:
+        """get_transaction_history sin bloquear el event loop"""
+        return await db.run_sync(lambda session: PersistenceService.get_transaction_history(session, **kwargs))
+    
+    @staticmethod
+    async def get_statistics_async(db: AsyncSession) -> Dict:
+        """get_statistics sin bloquear el event loop"""
+        return await db.run_sync(PersistenceService.get_statistics)
+    
+    @staticmethod
+    async def get_transaction_details_async(db: AsyncSession, transaction_id: str, include_logs: bool = True) -> Dict:
+        """get_transaction_details sin bloquear el event loop (los aciertos de cache no tocan la BD)"""
+        cached = get_transaction_detail_cache().get((transaction_id, include_logs))
+        if cached is not None:
+            return cached
+        return await db.run_sync(PersistenceService.get_transaction_details, transaction_id, include_logs)
+    
+    @staticmethod
+    async def get_analysis_logs_async(db: AsyncSession, decision_id: int) -> List[Dict]:
+        """get_analysis_logs sin bloquear el event loop"""
+        return await db.run_sync(PersistenceService.get_analysis_logs, decision_id)
+    
+    @staticmethod
+    def invalidate_transaction_details(transaction_ids=None):
+        """Descartar detalles cacheados (de las transacciones dadas, o todos)"""
+        cache = get_transaction_detail_cache()
+        if transaction_ids is None:
+            cache.clear()
+        else:
+            transaction_ids = set(transaction_ids)
+            cache.invalidate(lambda key: key[0] in transaction_ids)
+
+
+# ============================================
+# INSTANCIA GLOBAL
+# ============================================
+
+_transaction_detail_cache = None
+_transaction_detail_cache_lock = threading.Lock()
+
+
+def get_transaction_detail_cache() -> LRUCache:
+    """Obtener el cache de detalles de transacción del proceso"""
+    global _transaction_detail_cache
+    if _transaction_detail_cache is None:
+        with _transaction_detail_cache_lock:
+            if _transaction_detail_cache is None:
+                settings = get_settings()
+                _transaction_detail_cache = LRUCache(
+                    maxsize=settings.TRANSACTION_DETAIL_CACHE_SIZE,
+                    ttl_seconds=settings.TRANSACTION_DETAIL_CACHE_TTL_SECONDS,
+                )
+    return _transaction_detail_cache
@@ -0,0 +1,339 @@
+"""
+Policy Backfill Service - Evaluación retroactiva de políticas sobre el histórico
+Recorre transacciones y perfiles por bloques con un cursor de servidor y evalúa la
+condición de la política de forma vectorizada sobre cada bloque
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, func, union_all
+from app.database.models import (
+    TransactionDB, CustomerBehaviorDB, FraudDecisionDB, ArchivedDecisionDB,
+    PolicyBackfillRunDB, PolicyBackfillMatchDB, BackfillStatusEnum
+)
+from app.services.policy_rule_engine import compile_condition, build_feature_columns
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import json
+
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class PolicyBackfillService:
+    """Servicio para evaluar políticas nuevas o modificadas contra transacciones históricas"""
+
+    @staticmethod
+    def load_policy_definition(
+        policy_id: str,
+        version: str = None,
+        json_path: str = "data/fraud_policies.json"
+    ) -> Optional[Dict]:
+        """
+        Obtener la definición de una política desde el JSON de políticas
+
+        Args:
+            policy_id: ID de la política
+            version: Versión exacta (opcional, default: la más reciente)
+
+        Returns:
+            Política o None si no existe
+        """
+        policy_path = Path(json_path)
+        if not policy_path.exists():
+            return None
+
+        with open(policy_path, "r", encoding="utf-8") as f:
+            policies = json.load(f)
+
+        candidates = [
+            p for p in policies
+            if p["policy_id"] == policy_id and (version is None or p["version"] == version)
+        ]
+        if not candidates:
+            return None
+
+        return max(candidates, key=lambda p: (p.get("effective_from") or "", p["version"]))
+
+    @staticmethod
+    def create_run(
+        db: Session,
+        condition: str,
+        policy_id: str = None,
+        version: str = None,
+        date_from: datetime = None,
+        date_to: datetime = None,
+        created_by: str = None
+    ) -> PolicyBackfillRunDB:
+        """
+        Registrar una ejecución de backfill (valida la condición antes de crearla)
+
+        Raises:
+            PolicyRuleError: Si la condición no compila
+        """
+        compile_condition(condition)
+
+        run = PolicyBackfillRunDB(
+            policy_id=policy_id,
+            version=version,
+            condition=condition,
+            status=BackfillStatusEnum.RUNNING,
+            date_from=date_from,
+            date_to=date_to,
+            created_by=created_by
+        )
+        db.add(run)
+        db.commit()
+        db.refresh(run)
+
+        return run
+
+    @staticmethod
+    def execute_run(db: Session, run_id: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> PolicyBackfillRunDB:
+        """
+        Ejecutar un backfill registrado
+
+        Las transacciones se leen por bloques con paginación por clave
+        (transaction_id > último visto), por lo que la memoria queda acotada al
+        tamaño del bloque. Cada bloque inserta sus coincidencias con executemany
+        y hace commit junto con los contadores de la ejecución: no se retiene el
+        lock de escritura durante todo el recorrido (SQLite), scanned_count y
+        matched_count muestran el avance y un fallo conserva lo ya procesado.
+
+        Args:
+            db: Sesión de base de datos
+            run_id: ID de la ejecución creada con create_run
+            chunk_size: Transacciones por bloque
+
+        Returns:
+            Ejecución con estadísticas finales
+        """
+        run = db.get(PolicyBackfillRunDB, run_id)
+        rule = compile_condition(run.condition)
+
+        print(f"\n🔁 Backfill #{run.id} - {run.policy_id or 'condición ad-hoc'}: {run.condition}")
+
+        query = select(
+            TransactionDB.transaction_id,
+            TransactionDB.customer_id,
+            TransactionDB.amount,
+            TransactionDB.currency,
+            TransactionDB.country,
+            TransactionDB.channel,
+            TransactionDB.device_id,
+            TransactionDB.merchant_id,
+            TransactionDB.transaction_timestamp,
+            CustomerBehaviorDB.usual_amount_avg,
+            CustomerBehaviorDB.usual_hours,
+            CustomerBehaviorDB.usual_countries,
+            CustomerBehaviorDB.usual_devices,
+        ).outerjoin(
+            CustomerBehaviorDB,
+            TransactionDB.customer_id == CustomerBehaviorDB.customer_id
+        )
+
+        if run.date_from:
+            query = query.where(TransactionDB.transaction_timestamp >= run.date_from)
+        if run.date_to:
+            query = query.where(TransactionDB.transaction_timestamp < run.date_to)
+
+        scanned = matched = skipped = 0
+        matched_amount = 0.0
+        by_channel = Counter()
+        by_country = Counter()
+
+        query = query.order_by(TransactionDB.transaction_id).limit(chunk_size)
+        last_transaction_id = None
+
+        try:
+            while True:
+                page = query
+                if last_transaction_id is not None:
+                    page = page.where(TransactionDB.transaction_id > last_transaction_id)
+                chunk = db.execute(page).mappings().all()
+                if not chunk:
+                    break
+
+                last_transaction_id = chunk[-1]["transaction_id"]
+                scanned += len(chunk)
+
+                rows = [row for row in chunk if row["usual_amount_avg"]]
+                skipped += len(chunk) - len(rows)
+
+                mask = rule.evaluate_batch(build_feature_columns(rows)) if rows else []
+                hits = [row for row, hit in zip(rows, mask) if hit]
+
+                if hits:
+                    db.execute(insert(PolicyBackfillMatchDB), [
+                        {
+                            "run_id": run.id,
+                            "transaction_id": row["transaction_id"],
+                            "customer_id": row["customer_id"],
+                            "amount": row["amount"],
+                            "channel": row["channel"],
+                            "country": row["country"],
+                            "transaction_timestamp": row["transaction_timestamp"],
+                        }
+                        for row in hits
+                    ])
+
+                    matched += len(hits)
+                    matched_amount += sum(row["amount"] for row in hits)
+                    by_channel.update(row["channel"] for row in hits)
+                    by_country.update(row["country"] for row in hits)
+
+                # Commit por bloque: coincidencias y avance de la ejecución
+                run.scanned_count = scanned
+                run.matched_count = matched
+                run.skipped_count = skipped
+                run.matched_amount_total = matched_amount
+                db.commit()
+
+                print(f"   📦 {scanned} transacciones evaluadas, {matched} coincidencias")
+
+            # Desglose por la última decisión de cada transacción (activa o archivada),
+            # igual que get_transaction_details: una transacción cuenta una sola vez
+            decisions = union_all(
+                select(FraudDecisionDB.transaction_id, FraudDecisionDB.id.label("decision_id"), FraudDecisionDB.decision),
+                select(ArchivedDecisionDB.transaction_id, ArchivedDecisionDB.decision_id, ArchivedDecisionDB.decision),
+            ).subquery()
+            latest = select(
+                decisions.c.transaction_id, func.max(decisions.c.decision_id).label("decision_id")
+            ).group_by(decisions.c.transaction_id).subquery()
+
+            by_decision = dict(
+                (getattr(decision, "value", decision), count)
+                for decision, count in db.execute(
+                    select(decisions.c.decision, func.count())
+                    .join(latest, latest.c.decision_id == decisions.c.decision_id)
+                    .join(PolicyBackfillMatchDB, PolicyBackfillMatchDB.transaction_id == decisions.c.transaction_id)
+                    .where(PolicyBackfillMatchDB.run_id == run.id)
+                    .group_by(decisions.c.decision)
+                ).all()
+            )
+
+            evaluated = scanned - skipped
+            run.scanned_count = scanned
+            run.matched_count = matched
+            run.skipped_count = skipped
+            run.matched_amount_total = matched_amount
+            run.summary = json.dumps({
+                "match_rate": matched / evaluated if evaluated else 0.0,
+                "avg_matched_amount": matched_amount / matched if matched else 0.0,
+                "by_decision": by_decision,
+                "by_channel": dict(by_channel),
+                "by_country": dict(by_country),
+            })
+            run.status = BackfillStatusEnum.COMPLETED
+            run.finished_at = datetime.utcnow()
+            db.commit()
+
+            print(f"   ✅ Backfill #{run.id} completado: {matched}/{evaluated} coincidencias ({skipped} sin perfil)")
+
+        except Exception as e:
+            db.rollback()
+            run = db.get(PolicyBackfillRunDB, run_id)
+            run.status = BackfillStatusEnum.FAILED
+            run.error = str(e)
+            run.finished_at = datetime.utcnow()
+            db.commit()
+            print(f"   ❌ Backfill #{run_id} falló: {e}")
+            raise
+
+        db.refresh(run)
+        return run
+
+    @staticmethod
+    def get_run(db: Session, run_id: int) -> Optional[Dict]:
+        """Obtener estado y estadísticas de una ejecución"""
+        run = db.get(PolicyBackfillRunDB, run_id)
+        if not run:
+            return None
+
+        return {
+            "run_id": run.id,
+            "policy_id": run.policy_id,
+            "version": run.version,
+            "condition": run.condition,
+            "status": run.status.value,
+            "date_from": run.date_from.isoformat() if run.date_from else None,
+            "date_to": run.date_to.isoformat() if run.date_to else None,
+            "scanned_count": run.scanned_count,
+            "matched_count": run.matched_count,
+            "skipped_count": run.skipped_count,
+            "matched_amount_total": run.matched_amount_total,
+            "summary": json.loads(run.summary) if run.summary else None,
+            "error": run.error,
+            "created_by": run.created_by,
+            "started_at": run.started_at.isoformat() if run.started_at else None,
+            "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        }
+
+    @staticmethod
+    def get_matches(db: Session, run_id: int, limit: int = 100, offset: int = 0) -> List[Dict]:
+        """Obtener transacciones que cumplen la política en una ejecución"""
+        matches = db.query(PolicyBackfillMatchDB).filter(
+            PolicyBackfillMatchDB.run_id == run_id
+        ).order_by(PolicyBackfillMatchDB.id).offset(offset).limit(limit).all()
+
+        return [
+            {
+                "transaction_id": m.transaction_id,
+                "customer_id": m.customer_id,
+                "amount": m.amount,
+                "channel": m.channel,
+                "country": m.country,
+                "transaction_timestamp": m.transaction_timestamp.isoformat(),
+            }
+            for m in matches
+        ]
+
+
+def run_backfill_job(run_id: int, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Ejecutar un backfill en segundo plano con su propia sesión"""
+    from app.database.connection import SessionLocal
+
+    db = SessionLocal()
+    try:
+        PolicyBackfillService.execute_run(db, run_id, chunk_size)
+    except Exception:
+        pass  # El error queda registrado en la ejecución
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.services.policy_backfill_service --policy-id FP-01 --date-from 2025-01-01
+    import argparse
+    from app.database.connection import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Evaluar una política sobre transacciones históricas")
+    parser.add_argument("--policy-id", help="ID de la política en data/fraud_policies.json")
+    parser.add_argument("--version", help="Versión de la política (default: la más reciente)")
+    parser.add_argument("--condition", help="Condición ad-hoc (reemplaza la de la política)")
+    parser.add_argument("--date-from", type=datetime.fromisoformat, help="Desde (YYYY-MM-DD)")
+    parser.add_argument("--date-to", type=datetime.fromisoformat, help="Hasta, exclusivo (YYYY-MM-DD)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    condition = args.condition
+    version = args.version
+    if args.policy_id and not condition:
+        policy = PolicyBackfillService.load_policy_definition(args.policy_id, args.version)
+        if not policy or not policy.get("condition"):
+            parser.error(f"La política {args.policy_id} no existe o no tiene condición")
+        condition = policy["condition"]
+        version = policy["version"]
+    if not condition:
+        parser.error("Indique --policy-id o --condition")
+
+    init_db()
+    db = SessionLocal()
+    try:
+        run = PolicyBackfillService.create_run(
+            db, condition, args.policy_id, version, args.date_from, args.date_to, created_by="cli"
+        )
+        PolicyBackfillService.execute_run(db, run.id, args.chunk_size)
+        print(json.dumps(PolicyBackfillService.get_run(db, run.id), indent=2, ensure_ascii=False))
+    finally:
+        db.close()
@@ -0,0 +1,475 @@
+"""
+Policy Rule Engine - Condiciones declarativas de políticas de fraude
+Compila expresiones como `amount_ratio > 3 AND NOT in_usual_hours` a predicados
+Python (una transacción) o máscaras vectorizadas NumPy (lotes)
+"""
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Mapping, Optional, Sequence
+
+from app.models.schemas import Transaction, CustomerBehavior
+
+
+class PolicyRuleError(ValueError):
+    """Error de sintaxis, de tipos o de variable desconocida en una condición de política"""
+
+
+# ============================================
+# VARIABLES DISPONIBLES
+# ============================================
+
+NUMERIC_FEATURES = {
+    "amount": "Monto de la transacción",
+    "amount_ratio": "Monto / promedio habitual del cliente",
+    "usual_amount_avg": "Monto promedio habitual del cliente",
+    "hour": "Hora de la transacción (0-23)",
+}
+
+BOOLEAN_FEATURES = {
+    "in_usual_hours": "La hora está dentro del horario habitual",
+    "is_international": "El país no es uno de los países habituales",
+    "is_new_device": "El dispositivo no es uno de los habituales",
+}
+
+STRING_FEATURES = {
+    "channel": "Canal (web, mobile, atm, branch)",
+    "country": "País de la transacción",
+    "merchant_id": "ID del comercio",
+    "currency": "Moneda",
+}
+
+FEATURES = {**NUMERIC_FEATURES, **BOOLEAN_FEATURES, **STRING_FEATURES}
+
+
+# ============================================
+# TOKENIZER / PARSER
+# ============================================
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<string>'[^']*'|"[^"]*")
+      | (?P<op>>=|<=|==|!=|>|<)
+      | (?P<punct>[(),])
+      | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {"AND", "OR", "NOT", "IN", "TRUE", "FALSE"}
+
+
+def _tokenize(condition: str) -> List[tuple]:
+    """Dividir la condición en tokens (tipo, valor)"""
+    tokens = []
+    position = 0
+    condition = condition.rstrip()
+
+    while position < len(condition):
+        match = _TOKEN_PATTERN.match(condition, position)
+        if not match or match.end() == position:
+            raise PolicyRuleError(f"Carácter inesperado en posición {position}: '{condition[position:]}'")
+
+        kind = match.lastgroup
+        value = match.group(kind)
+
+        if kind == "word" and value.upper() in _KEYWORDS:
+            kind, value = "keyword", value.upper()
+        elif kind == "number":
+            value = float(value)
+        elif kind == "string":
+            value = value[1:-1]
+
+        tokens.append((kind, value))
+        position = match.end()
+
+    return tokens
+
+
+class _Parser:
+    """
+    Parser descendente recursivo
+
+    Gramática:
+        expr       := and_expr (OR and_expr)*
+        and_expr   := not_expr (AND not_expr)*
+        not_expr   := NOT not_expr | comparison
+        comparison := '(' expr ')' | operand [op operand | IN '(' literal (',' literal)* ')']
+
+    Los números pueden llevar signo negativo (amount_ratio > -1); no hay
+    operadores aritméticos, así que "-" solo es válido pegado a un literal.
+
+    Los tipos se verifican al compilar (FEATURE_TYPES): ambos lados de una
+    comparación o de IN deben ser del mismo tipo, <, >, <= y >= solo aplican
+    a números y un operando solo debe ser booleano.
+
+    El resultado es un AST de tuplas: ("and", a, b), ("or", a, b), ("not", a),
+    ("cmp", op, left, right), ("in", left, values), ("var", name), ("const", value)
+    """
+
+    def __init__(self, condition: str):
+        self.condition = condition
+        self.tokens = _tokenize(condition)
+        self.position = 0
+
+    def _peek(self) -> Optional[tuple]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self) -> tuple:
+        token = self._peek()
+        if token is None:
+            raise PolicyRuleError(f"Fin inesperado de la condición: '{self.condition}'")
+        self.position += 1
+        return token
+
+    def _accept(self, kind: str, value=None) -> bool:
+        token = self._peek()
+        if token and token[0] == kind and (value is None or token[1] == value):
+            self.position += 1
+            return True
+        return False
+
+    def _expect(self, kind: str, value=None):
+        if not self._accept(kind, value):
+            raise PolicyRuleError(f"Se esperaba '{value or kind}' en '{self.condition}'")
+
+    def parse(self) -> tuple:
+        node = self._expr()
+        if self._peek() is not None:
+            raise PolicyRuleError(f"Token inesperado '{self._peek()[1]}' en '{self.condition}'")
+        return node
+
+    def _expr(self) -> tuple:
+        node = self._and_expr()
+        while self._accept("keyword", "OR"):
+            node = ("or", node, self._and_expr())
+        return node
+
+    def _and_expr(self) -> tuple:
+        node = self._not_expr()
+        while self._accept("keyword", "AND"):
+            node = ("and", node, self._not_expr())
+        return node
+
+    def _not_expr(self) -> tuple:
+        if self._accept("keyword", "NOT"):
+            return ("not", self._not_expr())
+        return self._comparison()
+
+    def _comparison(self) -> tuple:
+        if self._accept("punct", "("):
+            node = self._expr()
+            self._expect("punct", ")")
+            return node
+
+        left = self._operand()
+        token = self._peek()
+
+        if token and token[0] == "op":
+            self._next()
+            op, right = token[1], self._operand()
+            left_type, right_type = _operand_type(left), _operand_type(right)
+            if left_type != right_type:
+                raise PolicyRuleError(
+                    f"Tipos incompatibles en '{_describe(left)} {op} {_describe(right)}': "
+                    f"{left_type} y {right_type}"
+                )
+            if op in _ORDERING_OPS and left_type != "number":
+                raise PolicyRuleError(f"'{op}' solo aplica a números; '{_describe(left)}' es {left_type}")
+            return ("cmp", op, left, right)
+
+        if self._accept("keyword", "IN"):
+            self._expect("punct", "(")
+            values = [self._literal()]
+            while self._accept("punct", ","):
+                values.append(self._literal())
+            self._expect("punct", ")")
+            left_type = _operand_type(left)
+            for value in values:
+                if _operand_type(("const", value)) != left_type:
+                    raise PolicyRuleError(
+                        f"Tipos incompatibles en IN: '{_describe(left)}' es {left_type} "
+                        f"y {value!r} es {_operand_type(('const', value))}"
+                    )
+            return ("in", left, tuple(values))
+
+        # Operando solo: debe ser booleano (ej: is_new_device, TRUE)
+        if _operand_type(left) != "bool":
+            raise PolicyRuleError(f"'{_describe(left)}' no es booleana; use una comparación")
+        return left
+
+    def _operand(self) -> tuple:
+        kind, value = self._next()
+        if kind == "word":
+            if value not in FEATURES:
+                raise PolicyRuleError(f"Variable desconocida '{value}'. Disponibles: {', '.join(sorted(FEATURES))}")
+            return ("var", value)
+        if kind in ("number", "string"):
+            return ("const", value)
+        if kind == "keyword" and value in ("TRUE", "FALSE"):
+            return ("const", value == "TRUE")
+        raise PolicyRuleError(f"Operando inválido '{value}' en '{self.condition}'")
+
+    def _literal(self):
+        node = self._operand()
+        if node[0] != "const":
+            raise PolicyRuleError("Los valores de IN deben ser literales")
+        return node[1]
+
+
+_ORDERING_OPS = {">", ">=", "<", "<="}
+
+
+def _operand_type(node: tuple) -> str:
+    """Tipo de un operando: number, bool o string"""
+    if node[0] == "var":
+        return FEATURE_TYPES[node[1]]
+    value = node[1]
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, float):
+        return "number"
+    return "string"
+
+
+def _describe(node: tuple) -> str:
+    return node[1] if node[0] == "var" else repr(node[1])
+
+
+# ============================================
+# COMPILACIÓN
+# ============================================
+
+_COMPARATORS = {
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+}
+
+
+def _compile_scalar(node: tuple) -> Callable[[Mapping], object]:
+    """Compilar AST a función sobre un diccionario de variables"""
+    kind = node[0]
+
+    if kind == "const":
+        value = node[1]
+        return lambda features: value
+    if kind == "var":
+        name = node[1]
+        return lambda features: features[name]
+    if kind == "not":
+        operand = _compile_scalar(node[1])
+        return lambda features: not operand(features)
+    if kind == "and":
+        left, right = _compile_scalar(node[1]), _compile_scalar(node[2])
+        return lambda features: bool(left(features)) and bool(right(features))
+    if kind == "or":
+        left, right = _compile_scalar(node[1]), _compile_scalar(node[2])
+        return lambda features: bool(left(features)) or bool(right(features))
+    if kind == "cmp":
+        comparator = _COMPARATORS[node[1]]
+        left, right = _compile_scalar(node[2]), _compile_scalar(node[3])
+        return lambda features: comparator(left(features), right(features))
+    if kind == "in":
+        operand, values = _compile_scalar(node[1]), frozenset(node[2])
+        return lambda features: operand(features) in values
+
+    raise PolicyRuleError(f"Nodo desconocido: {kind}")
+
+
+def _compile_vector(node: tuple) -> Callable[[Mapping], object]:
+    """Compilar AST a función sobre columnas NumPy (retorna máscara booleana)"""
+    import numpy as np
+
+    kind = node[0]
+
+    if kind == "const":
+        value = node[1]
+        return lambda columns: value
+    if kind == "var":
+        name = node[1]
+        return lambda columns: columns[name]
+    if kind == "not":
+        operand = _compile_vector(node[1])
+        return lambda columns: ~np.asarray(operand(columns), dtype=bool)
+    if kind == "and":
+        left, right = _compile_vector(node[1]), _compile_vector(node[2])
+        return lambda columns: np.logical_and(left(columns), right(columns))
+    if kind == "or":
+        left, right = _compile_vector(node[1]), _compile_vector(node[2])
+        return lambda columns: np.logical_or(left(columns), right(columns))
+    if kind == "cmp":
+        comparator = _COMPARATORS[node[1]]
+        left, right = _compile_vector(node[2]), _compile_vector(node[3])
+        return lambda columns: comparator(left(columns), right(columns))
+    if kind == "in":
+        operand, values = _compile_vector(node[1]), list(node[2])
+        return lambda columns: np.isin(operand(columns), values)
+
+    raise PolicyRuleError(f"Nodo desconocido: {kind}")
+
+
+class CompiledRule:
+    """Condición de política compilada"""
+
+    def __init__(self, condition: str):
+        self.condition = condition
+        self.ast = _Parser(condition).parse()
+        self._predicate = _compile_scalar(self.ast)
+        self._vector = None
+
+    def evaluate(self, features: Mapping) -> bool:
+        """Evaluar la condición para una transacción"""
+        return bool(self._predicate(features))
+
+    def evaluate_batch(self, columns: Mapping):
+        """
+        Evaluar la condición sobre un lote
+
+        Args:
+            columns: Diccionario variable → array NumPy (mismo largo)
+
+        Returns:
+            Máscara booleana NumPy
+        """
+        import numpy as np
+
+        if self._vector is None:
+            self._vector = _compile_vector(self.ast)
+
+        size = len(next(iter(columns.values()))) if columns else 0
+        mask = self._vector(columns)
+        return np.broadcast_to(np.asarray(mask, dtype=bool), (size,))
+
+
+@lru_cache(maxsize=256)
+def compile_condition(condition: str) -> CompiledRule:
+    """Compilar una condición (cacheado: cada condición se compila una sola vez)"""
+    return CompiledRule(condition)
+
+
+def get_policy_rule(policy: Dict) -> Optional[CompiledRule]:
+    """Obtener la regla compilada de una política, o None si no tiene condición"""
+    condition = (policy.get("condition") or "").strip()
+    if not condition:
+        return None
+    return compile_condition(condition)
+
+
+def load_policy_rule(policy: Dict) -> Optional[CompiledRule]:
+    """
+    Como get_policy_rule, pero una condición inválida no interrumpe el análisis
+
+    Returns:
+        Regla compilada, o None si no tiene condición o es inválida (se usa el LLM)
+    """
+    try:
+        return get_policy_rule(policy)
+    except PolicyRuleError as e:
+        print(f"   ⚠️ Condición inválida en {policy.get('policy_id')}: {e} (se evalúa con LLM)")
+        return None
+
+
+def validate_condition(condition: Optional[str]) -> Optional[str]:
+    """Mensaje de error de una condición, o None si es válida o está vacía"""
+    if not (condition or "").strip():
+        return None
+    try:
+        compile_condition(condition.strip())
+    except PolicyRuleError as e:
+        return str(e)
+    return None
+
+
+# ============================================
+# EXTRACCIÓN DE VARIABLES
+# ============================================
+
+# Tipo de cada variable de extract_features / build_feature_columns (verificación al compilar)
+FEATURE_TYPES = {
+    **{name: "number" for name in NUMERIC_FEATURES},
+    **{name: "bool" for name in BOOLEAN_FEATURES},
+    **{name: "string" for name in STRING_FEATURES},
+}
+
+
+def _parse_usual_hours(usual_hours: str) -> tuple:
+    start, end = usual_hours.split("-")
+    return int(start), int(end)
+
+
+def _split_list(value: str) -> List[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def extract_features(
+    transaction: Transaction,
+    customer_behavior: Optional[CustomerBehavior]
+) -> Optional[Dict]:
+    """
+    Calcular las variables de una transacción
+
+    Returns:
+        Dict de variables, o None si no hay comportamiento del cliente
+    """
+    if not customer_behavior:
+        return None
+
+    start_hour, end_hour = _parse_usual_hours(customer_behavior.usual_hours)
+    hour = transaction.timestamp.hour
+
+    return {
+        "amount": transaction.amount,
+        "amount_ratio": transaction.amount / customer_behavior.usual_amount_avg,
+        "usual_amount_avg": customer_behavior.usual_amount_avg,
+        "hour": hour,
+        "in_usual_hours": start_hour <= hour <= end_hour,
+        "is_international": transaction.country not in _split_list(customer_behavior.usual_countries),
+        "is_new_device": transaction.device_id not in _split_list(customer_behavior.usual_devices),
+        "channel": getattr(transaction.channel, "value", transaction.channel),
+        "country": transaction.country,
+        "merchant_id": transaction.merchant_id,
+        "currency": transaction.currency,
+    }
+
+
+def build_feature_columns(rows: Sequence[Mapping]) -> Dict:
+    """
+    Calcular las variables de un lote como columnas NumPy
+
+    Args:
+        rows: Filas con amount, transaction_timestamp, country, channel, device_id,
+              merchant_id, currency, usual_amount_avg, usual_hours,
+              usual_countries y usual_devices
+
+    Returns:
+        Diccionario variable → array NumPy
+    """
+    import numpy as np
+
+    amount = np.fromiter((row["amount"] for row in rows), dtype=float, count=len(rows))
+    usual_avg = np.fromiter((row["usual_amount_avg"] for row in rows), dtype=float, count=len(rows))
+    hour = np.fromiter((row["transaction_timestamp"].hour for row in rows), dtype=int, count=len(rows))
+
+    hours = [_parse_usual_hours(row["usual_hours"]) for row in rows]
+    start_hour = np.fromiter((h[0] for h in hours), dtype=int, count=len(rows))
+    end_hour = np.fromiter((h[1] for h in hours), dtype=int, count=len(rows))
+
+    return {
+        "amount": amount,
+        "amount_ratio": amount / usual_avg,
+        "usual_amount_avg": usual_avg,
+        "hour": hour,
+        "in_usual_hours": (start_hour <= hour) & (hour <= end_hour),
+        "is_international": np.array(
+            [row["country"] not in _split_list(row["usual_countries"]) for row in rows], dtype=bool
+        ),
+        "is_new_device": np.array(
+            [row["device_id"] not in _split_list(row["usual_devices"]) for row in rows], dtype=bool
+        ),
+        "channel": np.array([row["channel"] for row in rows], dtype=object),
+        "country": np.array([row["country"] for row in rows], dtype=object),
+        "merchant_id": np.array([row["merchant_id"] for row in rows], dtype=object),
+        "currency": np.array([row["currency"] for row in rows], dtype=object),
+    }
@@ -0,0 +1,100 @@
+"""
+Customer Profile Store - Perfiles de comportamiento habitual en memoria
+Evita releer data/customer_behavior.json (o la BD) en cada análisis
+"""
+from typing import Dict, Optional
+from pathlib import Path
+import json
+import threading
+
+
+class CustomerProfileStore:
+    """Cache en memoria de perfiles de comportamiento (customer_behaviors)"""
+
+    def __init__(self, json_path: str = "data/customer_behavior.json"):
+        """
+        Inicializar store de perfiles
+
+        Args:
+            json_path: JSON de respaldo si la tabla de perfiles está vacía
+        """
+        self.json_path = json_path
+        self._profiles: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _to_dict(behavior_db) -> Dict:
+        return {
+            "customer_id": behavior_db.customer_id,
+            "usual_amount_avg": behavior_db.usual_amount_avg,
+            "usual_hours": behavior_db.usual_hours,
+            "usual_countries": behavior_db.usual_countries,
+            "usual_devices": behavior_db.usual_devices,
+        }
+
+    def load(self):
+        """Cargar (o recargar) todos los perfiles desde la BD, con JSON como respaldo"""
+        from app.database.connection import SessionLocal
+        from app.database.models import CustomerBehaviorDB
+
+        profiles = {}
+
+        db = SessionLocal()
+        try:
+            for behavior_db in db.query(CustomerBehaviorDB).all():
+                profiles[behavior_db.customer_id] = self._to_dict(behavior_db)
+        finally:
+            db.close()
+
+        if not profiles and Path(self.json_path).exists():
+            with open(self.json_path, "r", encoding="utf-8") as f:
+                profiles = json.load(f)
+
+        with self._lock:
+            self._profiles = profiles
+
+        print(f"   ✅ Perfiles de clientes cargados: {len(profiles)}")
+
+    def get(self, customer_id: str) -> Optional[Dict]:
+        """Obtener el perfil de un cliente (consulta la BD solo si no está en memoria)"""
+        profile = self._profiles.get(customer_id)
+        if profile is not None:
+            return profile
+
+        from app.database.connection import SessionLocal
+        from app.database.models import CustomerBehaviorDB
+
+        db = SessionLocal()
+        try:
+            behavior_db = db.get(CustomerBehaviorDB, customer_id)
+            if not behavior_db:
+                return None
+            profile = self._to_dict(behavior_db)
+        finally:
+            db.close()
+
+        with self._lock:
+            self._profiles[customer_id] = profile
+        return profile
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+
+# ============================================
+# INSTANCIA GLOBAL
+# ============================================
+
+_profile_store_instance = None
+_profile_store_lock = threading.Lock()
+
+
+def get_profile_store() -> CustomerProfileStore:
+    """Obtener instancia única del store de perfiles"""
+    global _profile_store_instance
+    if _profile_store_instance is None:
+        with _profile_store_lock:
+            if _profile_store_instance is None:
+                _profile_store_instance = CustomerProfileStore()
+    return _profile_store_instance
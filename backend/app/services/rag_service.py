@@ -5,10 +5,19 @@ Gestiona ChromaDB y búsqueda de políticas internas
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
-from typing import List, Dict
+from typing import List, Dict, Optional
+from datetime import date, datetime
 import json
 from pathlib import Path
 import os
+import threading
+
+
+POLICY_STATUS_ACTIVE = "active"
+POLICY_STATUS_RETIRED = "retired"
+
+# Vigencia abierta (sin fecha de fin)
+OPEN_ENDED_DATE_KEY = 99991231
 
 
 class RAGService:
@@ -62,19 +71,82 @@ class RAGService:
             )
             print(f"✅ Colección '{self.collection_name}' creada con OpenAI embeddings")
     
+    @staticmethod
+    def _date_key(value) -> int:
+        """Convertir fecha ISO (YYYY-MM-DD) o datetime a entero YYYYMMDD para filtros de rango"""
+        if value is None:
+            return 0
+        if isinstance(value, (datetime, date)):
+            return int(value.strftime("%Y%m%d"))
+        return int(str(value)[:10].replace("-", ""))
+    
+    @staticmethod
+    def _policy_document_id(policy_id: str, version: str) -> str:
+        """ID del documento en ChromaDB: una entrada por política y versión"""
+        return f"{policy_id}@{version}"
+    
+    def _build_policy_metadata(self, policy: Dict) -> Dict:
+        """
+        Construir metadatos filtrables de una política
+        
+        ChromaDB solo admite valores escalares, por lo que los ámbitos de canal y
+        país se guardan como banderas booleanas (channel_web, country_PE, ...) y
+        las fechas de vigencia como enteros YYYYMMDD.
+        """
+        from app.services.policy_rule_engine import validate_condition
+        
+        channels = policy.get("channels") or ["*"]
+        countries = policy.get("countries") or ["*"]
+        
+        # Una condición inválida no se guarda: la política se evalúa con el LLM
+        condition = policy.get("condition") or ""
+        error = validate_condition(condition)
+        if error:
+            print(f"   ⚠️ Condición inválida en {policy['policy_id']} v{policy['version']}: {error}")
+            condition = ""
+        
+        effective_from = policy.get("effective_from")
+        effective_to = policy.get("effective_to")
+        
+        metadata = {
+            "policy_id": policy["policy_id"],
+            "version": policy["version"],
+            "rule": policy["rule"],
+            "condition": condition,
+            "action": policy.get("action") or "",
+            "status": policy.get("status", POLICY_STATUS_ACTIVE),
+            "channels": ",".join(channels),
+            "countries": ",".join(countries),
+            "effective_from": effective_from or "",
+            "effective_to": effective_to or "",
+            "effective_from_key": self._date_key(effective_from),
+            "effective_to_key": self._date_key(effective_to) if effective_to else OPEN_ENDED_DATE_KEY,
+            "all_channels": "*" in channels,
+            "all_countries": "*" in countries,
+        }
+        
+        for channel in channels:
+            if channel != "*":
+                metadata[f"channel_{channel}"] = True
+        
+        for country in countries:
+            if country != "*":
+                metadata[f"country_{country}"] = True
+        
+        return metadata
+    
     def load_policies_from_json(self, json_path: str = "data/fraud_policies.json"):
         """
         Cargar políticas desde archivo JSON y agregarlas a ChromaDB
         
+        Cada versión de una política es un documento independiente, por lo que
+        solo se generan embeddings para las versiones que aún no existen en la
+        colección. Los cambios de metadatos (vigencia, condición) se actualizan
+        sin volver a generar embeddings.
+        
         Args:
             json_path: Ruta al archivo JSON con políticas
         """
-        # Verificar si ya hay datos
-        count = self.collection.count()
-        if count > 0:
-            print(f"   ℹ️  Ya hay {count} políticas en la base. Saltando carga.")
-            return
-        
         # Cargar JSON
         policy_path = Path(json_path)
         if not policy_path.exists():
@@ -84,55 +156,132 @@ class RAGService:
         with open(policy_path, "r", encoding="utf-8") as f:
             policies = json.load(f)
         
+        # Verificar qué versiones ya están cargadas
+        existing = self.collection.get(include=["metadatas"])
+        existing_metadata = {
+            doc_id: metadata
+            for doc_id, metadata in zip(existing["ids"], existing["metadatas"])
+            if metadata and "status" in metadata
+        }
+        
         # Preparar datos para ChromaDB
         documents = []
         metadatas = []
         ids = []
         
+        # Versiones existentes cuyos metadatos cambiaron (sin re-embedding)
+        updated_metadatas = []
+        updated_ids = []
+        
         for policy in policies:
-            policy_id = policy["policy_id"]
-            rule = policy["rule"]
-            version = policy["version"]
+            doc_id = self._policy_document_id(policy["policy_id"], policy["version"])
+            metadata = self._build_policy_metadata(policy)
+            current = existing_metadata.get(doc_id)
+            
+            if current is not None and current.get("rule") == metadata["rule"]:
+                if current != metadata:
+                    updated_metadatas.append(metadata)
+                    updated_ids.append(doc_id)
+                continue
             
             # El documento es la regla completa
-            document = f"Política {policy_id} (versión {version}): {rule}"
+            document = f"Política {policy['policy_id']} (versión {policy['version']}): {policy['rule']}"
             
             documents.append(document)
-            metadatas.append({
-                "policy_id": policy_id,
-                "version": version,
-                "rule": rule
-            })
-            ids.append(policy_id)
+            metadatas.append(metadata)
+            ids.append(doc_id)
+        
+        if updated_ids:
+            self.collection.update(ids=updated_ids, metadatas=updated_metadatas)
+            print(f"   🔄 {len(updated_ids)} políticas con metadatos actualizados")
+        
+        if not ids:
+            print(f"   ℹ️  Ya hay {len(existing_metadata)} políticas en la base. Saltando carga.")
+            return
+        
+        # Eliminar entradas sin metadatos de vigencia (formato anterior)
+        legacy_ids = [doc_id for doc_id in existing["ids"] if doc_id not in existing_metadata]
+        if legacy_ids:
+            self.collection.delete(ids=legacy_ids)
         
         # Agregar a ChromaDB (usará OpenAI para generar embeddings)
-        self.collection.add(
+        self.collection.upsert(
             documents=documents,
             metadatas=metadatas,
             ids=ids
         )
         
-        print(f"   ✅ {len(policies)} políticas cargadas en ChromaDB con OpenAI embeddings")
+        print(f"   ✅ {len(ids)} políticas cargadas en ChromaDB con OpenAI embeddings")
+    
+    def _build_where_filter(
+        self,
+        channel: Optional[str] = None,
+        country: Optional[str] = None,
+        as_of=None,
+        status: Optional[str] = POLICY_STATUS_ACTIVE
+    ) -> Optional[Dict]:
+        """Construir filtro de metadatos para ChromaDB"""
+        conditions = []
+        
+        if status:
+            conditions.append({"status": {"$eq": status}})
+        
+        if channel:
+            conditions.append({"$or": [
+                {"all_channels": {"$eq": True}},
+                {f"channel_{channel}": {"$eq": True}}
+            ]})
+        
+        if country:
+            conditions.append({"$or": [
+                {"all_countries": {"$eq": True}},
+                {f"country_{country}": {"$eq": True}}
+            ]})
+        
+        if as_of is not None:
+            date_key = self._date_key(as_of)
+            conditions.append({"effective_from_key": {"$lte": date_key}})
+            conditions.append({"effective_to_key": {"$gte": date_key}})
+        
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"$and": conditions}
     
     def search_policies(
         self,
         query: str,
-        n_results: int = 3
+        n_results: int = 3,
+        channel: Optional[str] = None,
+        country: Optional[str] = None,
+        as_of=None,
+        status: Optional[str] = POLICY_STATUS_ACTIVE
     ) -> List[Dict]:
         """
         Buscar políticas relevantes usando búsqueda semántica
         
+        Los filtros se aplican antes del ranking, por lo que solo se puntúan
+        las políticas elegibles para la transacción.
+        
         Args:
             query: Consulta en lenguaje natural
             n_results: Número de resultados a retornar
+            channel: Solo políticas que apliquen a este canal (opcional)
+            country: Solo políticas que apliquen a este país (opcional)
+            as_of: Solo políticas vigentes en esta fecha (opcional)
+            status: Estado de la política (default: active, None = cualquiera)
         
         Returns:
             Lista de políticas relevantes con metadatos
         """
+        where = self._build_where_filter(channel, country, as_of, status)
+        
         # Buscar en ChromaDB (usará OpenAI para el embedding del query)
         results = self.collection.query(
             query_texts=[query],
-            n_results=n_results
+            n_results=n_results,
+            where=where
         )
         
         # Formatear resultados
@@ -143,36 +292,56 @@ class RAGService:
                 metadata = results["metadatas"][0][i]
                 distance = results["distances"][0][i] if "distances" in results else None
                 
-                policies.append({
-                    "policy_id": metadata["policy_id"],
-                    "rule": metadata["rule"],
-                    "version": metadata["version"],
-                    "relevance_score": 1 - distance if distance else 0.5,
-                    "chunk_id": str(i + 1)
-                })
+                policy = self._format_policy(metadata)
+                policy["relevance_score"] = 1 - distance if distance else 0.5
+                policy["chunk_id"] = str(i + 1)
+                policies.append(policy)
         
         return policies
     
-    def get_policy_by_id(self, policy_id: str) -> Dict:
+    @staticmethod
+    def _format_policy(metadata: Dict) -> Dict:
+        """Convertir metadatos de ChromaDB a diccionario de política"""
+        return {
+            "policy_id": metadata["policy_id"],
+            "rule": metadata["rule"],
+            "version": metadata["version"],
+            "condition": metadata.get("condition") or None,
+            "action": metadata.get("action") or None,
+            "status": metadata.get("status", POLICY_STATUS_ACTIVE),
+            "channels": metadata.get("channels", "*").split(","),
+            "countries": metadata.get("countries", "*").split(","),
+            "effective_from": metadata.get("effective_from") or None,
+            "effective_to": metadata.get("effective_to") or None,
+        }
+    
+    def get_policy_by_id(self, policy_id: str, version: str = None, as_of=None) -> Dict:
         """
         Obtener una política específica por su ID
         
         Args:
             policy_id: ID de la política
+            version: Versión exacta (opcional)
+            as_of: Fecha de vigencia (opcional, default: versión activa más reciente)
         
         Returns:
             Política con metadatos
         """
         try:
-            result = self.collection.get(ids=[policy_id])
+            if version:
+                result = self.collection.get(ids=[self._policy_document_id(policy_id, version)])
+            else:
+                where = self._build_where_filter(as_of=as_of)
+                where = {"$and": [{"policy_id": {"$eq": policy_id}}, where]}
+                result = self.collection.get(where=where)
             
             if result and result["ids"]:
-                metadata = result["metadatas"][0]
-                return {
-                    "policy_id": metadata["policy_id"],
-                    "rule": metadata["rule"],
-                    "version": metadata["version"]
-                }
+                # Si hay varias versiones vigentes, usar la de inicio más reciente
+                metadata = max(
+                    result["metadatas"],
+                    key=lambda m: (m.get("effective_from_key", 0), m["version"])
+                )
+                return self._format_policy(metadata)
         except:
             pass
         
@@ -199,12 +368,23 @@ class RAGService:
 # ============================================
 
 _rag_service = None
+_rag_lock = threading.Lock()
 
 def get_rag_service() -> RAGService:
-    """Obtener instancia única del servicio RAG"""
+    """
+    Obtener instancia única del servicio RAG
+    
+    Thread-safe: si varios requests llegan antes de que termine la
+    inicialización, solo uno crea el cliente y carga las políticas.
+    """
     global _rag_service
-    if _rag_service is None:
-        _rag_service = RAGService()
-        # Cargar políticas al iniciar
-        _rag_service.load_policies_from_json()
+    if _rag_service is not None:
+        return _rag_service
+    
+    with _rag_lock:
+        if _rag_service is None:
+            service = RAGService()
+            # Cargar políticas al iniciar
+            service.load_policies_from_json()
+            _rag_service = service
     return _rag_service
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+Readiness Service - Precalentamiento de componentes y estado para /ready
+"""
+from app.config import get_settings
+from typing import Callable, Dict
+from datetime import datetime, timedelta
+import threading
+import time
+
+
+class ComponentStatus:
+    """Estados posibles de un componente"""
+    PENDING = "pending"
+    WARMING = "warming"
+    READY = "ready"
+    FAILED = "failed"
+
+
+class ReadinessService:
+    """Registra el estado de cada componente y ejecuta el warmup al iniciar (reintentando los fallidos)"""
+
+    def __init__(self, retry_initial_seconds: float = 2.0, retry_max_seconds: float = 60.0):
+        self._lock = threading.Lock()
+        self._components: Dict[str, Dict] = {}
+        self._warmups: Dict[str, Callable] = {}
+        self._attempts: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self.retry_initial_seconds = retry_initial_seconds
+        self.retry_max_seconds = retry_max_seconds
+
+    def register(self, name: str, warmup: Callable = None):
+        """
+        Registrar un componente requerido para estar listo
+
+        Args:
+            name: Nombre del componente
+            warmup: Función que lo inicializa (None si se marca manualmente)
+        """
+        with self._lock:
+            self._components[name] = {
+                "status": ComponentStatus.PENDING,
+                "error": None,
+                "duration_ms": None,
+                "updated_at": datetime.now().isoformat(),
+            }
+            if warmup:
+                self._warmups[name] = warmup
+
+    def mark(self, name: str, status: str, error: str = None, duration_ms: float = None, **extra):
+        """Actualizar el estado de un componente"""
+        with self._lock:
+            self._components[name] = {
+                "status": status,
+                "error": error,
+                "duration_ms": duration_ms,
+                "updated_at": datetime.now().isoformat(),
+                **extra,
+            }
+
+    def _run(self, name: str, warmup: Callable) -> bool:
+        """Ejecutar el warmup de un componente y registrar el resultado"""
+        attempts = self._attempts.get(name, 0) + 1
+        self._attempts[name] = attempts
+        self.mark(name, ComponentStatus.WARMING, attempts=attempts)
+        start = time.time()
+        try:
+            warmup()
+            duration_ms = (time.time() - start) * 1000
+            self.mark(name, ComponentStatus.READY, duration_ms=duration_ms, attempts=attempts)
+            print(f"   ✅ {name} listo ({duration_ms:.0f}ms)")
+            return True
+        except Exception as e:
+            duration_ms = (time.time() - start) * 1000
+            self.mark(name, ComponentStatus.FAILED, error=str(e), duration_ms=duration_ms, attempts=attempts)
+            print(f"   ❌ {name} falló (intento {attempts}): {e}")
+            return False
+
+    def warmup(self):
+        """
+        Inicializar en orden todos los componentes registrados con función de warmup
+        
+        Los que fallan (p. ej. un error transitorio de OpenAI o Chroma al
+        arrancar) se reintentan con backoff exponencial hasta que estén listos
+        o se llame a stop(); mientras tanto /ready sigue retornando 503.
+        """
+        print("\n🔥 Precalentando componentes...")
+
+        failed = [name for name, warmup in list(self._warmups.items()) if not self._run(name, warmup)]
+        print(f"🔥 Warmup completado - {'LISTO' if self.is_ready() else 'NO LISTO'}\n")
+
+        delay = self.retry_initial_seconds
+        while failed:
+            next_retry_at = (datetime.now() + timedelta(seconds=delay)).isoformat()
+            for name in failed:
+                with self._lock:
+                    self._components[name]["next_retry_at"] = next_retry_at
+            if self._stop.wait(delay):
+                return
+
+            failed = [name for name in failed if not self._run(name, self._warmups[name])]
+            if not failed:
+                print(f"🔥 Componentes recuperados - {'LISTO' if self.is_ready() else 'NO LISTO'}")
+            delay = min(delay * 2, self.retry_max_seconds)
+
+    def stop(self):
+        """Detener los reintentos de warmup (al apagar)"""
+        self._stop.set()
+
+    def is_ready(self) -> bool:
+        """True si todos los componentes están listos"""
+        with self._lock:
+            return all(c["status"] == ComponentStatus.READY for c in self._components.values())
+
+    def snapshot(self) -> Dict:
+        """Estado de todos los componentes"""
+        with self._lock:
+            return {name: dict(component) for name, component in self._components.items()}
+
+
+# ============================================
+# INSTANCIA GLOBAL
+# ============================================
+
+_readiness_instance = None
+
+
+def _warmup_profiles():
+    from app.services.profile_store import get_profile_store
+    get_profile_store()
+
+
+def _warmup_threat_feed():
+    from app.services.threat_feed_service import get_threat_feed
+    get_threat_feed()
+
+
+def _warmup_llm():
+    from app.services.llm_service import warmup_llm_clients
+    warmup_llm_clients()
+
+
+def _warmup_rag():
+    from app.services.rag_service import get_rag_service
+    get_rag_service()
+
+
+def get_readiness_service() -> ReadinessService:
+    """Obtener instancia única del servicio de readiness"""
+    global _readiness_instance
+    if _readiness_instance is None:
+        settings = get_settings()
+        service = ReadinessService(
+            retry_initial_seconds=settings.READINESS_RETRY_INITIAL_SECONDS,
+            retry_max_seconds=settings.READINESS_RETRY_MAX_SECONDS,
+        )
+        service.register("database")
+        service.register("profiles", _warmup_profiles)
+        service.register("threat_feed", _warmup_threat_feed)
+        service.register("llm", _warmup_llm)
+        service.register("rag", _warmup_rag)
+        _readiness_instance = service
+    return _readiness_instance
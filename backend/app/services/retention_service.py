@@ -0,0 +1,302 @@
+"""
+Retention Service - Archivo por meses de las decisiones fuera de la ventana activa
+Las decisiones más antiguas que RETENTION_HOT_DAYS (con sus señales, citaciones
+y logs) se mueven por lotes a archivos SQLite mensuales con el detalle completo
+comprimido; en la base principal queda solo un índice (archived_decisions) para
+que el detalle de la transacción se siga encontrando.
+"""
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, LargeBinary, insert, select, delete
+from sqlalchemy.orm import Session
+from app.database.models import (
+    FraudDecisionDB, ArchivedDecisionDB, SignalDB, InternalCitationDB,
+    ExternalCitationDB, AnalysisLogDB, AnalysisLogBlobDB
+)
+from app.config import get_settings
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import json
+import os
+import threading
+import zlib
+
+
+ARCHIVE_ENCODING = "json+zlib"
+
+# Tabla de cada archivo mensual (metadata propia: no se crea en la base principal)
+archive_metadata = MetaData()
+archived_documents = Table(
+    "archived_documents",
+    archive_metadata,
+    Column("decision_id", Integer, primary_key=True),
+    Column("transaction_id", String(50), nullable=False, index=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("encoding", String(20), nullable=False),
+    Column("payload", LargeBinary, nullable=False),
+)
+
+# Tablas hijas que se vacían al archivar (todas con decision_id)
+_CHILD_TABLES = (SignalDB, InternalCitationDB, ExternalCitationDB, AnalysisLogDB, AnalysisLogBlobDB)
+
+
+def archive_month(created_at: datetime) -> str:
+    """Partición mensual de una decisión (YYYY-MM)"""
+    return created_at.strftime("%Y-%m")
+
+
+def _encode_document(document: Dict) -> bytes:
+    raw = json.dumps(document, default=str, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(raw.encode("utf-8"), 6)
+
+
+def _decode_document(payload: bytes, encoding: str) -> Dict:
+    if encoding != ARCHIVE_ENCODING:
+        raise ValueError(f"Codificación de archivo no soportada: {encoding}")
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+class ArchiveStore:
+    """Archivos mensuales decisions-YYYY-MM.db (un engine por mes, creado al primer uso)"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def path(self, month: str) -> str:
+        return os.path.join(self.directory, f"decisions-{month}.db")
+
+    def engine(self, month: str, create: bool = False):
+        """Engine del archivo del mes (None si no existe y create es False)"""
+        engine = self._engines.get(month)
+        if engine is not None:
+            return engine
+
+        with self._lock:
+            if month not in self._engines:
+                path = self.path(month)
+                if not create and not os.path.exists(path):
+                    return None
+                from app.database.connection import build_engine
+
+                os.makedirs(self.directory, exist_ok=True)
+                engine = build_engine(f"sqlite:///{path}")
+                archive_metadata.create_all(bind=engine)
+                self._engines[month] = engine
+            return self._engines[month]
+
+    def write(self, month: str, rows: List[Dict]):
+        """Guardar documentos en el archivo del mes (idempotente: reemplaza por decision_id)"""
+        with self.engine(month, create=True).begin() as conn:
+            conn.execute(insert(archived_documents).prefix_with("OR REPLACE"), rows)
+
+    def read(self, month: str, decision_id: int) -> Optional[Dict]:
+        """Documento archivado de una decisión (None si no está)"""
+        engine = self.engine(month)
+        if engine is None:
+            return None
+        with engine.connect() as conn:
+            row = conn.execute(
+                select(archived_documents.c.encoding, archived_documents.c.payload)
+                .where(archived_documents.c.decision_id == decision_id)
+            ).first()
+        return _decode_document(row.payload, row.encoding) if row else None
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+
+class RetentionService:
+    """Servicio de retención: archivo por lotes y lectura transparente de lo archivado"""
+
+    @staticmethod
+    def cutoff(now: datetime = None) -> datetime:
+        """Límite de la ventana activa (las decisiones anteriores se archivan)"""
+        return (now or datetime.utcnow()) - timedelta(days=get_settings().RETENTION_HOT_DAYS)
+
+    @staticmethod
+    def archive_batch(db: Session, cutoff: datetime, batch_size: int = 500) -> int:
+        """
+        Archivar un lote de las decisiones más antiguas anteriores a cutoff
+
+        Primero se escribe el archivo mensual (idempotente) y después, en una
+        sola transacción de la base principal, se agrega el índice y se borran
+        la decisión y sus hijas. Si el proceso cae entre ambos pasos, el
+        siguiente lote vuelve a escribir los mismos documentos.
+
+        Returns:
+            Número de decisiones archivadas (0 si no quedan)
+        """
+        from app.services.persistence_service import PersistenceService
+        from app.services.search_service import SearchService
+
+        rows = PersistenceService._detail_query(db).filter(
+            FraudDecisionDB.created_at < cutoff
+        ).order_by(FraudDecisionDB.created_at.asc(), FraudDecisionDB.id.asc()).limit(batch_size).all()
+
+        if not rows:
+            return 0
+
+        decision_ids = [row[0].id for row in rows]
+        children = PersistenceService._detail_children(db, decision_ids)
+        logs = PersistenceService.get_analysis_logs_bulk(db, decision_ids)
+
+        # 1. Documentos completos al archivo de cada mes
+        documents: Dict[str, List[Dict]] = {}
+        index_rows = []
+        for decision, transaction, customer, country, channel, merchant in rows:
+            month = archive_month(decision.created_at)
+            document = PersistenceService._detail_document(
+                decision, transaction, customer, country, channel, merchant,
+                *children[decision.id], logs[decision.id]
+            )
+            documents.setdefault(month, []).append({
+                "decision_id": decision.id,
+                "transaction_id": decision.transaction_id,
+                "created_at": decision.created_at,
+                "encoding": ARCHIVE_ENCODING,
+                "payload": _encode_document(document),
+            })
+            index_rows.append({
+                "decision_id": decision.id,
+                "transaction_id": decision.transaction_id,
+                "customer_id": decision.customer_id or transaction.customer_id,
+                "decision": decision.decision,
+                "risk_score": decision.risk_score,
+                "processing_time_ms": decision.processing_time_ms,
+                "created_at": decision.created_at,
+                "archive_month": month,
+            })
+
+        store = get_archive_store()
+        for month, month_documents in documents.items():
+            store.write(month, month_documents)
+
+        # 2. Índice y borrado de las tablas activas (una transacción)
+        try:
+            db.execute(insert(ArchivedDecisionDB), index_rows)
+            for model in _CHILD_TABLES:
+                db.execute(delete(model).where(model.decision_id.in_(decision_ids)))
+            db.execute(delete(FraudDecisionDB).where(FraudDecisionDB.id.in_(decision_ids)))
+            SearchService.remove_decisions(db, decision_ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        PersistenceService.invalidate_transaction_details({row["transaction_id"] for row in index_rows})
+        return len(decision_ids)
+
+    @staticmethod
+    def run_once(cutoff: datetime = None, batch_size: int = None, max_batches: int = None) -> Dict:
+        """
+        Archivar por lotes hasta vaciar la ventana vencida (sesión propia)
+
+        Args:
+            cutoff: Límite (default: ahora - RETENTION_HOT_DAYS)
+            batch_size: Decisiones por lote (default: RETENTION_BATCH_SIZE)
+            max_batches: Tope de lotes por ejecución (None = sin tope)
+
+        Returns:
+            Dict con cutoff, batches y archived
+        """
+        from app.database.connection import SessionLocal
+
+        cutoff = cutoff or RetentionService.cutoff()
+        batch_size = batch_size or get_settings().RETENTION_BATCH_SIZE
+        batches = 0
+        archived = 0
+
+        db = SessionLocal()
+        try:
+            while max_batches is None or batches < max_batches:
+                count = RetentionService.archive_batch(db, cutoff, batch_size)
+                if not count:
+                    break
+                batches += 1
+                archived += count
+        finally:
+            db.close()
+
+        if archived:
+            print(f"   🗄️  Retención: {archived} decisiones archivadas en {batches} lotes (< {cutoff.isoformat()})")
+        return {"cutoff": cutoff.isoformat(), "batches": batches, "archived": archived}
+
+    @staticmethod
+    def _latest_archived(db: Session, transaction_id: str) -> Tuple[Optional[ArchivedDecisionDB], Optional[Dict]]:
+        """Última decisión archivada de una transacción y su documento"""
+        entry = db.query(ArchivedDecisionDB).filter(
+            ArchivedDecisionDB.transaction_id == transaction_id
+        ).order_by(ArchivedDecisionDB.decision_id.desc()).first()
+
+        if entry is None:
+            return None, None
+        return entry, get_archive_store().read(entry.archive_month, entry.decision_id)
+
+    @staticmethod
+    def get_archived_details(db: Session, transaction_id: str, include_logs: bool = True) -> Optional[Dict]:
+        """Detalle de una transacción archivada (mismo formato que get_transaction_details)"""
+        entry, document = RetentionService._latest_archived(db, transaction_id)
+        if document is None:
+            return None
+
+        if not include_logs:
+            document["analysis_logs"] = None
+        document["archived"] = True
+        return document
+
+    @staticmethod
+    def get_archived_logs(db: Session, transaction_id: str) -> Optional[Tuple[int, List[Dict]]]:
+        """(decision_id, logs) de la última decisión archivada de una transacción"""
+        entry, document = RetentionService._latest_archived(db, transaction_id)
+        if document is None:
+            return None
+        return entry.decision_id, document.get("analysis_logs") or []
+
+
+async def retention_loop(interval_seconds: int):
+    """Tarea de fondo: archivar lo vencido cada interval_seconds (cancelar al apagar)"""
+    while True:
+        try:
+            await asyncio.to_thread(RetentionService.run_once)
+        except Exception as e:
+            print(f"   ⚠️ Error en retención: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+# ============================================
+# INSTANCIA GLOBAL
+# ============================================
+
+_archive_store = None
+_archive_store_lock = threading.Lock()
+
+
+def get_archive_store() -> ArchiveStore:
+    """Obtener el almacén de archivos mensuales"""
+    global _archive_store
+    if _archive_store is None:
+        with _archive_store_lock:
+            if _archive_store is None:
+                _archive_store = ArchiveStore(get_settings().RETENTION_ARCHIVE_DIR)
+    return _archive_store
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.services.retention_service [--hot-days 90] [--batch-size 500] [--max-batches N]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Archivar decisiones fuera de la ventana activa")
+    parser.add_argument("--hot-days", type=int, default=get_settings().RETENTION_HOT_DAYS)
+    parser.add_argument("--batch-size", type=int, default=get_settings().RETENTION_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int)
+    args = parser.parse_args()
+
+    print(json.dumps(RetentionService.run_once(
+        cutoff=datetime.utcnow() - timedelta(days=args.hot_days),
+        batch_size=args.batch_size,
+        max_batches=args.max_batches,
+    ), indent=2))
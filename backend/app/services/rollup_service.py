@@ -0,0 +1,293 @@
+"""
+Rollup Service - Agregados de decisiones por minuto, hora y día
+Se mantienen de forma incremental en cada escritura de decisiones y sirven
+las series de tiempo sin recorrer fraud_decisions.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert
+from app.database.models import DecisionRollupDB, FraudDecisionDB, ArchivedDecisionDB, DecisionTypeEnum
+from app.database.upsert import accumulate_rows
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import itertools
+import re
+
+
+GRANULARITIES = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+RISK_BUCKETS = 10
+NO_RISK_BUCKET = -1
+MAX_BUCKETS = 10000
+
+# Ventana más larga servida por minuto: los intervalos más antiguos se podan
+MINUTE_RETENTION = GRANULARITIES["minute"] * MAX_BUCKETS
+
+_WINDOW_PATTERN = re.compile(r"^(\d+)([mhd])$")
+_WINDOW_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Inicio del intervalo que contiene timestamp"""
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Granularidad no soportada: {granularity}")
+
+
+def risk_bucket(risk_score: Optional[float]) -> int:
+    """Bucket del histograma de riesgo (0-9), -1 si no hay score"""
+    if risk_score is None:
+        return NO_RISK_BUCKET
+    return min(max(int(risk_score * RISK_BUCKETS), 0), RISK_BUCKETS - 1)
+
+
+def parse_window(window: str) -> timedelta:
+    """Convertir una ventana tipo 90m, 24h o 7d a timedelta"""
+    match = _WINDOW_PATTERN.match(window.strip().lower())
+    if not match:
+        raise ValueError(f"Ventana inválida: {window} (use por ejemplo 90m, 24h o 7d)")
+    return timedelta(**{_WINDOW_UNITS[match.group(2)]: int(match.group(1))})
+
+
+class RollupService:
+    """Servicio de agregados temporales de decisiones"""
+
+    @staticmethod
+    def _aggregate(decisions: Iterable[Tuple[datetime, str, Optional[float], float]]) -> List[Dict]:
+        """Agrupar decisiones (created_at, decision, risk_score, processing_time_ms) en filas de rollup"""
+        rows: Dict[Tuple, Dict] = {}
+
+        for created_at, decision, risk_score, processing_time in decisions:
+            decision = getattr(decision, "value", decision)
+            bucket = risk_bucket(risk_score)
+            processing_time = processing_time or 0.0
+
+            for granularity in GRANULARITIES:
+                key = (granularity, bucket_start(created_at, granularity), decision, bucket)
+                row = rows.get(key)
+                if row is None:
+                    rows[key] = {
+                        "granularity": key[0],
+                        "bucket_start": key[1],
+                        "decision": key[2],
+                        "risk_bucket": key[3],
+                        "count": 1,
+                        "processing_time_sum": processing_time,
+                        "processing_time_max": processing_time,
+                    }
+                else:
+                    row["count"] += 1
+                    row["processing_time_sum"] += processing_time
+                    row["processing_time_max"] = max(row["processing_time_max"], processing_time)
+
+        return list(rows.values())
+
+    @staticmethod
+    def record(db: Session, decisions: List[FraudDecisionDB]):
+        """Acumular decisiones recién insertadas en los rollups (sin commit)"""
+        rows = RollupService._aggregate(
+            (d.created_at, d.decision, d.risk_score, d.processing_time_ms) for d in decisions
+        )
+        accumulate_rows(
+            db, DecisionRollupDB,
+            ["granularity", "bucket_start", "decision", "risk_bucket"], rows,
+            sum_columns=["count", "processing_time_sum"],
+            max_columns=["processing_time_max"],
+        )
+
+    @staticmethod
+    def rebuild(db: Session, chunk_size: int = 5000) -> int:
+        """
+        Recalcular todos los rollups desde fraud_decisions y archived_decisions
+
+        Returns:
+            Número de filas de rollup generadas
+        """
+        db.query(DecisionRollupDB).delete()
+
+        stream = db.query(
+            FraudDecisionDB.created_at, FraudDecisionDB.decision,
+            FraudDecisionDB.risk_score, FraudDecisionDB.processing_time_ms
+        ).filter(FraudDecisionDB.created_at.isnot(None)).yield_per(chunk_size)
+        archived = db.query(
+            ArchivedDecisionDB.created_at, ArchivedDecisionDB.decision,
+            ArchivedDecisionDB.risk_score, ArchivedDecisionDB.processing_time_ms
+        ).yield_per(chunk_size)
+
+        rows = RollupService._aggregate(itertools.chain(stream, archived))
+        for i in range(0, len(rows), chunk_size):
+            db.execute(insert(DecisionRollupDB), rows[i:i + chunk_size])
+        db.commit()
+
+        print(f"   ✅ Rollups de decisiones reconstruidos: {len(rows)} filas")
+        return len(rows)
+
+    @staticmethod
+    def prune_minute_buckets(db: Session, now: datetime = None) -> int:
+        """
+        Borrar los rollups por minuto fuera de MINUTE_RETENTION (los de hora y día se conservan)
+
+        Returns:
+            Número de filas borradas
+        """
+        cutoff = bucket_start((now or datetime.utcnow()) - MINUTE_RETENTION, "minute")
+        deleted = db.query(DecisionRollupDB).filter(
+            DecisionRollupDB.granularity == "minute",
+            DecisionRollupDB.bucket_start < cutoff,
+        ).delete(synchronize_session=False)
+        db.commit()
+
+        if deleted:
+            print(f"   🧹 Rollups por minuto podados: {deleted} filas (< {cutoff.isoformat()})")
+        return deleted
+
+    @staticmethod
+    def ensure_built(db: Session):
+        """Construir los rollups si aún no existen pero ya hay decisiones (primer despliegue)"""
+        if db.query(DecisionRollupDB.granularity).first() is None and db.query(FraudDecisionDB.id).first():
+            RollupService.rebuild(db)
+
+    @staticmethod
+    def get_timeseries(
+        db: Session,
+        granularity: str = "hour",
+        window: str = "24h",
+        date_from: datetime = None,
+        date_to: datetime = None,
+        decision: str = None
+    ) -> Dict:
+        """
+        Serie de tiempo de decisiones desde los rollups
+
+        Args:
+            db: Sesión de base de datos
+            granularity: minute, hour o day
+            window: Ventana hacia atrás desde date_to (ignorada si se da date_from)
+            date_from: Inicio (inclusive)
+            date_to: Fin (exclusivo, default: ahora)
+            decision: Filtrar por tipo de decisión (opcional)
+
+        Returns:
+            Dict con los parámetros y la lista de intervalos (incluye vacíos)
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularidad inválida: {granularity} (use minute, hour o day)")
+        if decision and decision not in DecisionTypeEnum.__members__:
+            raise ValueError(f"Decisión inválida: {decision}")
+
+        date_to = date_to or datetime.utcnow()
+        date_from = date_from or date_to - parse_window(window)
+        start = bucket_start(date_from, granularity)
+        step = GRANULARITIES[granularity]
+
+        if (date_to - start) / step > MAX_BUCKETS:
+            raise ValueError(f"La ventana excede {MAX_BUCKETS} intervalos de {granularity}")
+        if granularity == "minute" and start < bucket_start(datetime.utcnow() - MINUTE_RETENTION, "minute"):
+            raise ValueError(
+                f"Los intervalos por minuto solo se conservan {MINUTE_RETENTION.days} días (use hour o day)"
+            )
+
+        query = db.query(DecisionRollupDB).filter(
+            DecisionRollupDB.granularity == granularity,
+            DecisionRollupDB.bucket_start >= start,
+            DecisionRollupDB.bucket_start < date_to,
+        )
+        if decision:
+            query = query.filter(DecisionRollupDB.decision == decision)
+
+        decision_types = [decision] if decision else list(DecisionTypeEnum.__members__)
+        buckets: Dict[datetime, Dict] = {}
+        current = start
+        while current < date_to:
+            buckets[current] = {
+                "bucket_start": current,
+                "total": 0,
+                "by_decision": {d: 0 for d in decision_types},
+                "risk_histogram": [0] * RISK_BUCKETS,
+                "processing_time_sum": 0.0,
+                "max_processing_time_ms": 0.0,
+            }
+            current += step
+
+        for row in query.all():
+            bucket = buckets.get(row.bucket_start)
+            if bucket is None:
+                continue
+            bucket["total"] += row.count
+            bucket["by_decision"][row.decision] = bucket["by_decision"].get(row.decision, 0) + row.count
+            if row.risk_bucket != NO_RISK_BUCKET:
+                bucket["risk_histogram"][row.risk_bucket] += row.count
+            bucket["processing_time_sum"] += row.processing_time_sum
+            bucket["max_processing_time_ms"] = max(bucket["max_processing_time_ms"], row.processing_time_max)
+
+        series = []
+        for bucket in buckets.values():
+            total = bucket.pop("total")
+            time_sum = bucket.pop("processing_time_sum")
+            series.append({
+                "bucket_start": bucket["bucket_start"].isoformat(),
+                "total": total,
+                "by_decision": bucket["by_decision"],
+                "rates": {
+                    d: (count / total if total else 0.0) for d, count in bucket["by_decision"].items()
+                },
+                "risk_histogram": bucket["risk_histogram"],
+                "avg_processing_time_ms": time_sum / total if total else None,
+                "max_processing_time_ms": bucket["max_processing_time_ms"] if total else None,
+            })
+
+        return {
+            "granularity": granularity,
+            "date_from": start.isoformat(),
+            "date_to": date_to.isoformat(),
+            "decision": decision,
+            "risk_buckets": [f"{i / RISK_BUCKETS:.1f}-{(i + 1) / RISK_BUCKETS:.1f}" for i in range(RISK_BUCKETS)],
+            "series": series,
+        }
+
+    
+    @staticmethod
+    async def get_timeseries_async(db: AsyncSession, **kwargs) -> Dict:
+        """get_timeseries sobre una AsyncSession (sin bloquear el event loop)"""
+        return await db.run_sync(lambda session: RollupService.get_timeseries(session, **kwargs))
+
+
+def _prune_once():
+    """prune_minute_buckets con sesión propia (para asyncio.to_thread)"""
+    from app.database.connection import SessionLocal
+
+    db = SessionLocal()
+    try:
+        RollupService.prune_minute_buckets(db)
+    finally:
+        db.close()
+
+
+async def rollup_prune_loop(interval_seconds: int):
+    """Tarea de fondo: podar los rollups por minuto vencidos cada interval_seconds (cancelar al apagar)"""
+    while True:
+        try:
+            await asyncio.to_thread(_prune_once)
+        except Exception as e:
+            print(f"   ⚠️ Error al podar rollups: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.services.rollup_service
+    from app.database.connection import SessionLocal
+
+    db = SessionLocal()
+    try:
+        RollupService.rebuild(db)
+    finally:
+        db.close()
@@ -0,0 +1,359 @@
+"""
+Search Service - Búsqueda full-text sobre señales, explicaciones y notas de revisión
+Cada decisión y cada caso HITL con notas tiene un documento en search_documents,
+escrito en la misma transacción que el dato original. El índice es FTS5 en
+SQLite (tabla virtual sincronizada por triggers) y un índice GIN sobre
+to_tsvector en PostgreSQL; otros motores usan LIKE sin ranking.
+"""
+from sqlalchemy import select, insert, delete, func, literal, literal_column, table, column, text, and_
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import OperationalError
+from app.database.models import (
+    SearchDocumentDB, FraudDecisionDB, TransactionDB, SignalDB, HITLCaseDB
+)
+from typing import Dict, Iterable, List, Optional
+from datetime import datetime
+import re
+
+
+SEARCH_DEFAULT_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 200
+SEARCH_KINDS = ("decision", "hitl_case")
+
+DOCUMENT_COLUMNS = [
+    SearchDocumentDB.id,
+    SearchDocumentDB.kind,
+    SearchDocumentDB.decision_id,
+    SearchDocumentDB.case_id,
+    SearchDocumentDB.transaction_id,
+    SearchDocumentDB.customer_id,
+    SearchDocumentDB.merchant_id,
+    SearchDocumentDB.decision,
+    SearchDocumentDB.created_at,
+]
+
+FTS_TABLE = "search_documents_fts"
+POSTGRES_TS_CONFIG = "spanish"
+
+_TERM_PATTERN = re.compile(r'"([^"]+)"|(\S+)')
+
+# Backend de búsqueda por dialecto (se detecta una vez por proceso)
+_backends: Dict[str, str] = {}
+
+
+def _terms(q: str) -> List[str]:
+    """Términos de la consulta ("frase exacta" o palabras sueltas), todos obligatorios"""
+    return [phrase or word for phrase, word in _TERM_PATTERN.findall(q or "") if (phrase or word).strip()]
+
+
+def _fts5_query(terms: List[str]) -> str:
+    """Consulta FTS5 segura: cada término entre comillas (sin operadores del usuario)"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _ts_config():
+    return literal_column(f"'{POSTGRES_TS_CONFIG}'::regconfig")
+
+
+def ensure_search_index(engine) -> str:
+    """
+    Crear el índice full-text del dialecto (idempotente)
+
+    Returns:
+        Backend disponible: fts5, postgresql o like
+    """
+    if engine.dialect.name == "sqlite":
+        try:
+            with engine.begin() as conn:
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {"name": FTS_TABLE}
+                ).first()
+                if exists:
+                    return "fts5"
+
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                    "content, content='search_documents', content_rowid='id', "
+                    "tokenize='unicode61 remove_diacritics 2')"
+                ))
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN "
+                    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END"
+                ))
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN "
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); END"
+                ))
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN "
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); "
+                    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END"
+                ))
+                # Documentos escritos antes de existir el índice
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            print("   🔎 Índice FTS5 de búsqueda creado")
+            return "fts5"
+        except OperationalError as e:
+            print(f"   ⚠️ FTS5 no disponible en este SQLite ({e}); la búsqueda usará LIKE")
+            return "like"
+
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents "
+                f"USING GIN (to_tsvector('{POSTGRES_TS_CONFIG}'::regconfig, content))"
+            ))
+        return "postgresql"
+
+    return "like"
+
+
+def backfill_search_documents(db: Session, chunk_size: int = 1000) -> int:
+    """Indexar las decisiones y revisiones existentes (solo si search_documents está vacía)"""
+    if db.query(SearchDocumentDB.id).first() is not None:
+        return 0
+    if db.query(FraudDecisionDB.id).first() is None and db.query(HITLCaseDB.case_id).first() is None:
+        return 0
+
+    total = 0
+    last_id = 0
+    while True:
+        decisions = db.query(FraudDecisionDB).filter(
+            FraudDecisionDB.id > last_id
+        ).order_by(FraudDecisionDB.id.asc()).limit(chunk_size).all()
+        if not decisions:
+            break
+        last_id = decisions[-1].id
+
+        signals: Dict[int, List[str]] = {}
+        for decision_id, signal_text in db.query(SignalDB.decision_id, SignalDB.signal_text).filter(
+            SignalDB.decision_id.in_([d.id for d in decisions])
+        ).order_by(SignalDB.id):
+            signals.setdefault(decision_id, []).append(signal_text)
+
+        merchants = dict(db.query(TransactionDB.transaction_id, TransactionDB.merchant_id).filter(
+            TransactionDB.transaction_id.in_({d.transaction_id for d in decisions})
+        ).all())
+
+        total += SearchService.index_decisions(db, [
+            {
+                "decision_id": d.id,
+                "transaction_id": d.transaction_id,
+                "customer_id": d.customer_id,
+                "merchant_id": merchants.get(d.transaction_id),
+                "decision": d.decision,
+                "created_at": d.created_at or datetime.utcnow(),
+                "signals": signals.get(d.id, []),
+                "explanation_customer": d.explanation_customer,
+                "explanation_audit": d.explanation_audit,
+            }
+            for d in decisions
+        ])
+        db.commit()
+
+    SearchService.index_hitl_cases(db)
+    db.commit()
+
+    print(f"   ✅ Documentos de búsqueda indexados: {total} decisiones")
+    return total
+
+
+class SearchService:
+    """Servicio de búsqueda full-text (indexación en la escritura y consultas con ranking)"""
+
+    @staticmethod
+    def _backend(db: Session) -> str:
+        """fts5, postgresql o like según el motor de la sesión"""
+        dialect = db.get_bind().dialect.name
+        if dialect not in _backends:
+            if dialect == "sqlite":
+                exists = db.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {"name": FTS_TABLE}
+                ).first()
+                _backends[dialect] = "fts5" if exists else "like"
+            else:
+                _backends[dialect] = "postgresql" if dialect == "postgresql" else "like"
+        return _backends[dialect]
+
+    @staticmethod
+    def index_decisions(db: Session, decisions: List[Dict]) -> int:
+        """
+        Agregar los documentos de decisiones nuevas (sin commit; va en la transacción del llamador)
+
+        Cada dict trae decision_id, transaction_id, customer_id, merchant_id,
+        decision, created_at, signals, explanation_customer y explanation_audit.
+        """
+        rows = []
+        for d in decisions:
+            content = "\n".join(
+                part for part in [*d["signals"], d["explanation_customer"], d["explanation_audit"]] if part
+            )
+            if not content:
+                continue
+            rows.append({
+                "kind": "decision",
+                "decision_id": d["decision_id"],
+                "transaction_id": d["transaction_id"],
+                "customer_id": d["customer_id"],
+                "merchant_id": d["merchant_id"],
+                "decision": getattr(d["decision"], "value", d["decision"]),
+                "created_at": d["created_at"],
+                "content": content,
+            })
+
+        if rows:
+            db.execute(insert(SearchDocumentDB), rows)
+        return len(rows)
+
+    @staticmethod
+    def index_hitl_cases(db: Session, case_ids: Optional[Iterable[str]] = None):
+        """
+        Reemplazar los documentos de notas de revisión de los casos dados (o de todos)
+
+        Un DELETE y un INSERT ... SELECT (sin commit); los casos sin notas no se indexan.
+        """
+        delete_query = delete(SearchDocumentDB).where(SearchDocumentDB.kind == "hitl_case")
+        source = select(
+            literal("hitl_case"), HITLCaseDB.case_id, HITLCaseDB.transaction_id,
+            TransactionDB.customer_id, TransactionDB.merchant_id,
+            func.coalesce(HITLCaseDB.reviewer_decision, HITLCaseDB.decision_recommendation),
+            func.coalesce(HITLCaseDB.reviewed_at, HITLCaseDB.created_at),
+            HITLCaseDB.reviewer_notes,
+        ).join(
+            TransactionDB, TransactionDB.transaction_id == HITLCaseDB.transaction_id
+        ).where(HITLCaseDB.reviewer_notes.isnot(None), HITLCaseDB.reviewer_notes != "")
+
+        if case_ids is not None:
+            case_ids = list(case_ids)
+            if not case_ids:
+                return
+            delete_query = delete_query.where(SearchDocumentDB.case_id.in_(case_ids))
+            source = source.where(HITLCaseDB.case_id.in_(case_ids))
+
+        db.execute(delete_query)
+        db.execute(insert(SearchDocumentDB).from_select(
+            ["kind", "case_id", "transaction_id", "customer_id", "merchant_id", "decision", "created_at", "content"],
+            source
+        ))
+
+    @staticmethod
+    def remove_decisions(db: Session, decision_ids: List[int]):
+        """Quitar los documentos de decisiones (p. ej. al archivarlas; sin commit)"""
+        if decision_ids:
+            db.execute(delete(SearchDocumentDB).where(SearchDocumentDB.decision_id.in_(decision_ids)))
+
+    @staticmethod
+    def search(
+        db: Session,
+        q: str,
+        kind: str = None,
+        customer_id: str = None,
+        merchant_id: str = None,
+        decision: str = None,
+        date_from: datetime = None,
+        date_to: datetime = None,
+        limit: int = SEARCH_DEFAULT_PAGE_SIZE,
+        offset: int = 0
+    ) -> Dict:
+        """
+        Buscar decisiones y casos HITL por texto, ordenados por relevancia
+
+        Todos los términos deben aparecer ("frase exacta" entre comillas); los
+        filtros se combinan con AND. Sin FTS (LIKE) se ordena por fecha.
+
+        Args:
+            db: Sesión de base de datos
+            q: Texto a buscar
+            kind: decision o hitl_case (opcional)
+            customer_id: Filtrar por cliente (opcional)
+            merchant_id: Filtrar por comercio (opcional)
+            decision: Decisión del sistema o del revisor (opcional)
+            date_from: Inicio del rango de fecha (inclusive, opcional)
+            date_to: Fin del rango de fecha (exclusivo, opcional)
+            limit: Tamaño de página
+            offset: Desplazamiento de la página
+
+        Returns:
+            Dict con results (rank y snippet por documento) y next_offset (None en la última página)
+
+        Raises:
+            ValueError: Si la consulta está vacía o un filtro es inválido
+        """
+        terms = _terms(q)
+        if not terms:
+            raise ValueError("La consulta de búsqueda está vacía")
+        if kind and kind not in SEARCH_KINDS:
+            raise ValueError(f"Tipo inválido: {kind} (use {', '.join(SEARCH_KINDS)})")
+
+        limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+        backend = SearchService._backend(db)
+
+        if backend == "fts5":
+            fts = table(FTS_TABLE, column("rowid"))
+            rank = literal_column(f"bm25({FTS_TABLE})")
+            snippet = literal_column(f"snippet({FTS_TABLE}, 0, '[', ']', '…', 16)")
+            query = select(*DOCUMENT_COLUMNS, (-rank).label("rank"), snippet.label("snippet")).select_from(
+                SearchDocumentDB.__table__.join(fts, fts.c.rowid == SearchDocumentDB.id)
+            ).where(
+                text(f"{FTS_TABLE} MATCH :fts_query").bindparams(fts_query=_fts5_query(terms))
+            ).order_by(rank.asc(), SearchDocumentDB.id.desc())
+        elif backend == "postgresql":
+            vector = func.to_tsvector(_ts_config(), SearchDocumentDB.content)
+            ts_query = func.websearch_to_tsquery(_ts_config(), q)
+            rank = func.ts_rank(vector, ts_query)
+            snippet = func.ts_headline(
+                _ts_config(), SearchDocumentDB.content, ts_query, "StartSel=[, StopSel=], MaxWords=24, MinWords=8"
+            )
+            query = select(*DOCUMENT_COLUMNS, rank.label("rank"), snippet.label("snippet")).where(
+                vector.op("@@")(ts_query)
+            ).order_by(rank.desc(), SearchDocumentDB.id.desc())
+        else:
+            query = select(
+                *DOCUMENT_COLUMNS, literal(0.0).label("rank"),
+                func.substr(SearchDocumentDB.content, 1, 200).label("snippet")
+            ).where(
+                and_(*[SearchDocumentDB.content.ilike(f"%{term}%") for term in terms])
+            ).order_by(SearchDocumentDB.created_at.desc(), SearchDocumentDB.id.desc())
+
+        if kind:
+            query = query.where(SearchDocumentDB.kind == kind)
+        if customer_id:
+            query = query.where(SearchDocumentDB.customer_id == customer_id)
+        if merchant_id:
+            query = query.where(SearchDocumentDB.merchant_id == merchant_id)
+        if decision:
+            query = query.where(SearchDocumentDB.decision == decision.upper())
+        if date_from:
+            query = query.where(SearchDocumentDB.created_at >= date_from)
+        if date_to:
+            query = query.where(SearchDocumentDB.created_at < date_to)
+
+        rows = db.execute(query.limit(limit + 1).offset(offset)).all()
+        has_more = len(rows) > limit
+
+        return {
+            "results": [
+                {
+                    "kind": row.kind,
+                    "decision_id": row.decision_id,
+                    "case_id": row.case_id,
+                    "transaction_id": row.transaction_id,
+                    "customer_id": row.customer_id,
+                    "merchant_id": row.merchant_id,
+                    "decision": row.decision,
+                    "created_at": row.created_at.isoformat() if row.created_at else None,
+                    "rank": round(float(row.rank), 4),
+                    "snippet": row.snippet,
+                }
+                for row in rows[:limit]
+            ],
+            "next_offset": offset + limit if has_more else None,
+        }
+
+    @staticmethod
+    async def search_async(db: AsyncSession, **kwargs) -> Dict:
+        """search sin bloquear el event loop"""
+        return await db.run_sync(lambda session: SearchService.search(session, **kwargs))
@@ -2,7 +2,12 @@
 Seed Service - Poblar datos iniciales
 """
 from sqlalchemy.orm import Session
-from app.database.models import CustomerDB, CountryDB, ChannelDB, MerchantDB
+from app.database.models import CustomerDB, CountryDB, ChannelDB, MerchantDB, CustomerBehaviorDB
+from app.services.master_data_cache import get_master_data_cache
+from app.services.statistics_service import StatisticsService
+from app.services import statistics_service as statistics
+from pathlib import Path
+import json
 
 
 class SeedService:
@@ -79,6 +84,7 @@ class SeedService:
         for customer_data in customers:
             customer = CustomerDB(**customer_data)
             db.add(customer)
+        StatisticsService.increment(db, {statistics.CUSTOMERS: len(customers)})
         
         db.commit()
         print(f"   ✅ {len(customers)} clientes insertados")
@@ -133,10 +139,39 @@ class SeedService:
         for merchant_data in merchants:
             merchant = MerchantDB(**merchant_data)
             db.add(merchant)
+        StatisticsService.increment(db, {statistics.MERCHANTS: len(merchants)})
         
         db.commit()
         print(f"   ✅ {len(merchants)} comercios insertados")
     
+    @staticmethod
+    def seed_customer_behaviors(db: Session, json_path: str = "data/customer_behavior.json"):
+        """Poblar perfiles de comportamiento desde JSON"""
+        behavior_path = Path(json_path)
+        if not behavior_path.exists():
+            print(f"   ⚠️  No se encontró {json_path}")
+            return
+        
+        existing_count = db.query(CustomerBehaviorDB).count()
+        if existing_count > 0:
+            print(f"   ⏭️  Perfiles ya poblados ({existing_count} registros)")
+            return
+        
+        with open(behavior_path, "r", encoding="utf-8") as f:
+            behaviors = json.load(f)
+        
+        known_customers = {row[0] for row in db.query(CustomerDB.customer_id).all()}
+        
+        inserted = 0
+        for behavior_data in behaviors.values():
+            if behavior_data["customer_id"] not in known_customers:
+                continue
+            db.add(CustomerBehaviorDB(**behavior_data))
+            inserted += 1
+        
+        db.commit()
+        print(f"   ✅ {inserted} perfiles de comportamiento insertados")
+    
     @staticmethod
     def seed_all(db: Session):
         """Poblar todos los datos maestros"""
@@ -145,4 +180,8 @@ class SeedService:
         SeedService.seed_channels(db)
         SeedService.seed_customers(db)
         SeedService.seed_merchants(db)
+        SeedService.seed_customer_behaviors(db)
+        
+        # Recargar el cache de maestros con lo que haya quedado en la BD
+        get_master_data_cache().invalidate()
         print("✅ Datos maestros poblados\n")
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Statistics Service - Contadores agregados para los endpoints de estadísticas
+Los contadores se actualizan en la misma transacción que cada escritura. Se
+calculan desde las tablas solo en el primer arranque; la reconciliación es una
+acción administrativa (CLI o POST /statistics/reconcile).
+"""
+from sqlalchemy import func, false, text, update
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.models import (
+    StatisticsCounterDB, TransactionDB, FraudDecisionDB, ArchivedDecisionDB, CustomerDB,
+    MerchantDB, HITLCaseDB, DecisionTypeEnum, HITLStatusEnum
+)
+from app.database.upsert import increment_counters, set_counters
+from typing import Dict, Iterable
+import json
+
+
+# Claves de contadores
+TRANSACTIONS = "transactions"
+DECISIONS = "decisions"
+CUSTOMERS = "customers"
+MERCHANTS = "merchants"
+HITL_TOTAL = "hitl.total"
+HITL_QUEUE_VERSION = "hitl.queue_version"  # Cambia con cada alta o revisión de casos (ETag de la cola)
+
+
+def decision_key(decision) -> str:
+    """Clave del contador por tipo de decisión (decisions.<TYPE>)"""
+    return f"decisions.{getattr(decision, 'value', decision)}"
+
+
+def hitl_key(status) -> str:
+    """Clave del contador por estado HITL (hitl.<STATUS>)"""
+    return f"hitl.{getattr(status, 'value', status)}"
+
+
+class StatisticsService:
+    """Servicio de contadores de estadísticas (lecturas O(1))"""
+
+    @staticmethod
+    def increment(db: Session, deltas: Dict[str, int]):
+        """Sumar deltas a los contadores (sin commit; va en la transacción del llamador)"""
+        increment_counters(db, StatisticsCounterDB, deltas)
+
+    @staticmethod
+    def hitl_transition(db: Session, old_status, new_status):
+        """Mover un caso HITL entre contadores de estado y avanzar la versión de la cola"""
+        deltas = {HITL_QUEUE_VERSION: 1}
+        if old_status != new_status:
+            deltas.update({hitl_key(old_status): -1, hitl_key(new_status): 1})
+        StatisticsService.increment(db, deltas)
+
+    @staticmethod
+    def get_counters(db: Session, keys: Iterable[str] = None) -> Dict[str, int]:
+        """Leer contadores en una sola consulta (0 si no existen)"""
+        query = db.query(StatisticsCounterDB.key, StatisticsCounterDB.value)
+        if keys is not None:
+            keys = list(keys)
+            query = query.filter(StatisticsCounterDB.key.in_(keys))
+
+        counters = {row.key: row.value for row in query.all()}
+        if keys is not None:
+            return {key: counters.get(key, 0) for key in keys}
+        return counters
+
+    @staticmethod
+    def compute_counters(db: Session) -> Dict[str, int]:
+        """Calcular los contadores desde las tablas (COUNT agrupados; las decisiones incluyen las archivadas)"""
+        values = {
+            TRANSACTIONS: db.query(func.count(TransactionDB.transaction_id)).scalar(),
+            DECISIONS: (
+                db.query(func.count(FraudDecisionDB.id)).scalar()
+                + db.query(func.count(ArchivedDecisionDB.decision_id)).scalar()
+            ),
+            CUSTOMERS: db.query(func.count(CustomerDB.customer_id)).scalar(),
+            MERCHANTS: db.query(func.count(MerchantDB.merchant_id)).scalar(),
+            HITL_TOTAL: db.query(func.count(HITLCaseDB.case_id)).scalar(),
+        }
+
+        values.update({decision_key(d): 0 for d in DecisionTypeEnum})
+        for decision, count in db.query(
+            FraudDecisionDB.decision, func.count(FraudDecisionDB.id)
+        ).group_by(FraudDecisionDB.decision).all():
+            values[decision_key(decision)] = count
+        for decision, count in db.query(
+            ArchivedDecisionDB.decision, func.count(ArchivedDecisionDB.decision_id)
+        ).group_by(ArchivedDecisionDB.decision).all():
+            values[decision_key(decision)] += count
+
+        values.update({hitl_key(s): 0 for s in HITLStatusEnum})
+        for status, count in db.query(
+            HITLCaseDB.status, func.count(HITLCaseDB.case_id)
+        ).group_by(HITLCaseDB.status).all():
+            if status is not None:
+                values[hitl_key(status)] = count
+
+        return values
+
+    @staticmethod
+    def _lock_counters(db: Session):
+        """
+        Tomar el lock de escritura de los contadores antes de leer las tablas
+
+        Los incrementos de otras transacciones esperan a que esta confirme y
+        los ya confirmados entran en los COUNT, así fijar valores absolutos no
+        pisa ninguno.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(text(f"LOCK TABLE {StatisticsCounterDB.__tablename__} IN SHARE ROW EXCLUSIVE MODE"))
+        else:
+            # SQLite: un UPDATE (aunque no afecte filas) toma el lock de escritura de la BD
+            db.execute(update(StatisticsCounterDB).where(false()).values(value=StatisticsCounterDB.value))
+
+    @staticmethod
+    def initialize(db: Session) -> bool:
+        """
+        Crear los contadores desde las tablas si todavía no existen (primer arranque)
+
+        Returns:
+            True si se crearon; con contadores existentes no se tocan
+        """
+        StatisticsService._lock_counters(db)
+        if db.query(StatisticsCounterDB.key).first() is not None:
+            db.commit()
+            return False
+
+        set_counters(db, StatisticsCounterDB, StatisticsService.compute_counters(db))
+        db.commit()
+        print("   ✅ Contadores de estadísticas creados")
+        return True
+
+    @staticmethod
+    def reconcile(db: Session) -> Dict[str, Dict[str, int]]:
+        """
+        Recalcular todos los contadores desde las tablas y corregir las diferencias
+
+        Todo ocurre en una transacción con el lock de los contadores tomado.
+
+        Returns:
+            {clave: {"stored": valor_anterior, "actual": valor_real}} de los corregidos
+        """
+        StatisticsService._lock_counters(db)
+        actual = StatisticsService.compute_counters(db)
+        stored = StatisticsService.get_counters(db)
+
+        drift = {
+            key: {"stored": stored.get(key, 0), "actual": value}
+            for key, value in actual.items()
+            if stored.get(key) != value
+        }
+
+        if drift:
+            set_counters(db, StatisticsCounterDB, {key: actual[key] for key in drift})
+        db.commit()
+
+        print(f"   ✅ Contadores reconciliados ({len(drift)} corregidos)")
+        return drift
+
+    
+    @staticmethod
+    async def reconcile_async(db: AsyncSession) -> Dict[str, Dict[str, int]]:
+        """reconcile sobre una AsyncSession (sin bloquear el event loop)"""
+        return await db.run_sync(StatisticsService.reconcile)
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.services.statistics_service
+    from app.database.connection import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(json.dumps(StatisticsService.reconcile(db), indent=2))
+    finally:
+        db.close()
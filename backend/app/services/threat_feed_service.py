@@ -0,0 +1,58 @@
+"""
+Threat Feed Service - Fuente de alertas externas por comercio
+Carga el feed una sola vez y lo comparte entre requests
+"""
+from typing import Dict, Optional
+from pathlib import Path
+import json
+import threading
+
+
+class ThreatFeedService:
+    """Servicio con el feed de amenazas externas (indexado por merchant_id)"""
+
+    def __init__(self, json_path: str = "data/threat_feed.json"):
+        """
+        Inicializar feed de amenazas
+
+        Args:
+            json_path: Ruta al archivo JSON con alertas por comercio
+        """
+        self.json_path = json_path
+        self.threats: Dict[str, Dict] = {}
+        self.load()
+
+    def load(self):
+        """Cargar (o recargar) el feed desde JSON"""
+        feed_path = Path(self.json_path)
+        if not feed_path.exists():
+            print(f"   ⚠️  No se encontró {self.json_path}")
+            self.threats = {}
+            return
+
+        with open(feed_path, "r", encoding="utf-8") as f:
+            self.threats = json.load(f)
+
+        print(f"   ✅ Feed de amenazas cargado: {len(self.threats)} comercios")
+
+    def lookup(self, merchant_id: str) -> Optional[Dict]:
+        """Obtener alertas de un comercio, o None si no hay"""
+        return self.threats.get(merchant_id)
+
+
+# ============================================
+# INSTANCIA GLOBAL
+# ============================================
+
+_threat_feed_instance = None
+_threat_feed_lock = threading.Lock()
+
+
+def get_threat_feed() -> ThreatFeedService:
+    """Obtener instancia única del feed de amenazas"""
+    global _threat_feed_instance
+    if _threat_feed_instance is None:
+        with _threat_feed_lock:
+            if _threat_feed_instance is None:
+                _threat_feed_instance = ThreatFeedService()
+    return _threat_feed_instance
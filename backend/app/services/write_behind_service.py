@@ -0,0 +1,434 @@
+"""
+Write-Behind Service - Persistencia diferida de análisis
+Las decisiones (y sus logs) se encolan en memoria respaldadas por un spool
+local append-only; un hilo escritor las guarda en la BD en lotes.
+"""
+from sqlalchemy.exc import OperationalError
+from app.config import get_settings
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from pathlib import Path
+import json
+import os
+import queue
+import threading
+import time
+
+
+class WriteBehindFullError(Exception):
+    """La cola de escritura está llena (backpressure)"""
+    pass
+
+
+# ============================================
+# SERIALIZACIÓN DE PAYLOADS
+# ============================================
+
+def serialize_analysis(analysis: Dict) -> Dict:
+    """Convertir un análisis (modelos Pydantic) a un dict JSON para el spool"""
+    return {
+        "transaction": analysis["transaction"].model_dump(mode="json"),
+        "decision": analysis["decision"].value,
+        "confidence": analysis["confidence"],
+        "risk_score": analysis["risk_score"],
+        "signals": list(analysis["signals"]),
+        "citations_internal": [c.model_dump(mode="json") for c in analysis["citations_internal"]],
+        "citations_external": [c.model_dump(mode="json") for c in analysis["citations_external"]],
+        "explanation_customer": analysis["explanation_customer"],
+        "explanation_audit": analysis["explanation_audit"],
+        "agent_route": analysis["agent_route"],
+        "processing_time_ms": analysis["processing_time_ms"],
+        "analysis_logs": analysis.get("analysis_logs") or [],
+        "created_at": (analysis.get("created_at") or datetime.utcnow()).isoformat(),
+        "hitl_case": analysis["hitl_case"].model_dump(mode="json") if analysis.get("hitl_case") else None,
+    }
+
+
+def deserialize_analysis(payload: Dict) -> Dict:
+    """Reconstruir el dict que espera PersistenceService.save_transaction_analyses"""
+    from app.models.schemas import Transaction, DecisionType, InternalCitation, ExternalCitation, HITLCase
+
+    return {
+        **payload,
+        "transaction": Transaction(**payload["transaction"]),
+        "decision": DecisionType(payload["decision"]),
+        "citations_internal": [InternalCitation(**c) for c in payload["citations_internal"]],
+        "citations_external": [ExternalCitation(**c) for c in payload["citations_external"]],
+        "created_at": datetime.fromisoformat(payload["created_at"]),
+        "hitl_case": HITLCase(**payload["hitl_case"]) if payload.get("hitl_case") else None,
+    }
+
+
+# ============================================
+# COLA WRITE-BEHIND
+# ============================================
+
+class WriteBehindQueue:
+    """Cola acotada + spool en disco + hilo escritor por lotes"""
+
+    def __init__(
+        self,
+        spool_path: str,
+        queue_size: int = 1000,
+        batch_size: int = 50,
+        flush_interval_ms: int = 200,
+        enqueue_timeout_ms: int = 100,
+        fsync: bool = True
+    ):
+        """
+        Inicializar cola write-behind
+
+        Args:
+            spool_path: Archivo JSONL append-only con los payloads pendientes
+            queue_size: Máximo de análisis pendientes antes de rechazar (backpressure)
+            batch_size: Máximo de análisis por transacción de BD
+            flush_interval_ms: Espera máxima para completar un lote
+            enqueue_timeout_ms: Espera máxima por un espacio libre al encolar
+            fsync: Forzar el spool a disco en cada escritura
+        """
+        self.spool_path = Path(spool_path)
+        self.checkpoint_path = Path(f"{spool_path}.checkpoint")
+        self.dead_letter_path = Path(f"{spool_path}.dead")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self.fsync = fsync
+
+        self._queue: "queue.Queue[Tuple[int, Dict]]" = queue.Queue()
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._append_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._spool_file = None
+        self._spool_bytes = 0
+
+        self._last_seq = 0
+        self._committed_seq = 0
+        self._stats = {"enqueued": 0, "written": 0, "batches": 0, "rejected": 0, "dead_lettered": 0, "replayed": 0}
+
+    # ------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------
+
+    def start(self):
+        """Recuperar el spool pendiente e iniciar el hilo escritor"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+        pending = self._recover()
+        self._spool_file = open(self.spool_path, "a", encoding="utf-8")
+        self._spool_bytes = self.spool_path.stat().st_size
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(pending,), name="write-behind", daemon=True
+        )
+        self._thread.start()
+        print(f"   ✅ Write-behind iniciado ({len(pending)} pendientes en spool)")
+
+    def stop(self, timeout: float = 30.0):
+        """Vaciar la cola y detener el escritor (lo no escrito queda en el spool)"""
+        if not self._thread:
+            return
+
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+        with self._append_lock:
+            if self._spool_file:
+                self._spool_file.close()
+                self._spool_file = None
+
+        print(f"   💾 Write-behind detenido - pendientes: {self._queue.qsize()}")
+
+    # ------------------------------------------
+    # Productor
+    # ------------------------------------------
+
+    def enqueue(self, analysis: Dict) -> int:
+        """
+        Encolar un análisis para escritura diferida
+
+        Returns:
+            Número de secuencia asignado en el spool
+
+        Raises:
+            WriteBehindFullError: Si no hay espacio tras enqueue_timeout
+        """
+        payload = serialize_analysis(analysis)
+
+        if not self._slots.acquire(timeout=self.enqueue_timeout):
+            self._count(rejected=1)
+            raise WriteBehindFullError("Cola de persistencia llena, reintente más tarde")
+
+        try:
+            with self._append_lock:
+                seq = self._last_seq + 1
+                self._append_spool(seq, payload)
+                self._last_seq = seq
+                self._queue.put((seq, payload))
+                self._stats["enqueued"] += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        return seq
+
+    def _append_spool(self, seq: int, payload: Dict):
+        line = json.dumps({"seq": seq, "payload": payload}, default=str, ensure_ascii=False) + "\n"
+        self._spool_file.write(line)
+        self._spool_file.flush()
+        if self.fsync:
+            os.fsync(self._spool_file.fileno())
+        self._spool_bytes += len(line.encode("utf-8"))
+
+    # ------------------------------------------
+    # Spool y checkpoint
+    # ------------------------------------------
+
+    def _recover(self) -> List[Tuple[int, Dict]]:
+        """Leer checkpoint y spool; retornar las entradas no confirmadas en BD"""
+        committed = 0
+        if self.checkpoint_path.exists():
+            committed = int(self.checkpoint_path.read_text().strip() or 0)
+
+        pending = []
+        last_seq = committed
+        if self.spool_path.exists():
+            with open(self.spool_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Última línea truncada por una caída a mitad de escritura
+                        print("   ⚠️  Línea incompleta en spool descartada")
+                        continue
+                    last_seq = max(last_seq, entry["seq"])
+                    if entry["seq"] > committed:
+                        pending.append((entry["seq"], entry["payload"]))
+
+        self._committed_seq = committed
+        self._last_seq = last_seq
+        return pending
+
+    def _checkpoint(self, seq: int):
+        """Registrar que todo hasta seq está en la BD"""
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        tmp_path.write_text(str(seq))
+        os.replace(tmp_path, self.checkpoint_path)
+        self._committed_seq = seq
+
+    def _maybe_compact(self):
+        """Truncar el spool cuando todo lo escrito en él ya está en la BD"""
+        with self._append_lock:
+            if self._spool_file and self._spool_bytes and self._committed_seq == self._last_seq:
+                self._spool_file.truncate(0)
+                self._spool_bytes = 0
+
+    # ------------------------------------------
+    # Escritor
+    # ------------------------------------------
+
+    def _run(self, pending: List[Tuple[int, Dict]]):
+        # 1. Reprocesar lo que quedó en el spool (puede estar ya en BD)
+        for i in range(0, len(pending), self.batch_size):
+            batch = pending[i:i + self.batch_size]
+            if not self._write_batch(batch, dedupe=True):
+                return
+            self._count(replayed=len(batch))
+
+        # 2. Drenar la cola
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                written = self._write_batch(batch)
+                for _ in batch:
+                    self._slots.release()
+                if not written:
+                    return
+            self._maybe_compact()
+
+    def _next_batch(self) -> List[Tuple[int, Dict]]:
+        """Esperar el primer elemento y completar el lote hasta batch_size o flush_interval"""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch: List[Tuple[int, Dict]], dedupe: bool = False) -> bool:
+        """
+        Escribir un lote; reintenta mientras la BD no esté disponible
+
+        Returns:
+            False si se pidió detener antes de poder escribirlo (queda en el spool)
+        """
+        payloads = [payload for _, payload in batch]
+
+        try:
+            if not self._save_with_retry(payloads, dedupe):
+                return False
+        except Exception as e:
+            # Aislar los payloads inválidos para no bloquear la cola; los errores
+            # transitorios (OperationalError) se siguen reintentando por payload
+            print(f"   ⚠️  Error guardando lote, reintentando uno a uno: {e}")
+            for payload in payloads:
+                try:
+                    if not self._save_with_retry([payload], dedupe=True):
+                        return False
+                except Exception as item_error:
+                    self._dead_letter(payload, item_error)
+
+        self._checkpoint(batch[-1][0])
+        self._count(written=len(batch), batches=1)
+        return True
+
+    def _save_with_retry(self, payloads: List[Dict], dedupe: bool) -> bool:
+        """
+        Guardar payloads reintentando con backoff mientras la BD no esté disponible
+
+        Returns:
+            False si se pidió detener antes de poder guardarlos
+
+        Raises:
+            Exception: Errores deterministas (datos inválidos), sin reintento
+        """
+        attempt = 0
+        while True:
+            try:
+                self._save(payloads, dedupe)
+                return True
+            except OperationalError as e:
+                if self._stop.is_set():
+                    print(f"   ⚠️  Write-behind detenido con BD no disponible: {e}")
+                    return False
+                delay = min(0.5 * 2 ** attempt, 10.0)
+                attempt += 1
+                print(f"   ⚠️  BD no disponible, reintentando en {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    def _save(self, payloads: List[Dict], dedupe: bool):
+        from app.database.connection import SessionLocal
+        from app.services.persistence_service import PersistenceService
+
+        analyses = [deserialize_analysis(payload) for payload in payloads]
+
+        db = SessionLocal()
+        try:
+            if dedupe:
+                analyses = self._skip_persisted(db, analyses)
+            if analyses:
+                PersistenceService.save_transaction_analyses(db, analyses)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _skip_persisted(db, analyses: List[Dict]) -> List[Dict]:
+        """Descartar análisis ya guardados antes de la caída (misma transacción y created_at)"""
+        from app.database.models import FraudDecisionDB
+
+        transaction_ids = {a["transaction"].transaction_id for a in analyses}
+        persisted = set(
+            db.query(FraudDecisionDB.transaction_id, FraudDecisionDB.created_at).filter(
+                FraudDecisionDB.transaction_id.in_(transaction_ids)
+            ).all()
+        )
+        return [
+            a for a in analyses
+            if (a["transaction"].transaction_id, a["created_at"]) not in persisted
+        ]
+
+    def _dead_letter(self, payload: Dict, error: Exception):
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"error": str(error), "payload": payload}, default=str, ensure_ascii=False) + "\n")
+        self._count(dead_lettered=1)
+        print(f"   ❌ Análisis {payload['transaction']['transaction_id']} movido a {self.dead_letter_path}: {error}")
+
+    # ------------------------------------------
+    # Estado
+    # ------------------------------------------
+
+    def _count(self, **deltas: int):
+        """Sumar a los contadores (los actualizan los requests y el hilo escritor)"""
+        with self._append_lock:
+            for name, delta in deltas.items():
+                self._stats[name] += delta
+
+    def stats(self) -> Dict:
+        """Contadores y profundidad actual de la cola"""
+        with self._append_lock:
+            counters = dict(self._stats)
+        return {
+            **counters,
+            "pending": self._queue.qsize(),
+            "last_seq": self._last_seq,
+            "committed_seq": self._committed_seq,
+            "running": bool(self._thread and self._thread.is_alive()),
+        }
+
+
+# ============================================
+# INSTANCIA GLOBAL
+# ============================================
+
+_write_behind_instance = None
+_write_behind_lock = threading.Lock()
+
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    """Obtener instancia única de la cola write-behind"""
+    global _write_behind_instance
+    if _write_behind_instance is None:
+        with _write_behind_lock:
+            if _write_behind_instance is None:
+                settings = get_settings()
+                _write_behind_instance = WriteBehindQueue(
+                    spool_path=settings.WRITE_BEHIND_SPOOL_PATH,
+                    queue_size=settings.WRITE_BEHIND_QUEUE_SIZE,
+                    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+                    flush_interval_ms=settings.WRITE_BEHIND_FLUSH_INTERVAL_MS,
+                    enqueue_timeout_ms=settings.WRITE_BEHIND_ENQUEUE_TIMEOUT_MS,
+                    fsync=settings.WRITE_BEHIND_FSYNC,
+                )
+    return _write_behind_instance
+
+
+def persist_analysis(analysis: Dict):
+    """
+    Persistir un análisis según PERSISTENCE_MODE
+
+    Args:
+        analysis: Dict con los campos de save_transaction_analysis
+            (y opcionalmente "analysis_logs" y "hitl_case")
+
+    Raises:
+        WriteBehindFullError: En modo write_behind si la cola está llena
+    """
+    if get_settings().PERSISTENCE_MODE == "write_behind":
+        get_write_behind_queue().enqueue(analysis)
+        return
+
+    from app.database.connection import SessionLocal
+    from app.services.persistence_service import PersistenceService
+
+    db = SessionLocal()
+    try:
+        PersistenceService.save_transaction_analyses(db, [analysis])
+    finally:
+        db.close()
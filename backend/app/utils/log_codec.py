@@ -0,0 +1,23 @@
+"""
+Log Codec - Codificación compacta de los logs de un análisis
+Todos los eventos de una decisión se guardan como un único JSON comprimido
+"""
+from typing import Dict, List
+import json
+import zlib
+
+
+ENCODING_JSON_ZLIB = "json+zlib"
+
+
+def encode_logs(logs: List[Dict]) -> bytes:
+    """Serializar y comprimir la lista de eventos de un análisis"""
+    raw = json.dumps(logs, default=str, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(raw.encode("utf-8"), 6)
+
+
+def decode_logs(payload: bytes, encoding: str = ENCODING_JSON_ZLIB) -> List[Dict]:
+    """Descomprimir y deserializar los eventos de un análisis"""
+    if encoding != ENCODING_JSON_ZLIB:
+        raise ValueError(f"Codificación de logs no soportada: {encoding}")
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
@@ -0,0 +1,64 @@
+"""
+LRU Cache - Cache acotado en memoria con expiración opcional
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+import threading
+import time
+
+
+class LRUCache:
+    """Cache LRU thread-safe con TTL (cada proceso tiene el suyo)"""
+
+    def __init__(self, maxsize: int = 1000, ttl_seconds: Optional[float] = None):
+        """
+        Inicializar cache
+
+        Args:
+            maxsize: Máximo de entradas (se descartan las menos usadas)
+            ttl_seconds: Vigencia de cada entrada (None = sin vencimiento)
+        """
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Obtener un valor (None si no existe o venció)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] < time.monotonic()):
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        """Guardar un valor"""
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]):
+        """Descartar las entradas cuya clave cumple predicate"""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        """Descartar todas las entradas"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
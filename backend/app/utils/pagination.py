@@ -0,0 +1,24 @@
+"""
+Pagination - Cursores opacos para paginación keyset
+"""
+from typing import Dict
+import base64
+import json
+
+
+def encode_cursor(values: Dict) -> str:
+    """Codificar la posición (valores de las columnas de orden) como cursor opaco"""
+    raw = json.dumps(values, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict:
+    """Decodificar un cursor generado por encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError("Cursor inválido")
+    if not isinstance(values, dict):
+        raise ValueError("Cursor inválido")
+    return values
@@ -0,0 +1,31 @@
+"""
+Configuración común de los tests: base SQLite temporal (antes de importar app)
+"""
+import os
+import tempfile
+
+import pytest
+
+_TEST_DIR = tempfile.mkdtemp(prefix="fraud-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DIR, 'fraud_detection.db')}"
+os.environ["RETENTION_ARCHIVE_DIR"] = os.path.join(_TEST_DIR, "archive")
+
+
+@pytest.fixture(scope="session")
+def database():
+    """Crear tablas y datos maestros una vez por sesión"""
+    from app.database.connection import init_db
+
+    init_db()
+
+
+@pytest.fixture
+def db(database):
+    """Sesión sync sobre la base de tests"""
+    from app.database.connection import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
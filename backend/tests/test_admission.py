@@ -0,0 +1,86 @@
+"""
+Tests del control de admisión de /transactions/analyze (los agentes no deben bloquear el event loop)
+"""
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import app.agents.transaction_context_agent as transaction_context_agent
+from app import main
+from app.security import verify_api_key_and_jwt, get_current_user
+from app.services import admission_service
+from app.services.admission_service import AdmissionController
+
+
+ANALYZE_URL = f"{main.settings.API_V1_PREFIX}/transactions/analyze"
+
+PAYLOAD = {
+    "transaction": {
+        "transaction_id": "T-ADM-1",
+        "customer_id": "CU-001",
+        "amount": 1800.00,
+        "currency": "PEN",
+        "country": "PE",
+        "channel": "web",
+        "device_id": "D-01",
+        "timestamp": "2025-12-17T03:15:00",
+        "merchant_id": "M-001",
+    }
+}
+
+
+@pytest.fixture
+def blocking_analysis(monkeypatch):
+    """Primer agente síncrono que retiene el cupo hasta que el test lo libere"""
+    started = threading.Event()
+    release = threading.Event()
+
+    class BlockingContextAgent:
+        def analyze(self, transaction, customer_behavior):
+            started.set()
+            release.wait(5)
+            raise RuntimeError("análisis interrumpido por el test")
+
+    controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout_ms=200)
+    monkeypatch.setattr(admission_service, "_admission_controller", controller)
+    monkeypatch.setattr(main.settings, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(main, "load_customer_behavior", lambda customer_id: None)
+    monkeypatch.setattr(transaction_context_agent, "TransactionContextAgent", BlockingContextAgent)
+    monkeypatch.setitem(main.app.dependency_overrides, verify_api_key_and_jwt, lambda: None)
+    monkeypatch.setitem(main.app.dependency_overrides, get_current_user, lambda: {"username": "tester"})
+
+    yield controller, started, release
+    release.set()
+
+
+def test_queued_request_is_rejected_while_analysis_holds_the_slot(blocking_analysis):
+    controller, started, release = blocking_analysis
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.create_task(client.post(ANALYZE_URL, json=PAYLOAD))
+            assert await asyncio.to_thread(started.wait, 2)
+
+            # Con el agente en un hilo el event loop sigue atendiendo requests
+            metrics = await asyncio.wait_for(client.get("/metrics/admission"), 1)
+            queued = await asyncio.wait_for(client.post(ANALYZE_URL, json=PAYLOAD), 2)
+
+            release.set()
+            return metrics, queued, await asyncio.wait_for(first, 5)
+
+    metrics, queued, first = asyncio.run(scenario())
+
+    assert metrics.status_code == 200
+    assert metrics.json()["active"] == 1
+
+    assert queued.status_code == 503
+    assert int(queued.headers["Retry-After"]) >= 1
+
+    assert first.status_code == 200
+    snapshot = controller.snapshot()
+    assert snapshot["active"] == 0
+    assert snapshot["admitted_total"] == 1
+    assert snapshot["rejected_total"]["timeout"] == 1
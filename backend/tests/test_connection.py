@@ -0,0 +1,108 @@
+"""
+Tests de build_engine / build_async_engine (pool, connect_args y PRAGMAs por dialecto)
+"""
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+from app.database import connection
+from app.database.connection import build_engine, build_async_engine, settings
+
+
+class _CapturedEngine(Exception):
+    """Corta create_engine después de capturar sus argumentos (no hay driver de PostgreSQL)"""
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    """Reemplazar create_engine / create_async_engine por funciones que guardan los kwargs"""
+    calls = {}
+
+    def fake_create_engine(url, **options):
+        calls["url"], calls["options"] = url, options
+        raise _CapturedEngine()
+
+    import sqlalchemy.ext.asyncio
+
+    monkeypatch.setattr(connection, "create_engine", fake_create_engine)
+    monkeypatch.setattr(sqlalchemy.ext.asyncio, "create_async_engine", fake_create_engine)
+    monkeypatch.setattr(connection, "_apply_sqlite_pragmas", lambda engine: calls.setdefault("pragmas", True))
+    return calls
+
+
+def _pragma(conn, name):
+    return conn.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_postgresql_engine_uses_pool_and_statement_timeout(captured):
+    with pytest.raises(_CapturedEngine):
+        build_engine("postgresql+psycopg2://user:pw@localhost:5432/fraud")
+
+    options = captured["options"]
+    assert options["pool_size"] == settings.DB_POOL_SIZE
+    assert options["max_overflow"] == settings.DB_MAX_OVERFLOW
+    assert options["pool_timeout"] == settings.DB_POOL_TIMEOUT_SECONDS
+    assert options["pool_recycle"] == settings.DB_POOL_RECYCLE_SECONDS
+    assert options["connect_args"] == {
+        "options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+    }
+    assert "pragmas" not in captured
+
+
+def test_postgresql_async_engine_uses_server_settings(captured):
+    with pytest.raises(_CapturedEngine):
+        build_async_engine("postgresql+asyncpg://user:pw@localhost:5432/fraud")
+
+    options = captured["options"]
+    assert captured["url"].get_driver_name() == "asyncpg"
+    assert options["pool_size"] == settings.DB_POOL_SIZE
+    assert options["max_overflow"] == settings.DB_MAX_OVERFLOW
+    assert options["connect_args"] == {
+        "server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}
+    }
+    assert "pragmas" not in captured
+
+
+def test_sqlite_engine_applies_pragmas(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'fraud.db'}")
+    try:
+        with engine.connect() as conn:
+            assert _pragma(conn, "journal_mode").upper() == settings.SQLITE_JOURNAL_MODE.upper()
+            assert _pragma(conn, "busy_timeout") == settings.SQLITE_BUSY_TIMEOUT_MS
+            assert _pragma(conn, "synchronous") == 1  # NORMAL
+    finally:
+        engine.dispose()
+
+
+def test_sqlite_async_engine_applies_pragmas(tmp_path):
+    async def check():
+        engine = build_async_engine(f"sqlite:///{tmp_path / 'fraud.db'}")
+        try:
+            async with engine.connect() as conn:
+                journal_mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+                busy_timeout = (await conn.execute(text("PRAGMA busy_timeout"))).scalar()
+            return journal_mode, busy_timeout
+        finally:
+            await engine.dispose()
+
+    journal_mode, busy_timeout = asyncio.run(check())
+    assert journal_mode.upper() == settings.SQLITE_JOURNAL_MODE.upper()
+    assert busy_timeout == settings.SQLITE_BUSY_TIMEOUT_MS
+
+
+def test_sqlite_read_only_engine_skips_journal_mode(tmp_path):
+    path = tmp_path / "replica.db"
+    with sqlite3.connect(path) as raw:
+        raw.execute("CREATE TABLE t (id INTEGER)")
+        assert raw.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+
+    engine = build_engine(f"sqlite:///file:{path}?mode=ro&uri=true")
+    try:
+        with engine.connect() as conn:
+            # Con mode=ro el PRAGMA journal_mode fallaría; se omite y el resto se aplica
+            assert _pragma(conn, "journal_mode") == "delete"
+            assert _pragma(conn, "busy_timeout") == settings.SQLITE_BUSY_TIMEOUT_MS
+    finally:
+        engine.dispose()
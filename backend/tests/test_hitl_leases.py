@@ -0,0 +1,145 @@
+"""
+Tests de la cola HITL con reservas (claim, lease, heartbeat, release y revisión)
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database.models import HITLCaseDB, HITLStatusEnum
+from app.models.schemas import DecisionType, HITLStatus, Transaction
+from app.services import statistics_service as statistics
+from app.services.hitl_service import HITLService
+from app.services.persistence_service import PersistenceService
+from app.services.statistics_service import StatisticsService
+
+
+@pytest.fixture
+def hitl(db):
+    """Servicio HITL con la cola vacía (los casos de otros tests quedan resueltos)"""
+    db.query(HITLCaseDB).filter(
+        HITLCaseDB.status.in_([HITLStatusEnum.PENDING, HITLStatusEnum.CLAIMED])
+    ).update({"status": HITLStatusEnum.REJECTED, "claimed_by": None, "lease_expires_at": None})
+    db.commit()
+    StatisticsService.reconcile(db)
+    return HITLService()
+
+
+def create_case(db, hitl, amount=100.0):
+    transaction = Transaction(
+        transaction_id=f"T-{uuid.uuid4().hex[:8]}", customer_id="CU-001", amount=amount, country="PE",
+        channel="web", device_id="D-01", timestamp=datetime.now(), merchant_id="M-001"
+    )
+    PersistenceService.save_transaction_analysis(
+        db, transaction=transaction, decision=DecisionType.ESCALATE_TO_HUMAN, confidence=0.7,
+        risk_score=0.7, signals=["monto alto"], citations_internal=[], citations_external=[],
+        explanation_customer="c", explanation_audit="a", agent_route="r", processing_time_ms=1.0
+    )
+    return hitl.create_case(
+        transaction, DecisionType.ESCALATE_TO_HUMAN, 0.7, [], [], [], "r", risk_score=0.7, db=db
+    ).case_id
+
+
+def expire_lease(db, case_id):
+    db.query(HITLCaseDB).filter(HITLCaseDB.case_id == case_id).update(
+        {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}
+    )
+    db.commit()
+
+
+def counters_match(db):
+    return StatisticsService.compute_counters(db)[statistics.hitl_key(HITLStatusEnum.CLAIMED)] == \
+        StatisticsService.get_counters(db, [statistics.hitl_key(HITLStatusEnum.CLAIMED)])[
+            statistics.hitl_key(HITLStatusEnum.CLAIMED)]
+
+
+def test_claim_takes_the_highest_priority_case(db, hitl):
+    create_case(db, hitl, amount=50)
+    urgent = create_case(db, hitl, amount=90000)
+
+    case = hitl.claim_next("ana", db=db)
+
+    assert case.case_id == urgent
+    assert case.status == HITLStatus.CLAIMED
+    assert case.claimed_by == "ana"
+    assert hitl.claim_next("bob", db=db).case_id != urgent
+
+
+def test_claimed_case_rejects_other_reviewers(db, hitl):
+    case_id = create_case(db, hitl)
+    hitl.claim_next("ana", db=db)
+
+    with pytest.raises(ValueError, match="reservado por ana"):
+        hitl.review_case(case_id, "bob", DecisionType.APPROVE, db=db)
+    with pytest.raises(ValueError, match="no está reservado por bob"):
+        hitl.heartbeat(case_id, "bob", db=db)
+    with pytest.raises(ValueError, match="no está reservado por bob"):
+        hitl.release(case_id, "bob", db=db)
+
+    result = hitl.bulk_review("bob", DecisionType.BLOCK, case_ids=[case_id], db=db)
+    assert result["results"] == [{"case_id": case_id, "outcome": "claimed_by_other"}]
+
+    reviewed = hitl.review_case(case_id, "ana", DecisionType.APPROVE, db=db)
+    assert reviewed.status == HITLStatus.APPROVED
+    assert counters_match(db)
+
+
+def test_expired_claim_can_be_reviewed_by_another_reviewer(db, hitl):
+    case_id = create_case(db, hitl)
+    hitl.claim_next("ana", db=db)
+    expire_lease(db, case_id)
+
+    reviewed = hitl.review_case(case_id, "bob", DecisionType.BLOCK, db=db)
+
+    assert reviewed.status == HITLStatus.REJECTED
+    assert reviewed.reviewer_id == "bob"
+    assert counters_match(db)
+
+
+def test_expired_claim_is_included_in_bulk_review(db, hitl):
+    case_id = create_case(db, hitl)
+    hitl.claim_next("ana", db=db)
+    expire_lease(db, case_id)
+
+    result = hitl.bulk_review("bob", DecisionType.APPROVE, case_ids=[case_id], db=db)
+
+    assert result["results"] == [{"case_id": case_id, "outcome": "reviewed"}]
+    assert counters_match(db)
+
+
+def test_expired_claim_returns_to_the_queue_without_a_new_claim(db, hitl):
+    case_id = create_case(db, hitl)
+    hitl.claim_next("ana", db=db)
+    expire_lease(db, case_id)
+    version = hitl.get_queue_version(db=db)
+
+    assert HITLService.release_expired_leases() == 1
+
+    db.expire_all()
+    case = db.get(HITLCaseDB, case_id)
+    assert case.status == HITLStatusEnum.PENDING
+    assert case.claimed_by is None
+    assert hitl.get_queue_version(db=db) > version
+    with pytest.raises(ValueError):
+        hitl.heartbeat(case_id, "ana", db=db)
+
+
+def test_heartbeat_and_release_by_the_holder(db, hitl):
+    case_id = create_case(db, hitl)
+    hitl.claim_next("ana", db=db)
+
+    assert hitl.heartbeat(case_id, "ana", lease_seconds=600, db=db) > datetime.utcnow() + timedelta(seconds=500)
+
+    hitl.release(case_id, "ana", db=db)
+    db.expire_all()
+    assert db.get(HITLCaseDB, case_id).status == HITLStatusEnum.PENDING
+    assert counters_match(db)
+
+
+def test_challenge_review_keeps_in_review_and_cannot_be_reviewed_again(db, hitl):
+    case_id = create_case(db, hitl)
+    hitl.claim_next("ana", db=db)
+
+    assert hitl.review_case(case_id, "ana", DecisionType.CHALLENGE, db=db).status == HITLStatus.IN_REVIEW
+    with pytest.raises(ValueError, match="ya fue revisado"):
+        hitl.review_case(case_id, "ana", DecisionType.APPROVE, db=db)
@@ -0,0 +1,82 @@
+"""
+Tests del cache de maestros: los temporales se publican solo al confirmar la transacción
+"""
+import uuid
+from datetime import datetime
+
+from app.database.connection import SessionLocal
+from app.models.schemas import DecisionType, Transaction
+from app.services.master_data_cache import get_master_data_cache
+from app.services.persistence_service import PersistenceService
+
+
+def analysis(customer_id, merchant_id):
+    return {
+        "transaction": Transaction(
+            transaction_id=f"T-{uuid.uuid4().hex[:8]}", customer_id=customer_id, amount=100.0, country="PE",
+            channel="web", device_id="D-01", timestamp=datetime.now(), merchant_id=merchant_id
+        ),
+        "decision": DecisionType.APPROVE, "confidence": 0.9, "risk_score": 0.1, "signals": [],
+        "citations_internal": [], "citations_external": [], "explanation_customer": "c",
+        "explanation_audit": "a", "agent_route": "r", "processing_time_ms": 1.0,
+    }
+
+
+def is_cached(table, key):
+    other = SessionLocal()
+    try:
+        return get_master_data_cache().contains(other, table, key)
+    finally:
+        other.close()
+
+
+def test_new_masters_are_published_after_commit(db):
+    customer_id, merchant_id = f"CU-{uuid.uuid4().hex[:6]}", f"M-{uuid.uuid4().hex[:6]}"
+
+    PersistenceService.save_transaction_analyses(db, [analysis(customer_id, merchant_id)], commit=False)
+    assert not is_cached("customers", customer_id)
+    assert not is_cached("merchants", merchant_id)
+
+    db.commit()
+    assert is_cached("customers", customer_id)
+    assert is_cached("merchants", merchant_id)
+
+
+def test_new_masters_are_discarded_on_rollback(db):
+    customer_id, merchant_id = f"CU-{uuid.uuid4().hex[:6]}", f"M-{uuid.uuid4().hex[:6]}"
+
+    PersistenceService.save_transaction_analyses(db, [analysis(customer_id, merchant_id)], commit=False)
+    db.rollback()
+
+    assert not is_cached("customers", customer_id)
+    assert not is_cached("merchants", merchant_id)
+
+    # Un nuevo intento vuelve a crearlos (el cache no los daba por existentes)
+    PersistenceService.save_transaction_analyses(db, [analysis(customer_id, merchant_id)])
+    assert is_cached("customers", customer_id)
+
+
+def test_reload_inside_a_transaction_skips_uncommitted_masters(db):
+    customer_id = f"CU-{uuid.uuid4().hex[:6]}"
+    cache = get_master_data_cache()
+
+    PersistenceService.save_transaction_analyses(db, [analysis(customer_id, "M-001")], commit=False)
+    cache.invalidate("customers")
+    cache.ensure_loaded(db, "customers")
+
+    assert not is_cached("customers", customer_id)
+    db.rollback()
+
+
+def test_replica_reads_do_not_populate_the_cache(db):
+    from app.database.connection import REPLICA_SESSION
+    from app.services.master_data_cache import MasterDataCache
+
+    cache = MasterDataCache()
+    replica = SessionLocal(info={REPLICA_SESSION: True})
+    try:
+        assert cache.all(replica, "customers")
+        assert cache.version("customers") == 0
+        assert "customers" not in cache._records
+    finally:
+        replica.close()
@@ -0,0 +1,62 @@
+"""
+Tests del backfill de políticas (commit por bloque y avance de la ejecución)
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database.models import BackfillStatusEnum, PolicyBackfillMatchDB, TransactionDB
+from app.services import policy_backfill_service
+from app.services.policy_backfill_service import PolicyBackfillService
+
+DATE_FROM = datetime(2030, 1, 1)
+
+
+@pytest.fixture
+def transactions(db):
+    """25 transacciones aisladas por fecha; la mitad fuera del horario habitual con monto alto"""
+    if not db.get(TransactionDB, "BF-000"):
+        db.add_all(
+            TransactionDB(
+                transaction_id=f"BF-{i:03d}", customer_id="CU-001", amount=9000.0 if i % 2 else 10.0,
+                currency="PEN", country="PE", channel="web", device_id="D-01", merchant_id="M-001",
+                transaction_timestamp=DATE_FROM + timedelta(days=i, hours=3)
+            )
+            for i in range(25)
+        )
+        db.commit()
+
+
+def create_run(db):
+    return PolicyBackfillService.create_run(
+        db, "amount_ratio > 3 AND NOT in_usual_hours", date_from=DATE_FROM, date_to=DATE_FROM + timedelta(days=60)
+    )
+
+
+def test_backfill_scans_every_chunk(db, transactions):
+    run = PolicyBackfillService.execute_run(db, create_run(db).id, chunk_size=10)
+
+    assert run.status == BackfillStatusEnum.COMPLETED
+    assert (run.scanned_count, run.matched_count) == (25, 12)
+
+
+def test_failed_backfill_keeps_committed_chunks(db, transactions, monkeypatch):
+    build_feature_columns = policy_backfill_service.build_feature_columns
+    calls = []
+
+    def failing_on_third_chunk(rows):
+        calls.append(len(rows))
+        if len(calls) == 3:
+            raise RuntimeError("fallo simulado")
+        return build_feature_columns(rows)
+
+    monkeypatch.setattr(policy_backfill_service, "build_feature_columns", failing_on_third_chunk)
+    run_id = create_run(db).id
+
+    with pytest.raises(RuntimeError):
+        PolicyBackfillService.execute_run(db, run_id, chunk_size=10)
+
+    run = PolicyBackfillService.get_run(db, run_id)
+    assert run["status"] == "FAILED"
+    assert (run["scanned_count"], run["matched_count"]) == (20, 10)
+    assert db.query(PolicyBackfillMatchDB).filter(PolicyBackfillMatchDB.run_id == run_id).count() == 10
@@ -0,0 +1,167 @@
+"""
+Tests del motor de reglas de políticas (tokenizer, parser, tipos y evaluación)
+"""
+import pytest
+
+from app.services.policy_rule_engine import (
+    PolicyRuleError, _Parser, _tokenize, compile_condition, load_policy_rule, validate_condition
+)
+
+
+FEATURES = {
+    "amount": 1800.0,
+    "amount_ratio": 4.0,
+    "usual_amount_avg": 450.0,
+    "hour": 3,
+    "in_usual_hours": False,
+    "is_international": True,
+    "is_new_device": False,
+    "channel": "web",
+    "country": "PE",
+    "merchant_id": "M-001",
+    "currency": "PEN",
+}
+
+
+def evaluate(condition, **overrides):
+    return compile_condition(condition).evaluate({**FEATURES, **overrides})
+
+
+# ============================================
+# TOKENIZER
+# ============================================
+
+def test_tokenize_literals_operators_and_keywords():
+    assert _tokenize("amount_ratio >= -1.5 and channel IN ('web', \"atm\")") == [
+        ("word", "amount_ratio"), ("op", ">="), ("number", -1.5), ("keyword", "AND"),
+        ("word", "channel"), ("keyword", "IN"), ("punct", "("), ("string", "web"),
+        ("punct", ","), ("string", "atm"), ("punct", ")"),
+    ]
+
+
+def test_tokenize_rejects_unknown_characters():
+    with pytest.raises(PolicyRuleError, match="Carácter inesperado"):
+        _tokenize("amount > 3 && hour < 5")
+
+
+# ============================================
+# PARSER
+# ============================================
+
+def test_and_binds_tighter_than_or():
+    assert _Parser("is_new_device OR is_international AND in_usual_hours").parse() == (
+        "or",
+        ("var", "is_new_device"),
+        ("and", ("var", "is_international"), ("var", "in_usual_hours")),
+    )
+
+
+def test_parentheses_override_precedence():
+    assert evaluate("(is_new_device OR is_international) AND in_usual_hours") is False
+    assert evaluate("is_new_device OR is_international AND in_usual_hours") is False
+    assert evaluate("is_international OR is_new_device AND in_usual_hours") is True
+
+
+def test_not_applies_to_the_next_term():
+    assert _Parser("NOT is_new_device AND is_international").parse() == (
+        "and", ("not", ("var", "is_new_device")), ("var", "is_international")
+    )
+    assert evaluate("NOT NOT is_international") is True
+
+
+def test_in_with_strings_and_numbers():
+    assert evaluate("channel IN ('web', 'mobile')") is True
+    assert evaluate("country IN ('CL')") is False
+    assert evaluate("NOT hour IN (1, 2, 3)") is False
+
+
+def test_negative_numbers():
+    assert evaluate("amount_ratio > -1") is True
+    assert evaluate("hour >= -0.5 AND hour < 4", hour=0) is True
+
+
+def test_bare_boolean_constant():
+    assert evaluate("TRUE") is True
+    assert evaluate("is_new_device == FALSE") is True
+
+
+@pytest.mark.parametrize("condition, message", [
+    ("amount >", "Fin inesperado"),
+    ("(amount > 3", "Se esperaba"),
+    ("amount > 3 hour", "Token inesperado"),
+    ("unknown_var > 3", "Variable desconocida"),
+    ("channel IN (country)", "literales"),
+    ("amount > AND", "Operando inválido"),
+])
+def test_invalid_syntax(condition, message):
+    with pytest.raises(PolicyRuleError, match=message):
+        compile_condition(condition)
+
+
+# ============================================
+# TIPOS
+# ============================================
+
+@pytest.mark.parametrize("condition", [
+    "channel > 3",
+    "channel >= 'web'",
+    "is_new_device < TRUE",
+    "amount == 'web'",
+    "country != 3",
+    "is_international == 'PE'",
+    "hour == channel",
+    "channel IN ('web', 3)",
+    "hour IN ('3')",
+    "amount",
+    "channel",
+    "3",
+    "'web'",
+])
+def test_type_errors_are_rejected_at_compile_time(condition):
+    with pytest.raises(PolicyRuleError):
+        compile_condition(condition)
+    assert validate_condition(condition) is not None
+
+
+def test_well_typed_conditions_validate():
+    for condition in ("amount_ratio > 3 AND NOT in_usual_hours", "is_international AND is_new_device",
+                      "amount > usual_amount_avg", "channel == 'web'", "hour IN (1, 2)", ""):
+        assert validate_condition(condition) is None
+
+
+def test_load_policy_rule_skips_invalid_conditions():
+    assert load_policy_rule({"policy_id": "FP-X", "condition": "channel > 3"}) is None
+    assert load_policy_rule({"policy_id": "FP-X", "condition": ""}) is None
+    assert load_policy_rule({"policy_id": "FP-X", "condition": "hour < 6"}).evaluate(FEATURES) is True
+
+
+def test_evaluate_batch_matches_scalar_evaluation():
+    np = pytest.importorskip("numpy")
+
+    rows = [
+        {**FEATURES, "amount_ratio": 4.0, "in_usual_hours": False, "channel": "web"},
+        {**FEATURES, "amount_ratio": 1.0, "in_usual_hours": False, "channel": "atm"},
+        {**FEATURES, "amount_ratio": 5.0, "in_usual_hours": True, "channel": "web"},
+    ]
+    columns = {name: np.array([row[name] for row in rows]) for name in FEATURES}
+    rule = compile_condition("amount_ratio > 3 AND NOT in_usual_hours OR channel IN ('atm')")
+
+    assert rule.evaluate_batch(columns).tolist() == [rule.evaluate(row) for row in rows]
+
+
+def test_runtime_errors_fall_back_to_llm(monkeypatch):
+    policy_rag_agent = pytest.importorskip("app.agents.policy_rag_agent")
+
+    class BrokenRule:
+        condition = "amount_ratio > 3"
+
+        def evaluate(self, features):
+            raise TypeError("'>' not supported")
+
+    monkeypatch.setattr(policy_rag_agent, "extract_features", lambda transaction, behavior: dict(FEATURES))
+    monkeypatch.setattr(policy_rag_agent, "load_policy_rule", lambda policy: BrokenRule())
+    agent = object.__new__(policy_rag_agent.PolicyRAGAgent)
+    policy = {"policy_id": "FP-01", "condition": BrokenRule.condition}
+
+    assert agent._validate_policy_application(policy, None, None) is None
+    assert agent._evaluate_rules([policy], None, None) is None
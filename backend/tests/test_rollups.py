@@ -0,0 +1,45 @@
+"""
+Tests de los rollups de decisiones (poda de intervalos por minuto)
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database.models import DecisionRollupDB
+from app.services.rollup_service import MINUTE_RETENTION, RollupService, bucket_start
+
+
+def add_rollup(db, granularity, when):
+    db.add(DecisionRollupDB(
+        granularity=granularity, bucket_start=bucket_start(when, granularity), decision="APPROVE",
+        risk_bucket=1, count=1, processing_time_sum=1.0, processing_time_max=1.0
+    ))
+
+
+def test_prune_removes_only_old_minute_buckets(db):
+    now = datetime(2031, 1, 10, 12, 0)
+    old, recent = now - MINUTE_RETENTION - timedelta(minutes=5), now - timedelta(minutes=5)
+    for granularity in ("minute", "hour", "day"):
+        add_rollup(db, granularity, old)
+    add_rollup(db, "minute", recent)
+    db.commit()
+
+    assert RollupService.prune_minute_buckets(db, now=now) >= 1
+
+    remaining = {
+        (row.granularity, row.bucket_start) for row in
+        db.query(DecisionRollupDB).filter(DecisionRollupDB.bucket_start >= datetime(2030, 12, 1))
+    }
+    assert ("minute", bucket_start(old, "minute")) not in remaining
+    assert ("minute", bucket_start(recent, "minute")) in remaining
+    assert ("hour", bucket_start(old, "hour")) in remaining
+    assert ("day", bucket_start(old, "day")) in remaining
+
+
+def test_minute_series_outside_retention_is_rejected(db):
+    date_to = datetime.utcnow() - MINUTE_RETENTION
+    with pytest.raises(ValueError, match="por minuto"):
+        RollupService.get_timeseries(db, granularity="minute", window="1h", date_to=date_to)
+
+    series = RollupService.get_timeseries(db, granularity="minute", window="1h")
+    assert len(series["series"]) in (60, 61)  # el primer intervalo puede ser parcial
@@ -0,0 +1,23 @@
+"""
+Tests de los contadores de estadísticas (inicialización y reconciliación)
+"""
+from app.database.connection import init_db
+from app.database.models import StatisticsCounterDB
+from app.services import statistics_service as statistics
+from app.services.statistics_service import StatisticsService
+
+
+def test_startup_does_not_overwrite_existing_counters(db):
+    StatisticsService.reconcile(db)
+    StatisticsService.increment(db, {statistics.TRANSACTIONS: 5})
+    db.commit()
+
+    init_db()
+
+    db.expire_all()
+    stored = db.get(StatisticsCounterDB, statistics.TRANSACTIONS).value
+    assert stored == StatisticsService.compute_counters(db)[statistics.TRANSACTIONS] + 5
+
+    drift = StatisticsService.reconcile(db)
+    assert drift[statistics.TRANSACTIONS]["stored"] == stored
+    assert StatisticsService.reconcile(db) == {}
@@ -0,0 +1,38 @@
+"""
+Tests del cache de detalles de transacción (invalidación por transaction_id)
+"""
+import uuid
+from datetime import datetime
+
+from app.models.schemas import DecisionType, Transaction
+from app.services.persistence_service import PersistenceService, get_transaction_detail_cache
+
+
+def save_analysis(db):
+    transaction = Transaction(
+        transaction_id=f"T-{uuid.uuid4().hex[:8]}", customer_id="CU-001", amount=100.0, country="PE",
+        channel="web", device_id="D-01", timestamp=datetime.now(), merchant_id="M-001"
+    )
+    decision = PersistenceService.save_transaction_analysis(
+        db, transaction=transaction, decision=DecisionType.APPROVE, confidence=0.9, risk_score=0.1,
+        signals=[], citations_internal=[], citations_external=[], explanation_customer="c",
+        explanation_audit="a", agent_route="r", processing_time_ms=1.0
+    )
+    return transaction.transaction_id, decision.id
+
+
+def test_saving_logs_invalidates_only_that_transaction(db):
+    updated, decision_id = save_analysis(db)
+    untouched, _ = save_analysis(db)
+    for transaction_id in (updated, untouched):
+        PersistenceService.get_transaction_details(db, transaction_id, include_logs=True)
+
+    PersistenceService.save_analysis_logs(db, decision_id, [
+        {"event_type": "agent_start", "message": "inicio", "timestamp": datetime.now().isoformat()}
+    ])
+    db.commit()
+
+    cache = get_transaction_detail_cache()
+    assert cache.get((updated, True)) is None
+    assert cache.get((untouched, True)) is not None
+    assert len(PersistenceService.get_transaction_details(db, updated, include_logs=True)["analysis_logs"]) == 1
@@ -3,4 +3,5 @@ export enum HITLStatus {
   APPROVED = 'APPROVED',
   REJECTED = 'REJECTED',
   IN_REVIEW = 'IN_REVIEW',
+  CLAIMED = 'CLAIMED',
 }
@@ -81,6 +81,7 @@ export enum HITLStatus {
   APPROVED = 'APPROVED',
   REJECTED = 'REJECTED',
   IN_REVIEW = 'IN_REVIEW',
+  CLAIMED = 'CLAIMED',
 }
 
 export interface TransactionHistory {
@@ -41,6 +41,7 @@ export class FraudHelpers {
       case HITLStatus.REJECTED:
         return 'danger';
       case HITLStatus.IN_REVIEW:
+      case HITLStatus.CLAIMED:
         return 'info';
       default:
         return 'secondary';